@@ -1,17 +1,34 @@
 import os
+import atexit
+import select
+import socket
 import uuid
-from flask import Flask, request, jsonify
+import functools
+from flask import Flask, request, jsonify, Response, stream_with_context, g, send_file
+from werkzeug.exceptions import RequestEntityTooLarge
 from werkzeug.utils import secure_filename
 from models.document import DocumentModel
 from models.embedding import EmbeddingModel
+from db.filters import compile_filter
 from services.qa_service import QuestionAnsweringService
+from services.reaper import ChunkReaper
+from services.shard_search import ShardSearchClient, start_search_process
+from services.upload_service import UploadService
+from services.admission import AdmissionController, question_cost, search_cost, upload_cost
+from services.profiler import RequestProfiler
+from services.inference import InferenceClient, start_pool_process
+from services.warmup import Warmup
+from services.ingest_scheduler import IngestionScheduler
+from services.responses import FastJSONProvider, QUESTION_FIELDS, compress_response, parse_fields
 from flask_limiter.util import get_remote_address
 from flask_limiter import Limiter
-from custom_logger import logger
+from custom_logger import logger, set_request_id
 import init
 
 app = Flask(__name__)
 app.config.from_object('config.Config')
+# orjson-backed jsonify: numpy scalars and datetimes (as ISO 8601) serialized natively
+app.json = FastJSONProvider(app)
 
 limiter = Limiter(
     key_func=get_remote_address,  # No app argument here
@@ -20,23 +37,224 @@ limiter = Limiter(
 
 limiter.init_app(app=app)
 
+admission = AdmissionController(
+    db_path=app.config['ADMISSION_DB'],
+    policies=app.config['ADMISSION_POLICIES']
+)
+
+def admit(name, cost_fn=None):
+    """Apply admission control to a view when enabled"""
+    if not app.config['ADMISSION_ENABLED']:
+        return lambda view: view
+    return admission.admit(name, cost_fn)
+
+@app.before_request
+def bind_request_id():
+    """Tag log records of this request with the caller's or a fresh request id"""
+    g.request_id = request.headers.get('X-Request-ID') or uuid.uuid4().hex
+    set_request_id(g.request_id)
+
+@app.after_request
+def add_request_id_header(response):
+    if 'request_id' in g:
+        response.headers['X-Request-ID'] = g.request_id
+    return response
+
+@app.after_request
+def compress(response):
+    """Compress JSON responses with the encoding the client prefers"""
+    if not app.config['COMPRESS_RESPONSES']:
+        return response
+    return compress_response(
+        response,
+        request.accept_encodings,
+        min_size=app.config['COMPRESS_MIN_SIZE'],
+        gzip_level=app.config['COMPRESS_GZIP_LEVEL'],
+        brotli_quality=app.config['COMPRESS_BROTLI_QUALITY']
+    )
+
+@app.errorhandler(RequestEntityTooLarge)
+def request_too_large(e):
+    """Report oversized uploads and chunks as JSON like the other API errors"""
+    return jsonify({'error': e.description}), 413
+
+profiler = RequestProfiler(
+    profile_dir=app.config['PROFILE_DIR'],
+    token=app.config['ADMIN_TOKEN'],
+    sample_rate=app.config['PROFILE_SAMPLE_RATE'],
+    trace_memory=app.config['PROFILE_MEMORY'],
+    max_profiles=app.config['PROFILE_MAX_STORED']
+)
+
+@app.before_request
+def start_profile():
+    """Profile this request when asked to by an admin or picked by sampling"""
+    if profiler.should_profile(request):
+        g.profile = profiler.start()
+
+@app.after_request
+def finish_profile(response):
+    """Store the profile once the response, including any streamed body, is done"""
+    session = g.pop('profile', None)
+    if session:
+        info = {'method': request.method, 'path': request.path,
+                'status': response.status_code, 'request_id': g.get('request_id')}
+        response.headers['X-Profile-ID'] = session['id']
+        response.call_on_close(lambda: profiler.finish(session, info))
+    return response
+
+@app.teardown_request
+def abandon_profile(exc):
+    """Release the profiler when the request failed before a response was made"""
+    session = g.pop('profile', None)
+    if session:
+        profiler.finish(session, {'method': request.method, 'path': request.path, 'error': str(exc)})
+
+def require_admin(view):
+    """Only serve a view to callers presenting the admin token"""
+    @functools.wraps(view)
+    def wrapper(*args, **kwargs):
+        if not profiler.is_authorized(request.headers.get('X-Admin-Token')):
+            return jsonify({'error': 'Not found'}), 404
+        return view(*args, **kwargs)
+    return wrapper
+
 # Create upload folder if it doesn't exist
 os.makedirs(app.config['UPLOAD_FOLDER'], exist_ok=True)
 
 # Initialize services
 document_model = DocumentModel()
 embedding_model = EmbeddingModel()
+
+# The shards hold the corpus once per host and are started by gunicorn.conf.py,
+# app.run below or `python -m services.shard_search`; web workers only query them
+search_engine = None
+if app.config['SEARCH_BACKEND'] == 'sharded':
+    search_engine = ShardSearchClient(
+        embedding_model,
+        socket_dir=app.config['SEARCH_SOCKET_DIR'],
+        num_shards=app.config['SEARCH_SHARDS'],
+        authkey=app.config['SEARCH_AUTHKEY'].encode(),
+        timeout=app.config['SEARCH_SHARD_TIMEOUT']
+    )
+
+# In pool mode the models live in dedicated inference processes, started by
+# gunicorn.conf.py, app.run below or `python -m services.inference`
+inference_client = None
+if app.config['INFERENCE_MODE'] == 'pool':
+    inference_client = InferenceClient(
+        socket_dir=app.config['INFERENCE_SOCKET_DIR'],
+        num_workers=app.config['INFERENCE_WORKERS'],
+        authkey=app.config['INFERENCE_AUTHKEY'].encode(),
+        timeout=app.config['INFERENCE_TIMEOUT']
+    )
+
 qa_service = QuestionAnsweringService(
     document_model=document_model,
     embedding_model=embedding_model,
     qa_model_name=app.config['QA_MODEL'],
-    embedding_model_name=app.config['EMBEDDING_MODEL']
+    embedding_model_name=app.config['EMBEDDING_MODEL'],
+    search_engine=search_engine,
+    inference_client=inference_client
+)
+
+upload_service = UploadService(
+    upload_folder=app.config['UPLOAD_FOLDER'],
+    chunk_size=app.config['UPLOAD_CHUNK_SIZE'],
+    max_size=app.config['STREAM_MAX_CONTENT_LENGTH']
 )
 
+# Uploads are processed once their estimated memory fits the host's ingestion budget
+ingestion_scheduler = IngestionScheduler(
+    db_path=app.config['INGEST_DB'],
+    budget=app.config['INGEST_MEMORY_BUDGET'],
+    chunk_stride=qa_service.chunk_size - qa_service.overlap,
+    overhead=app.config['INGEST_JOB_OVERHEAD'],
+    queue_timeout=app.config['INGEST_QUEUE_TIMEOUT'],
+    calibration_rate=app.config['INGEST_CALIBRATION_RATE']
+)
+
+# Remove chunks of deleted documents and idle upload sessions in the background
+reaper = ChunkReaper(
+    document_model=document_model,
+    embedding_model=embedding_model,
+    batch_size=app.config['REAPER_BATCH_SIZE'],
+    interval=app.config['REAPER_INTERVAL'],
+    vacuum_threshold=app.config['REAPER_VACUUM_THRESHOLD'],
+    upload_service=upload_service,
+    upload_session_ttl=app.config['UPLOAD_SESSION_TTL']
+)
+if app.config['REAPER_ENABLED']:
+    reaper.start()
+
+# Warm the models and vector index in the background; /readyz reports ready once done
+warmup = Warmup(
+    qa_service=qa_service,
+    embedding_model=embedding_model,
+    batch_sizes=app.config['WARMUP_BATCH_SIZES'],
+    prewarm=app.config['WARMUP_PREWARM'],
+    retry_interval=app.config['WARMUP_RETRY_INTERVAL']
+)
+if app.config['WARMUP_ENABLED']:
+    warmup.start()
+
+def _filter_error(filters):
+    """Validate an optional filter expression, returning the error response if it is malformed"""
+    if filters is None:
+        return None
+    try:
+        compile_filter(filters)
+    except ValueError as e:
+        return jsonify({'error': f'Invalid filter: {e}'}), 400
+    return None
+
+def _client_disconnected(environ):
+    """Whether the client of a streamed response has hung up, when the server exposes its socket"""
+    sock = environ.get('gunicorn.socket') or environ.get('werkzeug.socket')
+    if sock is None:
+        return False
+    try:
+        readable, _, _ = select.select([sock], [], [], 0)
+        # A closed connection reads as end of file; pipelined requests read as data
+        return bool(readable) and sock.recv(1, socket.MSG_PEEK) == b''
+    except ValueError:
+        return False  # e.g. TLS sockets, which cannot be peeked
+    except OSError:
+        return True
+
+def _ingest_upload(saved, filename, metadata):
+    """Hand a saved upload to the processing pipeline and build the response"""
+    if not saved:
+        logger.error("Failed to save upload.")
+        return jsonify({'error': 'Failed to save upload'}), 500
+
+    file_path, sha256, size = saved
+    logger.info(f"upload saved: {file_path} ({size} bytes, sha256 {sha256})")
+    job = ingestion_scheduler.admit(file_path, pages=qa_service.extractor.count_pages(file_path))
+    if job is None:
+        response = jsonify({'error': 'Ingestion memory budget exhausted', 'retry_after': 30})
+        response.headers['Retry-After'] = '30'
+        return response, 503
+    try:
+        doc_id = qa_service.process_document(file_path, metadata, title=secure_filename(filename), job=job)
+    finally:
+        job.release()
+
+    if doc_id:
+        logger.info("Document saved.")
+        return jsonify({
+            'message': 'Document uploaded and processed successfully',
+            'document_id': doc_id,
+            'sha256': sha256
+        }), 201
+    logger.error("Failed to save document.")
+    return jsonify({'error': 'Failed to process document'}), 500
+
 @app.route('/api/documents', methods=['POST'])
 @limiter.limit("10 per minute")
+@admit('ingest', upload_cost)
 def upload_document():
-    """Upload and process a PDF document"""
+    """Upload and process a PDF, text, markdown or HTML document"""
     if 'file' not in request.files:
         return jsonify({'error': 'No file part'}), 400
     
@@ -44,27 +262,102 @@ def upload_document():
     if file.filename == '':
         return jsonify({'error': 'No selected file'}), 400
     
-    if file and file.filename.lower().endswith('.pdf'):
-        # Save the uploaded file
-        filename = secure_filename(file.filename)
-        file_path = os.path.join(app.config['UPLOAD_FOLDER'], filename)
-        file.save(file_path)
-        
-        # Process the PDF
+    if file and qa_service.extractor.supports(file.filename):
+        # Stream the uploaded file to a unique path so same-named uploads don't clobber each other
+        saved = upload_service.save_stream(file.stream, file.filename)
         metadata = request.form.get('metadata', '{}')
-        doc_id = qa_service.process_pdf(file_path, metadata)
-        
-        if doc_id:
-            logger.info("Document saved.")
-            return jsonify({
-                'message': 'Document uploaded and processed successfully',
-                'document_id': doc_id
-            }), 201
-        else:
-            logger.error("Failed to save document.")
-            return jsonify({'error': 'Failed to process document'}), 500
+        return _ingest_upload(saved, file.filename, metadata)
     
-    return jsonify({'error': 'File must be a PDF'}), 400
+    return jsonify({'error': 'File must be a PDF, text, markdown or HTML document'}), 400
+
+@app.route('/api/documents/stream', methods=['POST'])
+@limiter.limit("10 per minute")
+@admit('ingest', upload_cost)
+def upload_document_stream():
+    """Upload a document sent as the raw request body and process it"""
+    # Raw bodies are written to disk in chunks, so they may exceed the multipart limit
+    request.max_content_length = app.config['STREAM_MAX_CONTENT_LENGTH']
+
+    filename = request.headers.get('X-Filename') or request.args.get('filename', '')
+    if not qa_service.extractor.supports(filename):
+        return jsonify({'error': 'File must be a PDF, text, markdown or HTML document'}), 400
+
+    saved = upload_service.save_stream(request.stream, filename)
+    metadata = request.headers.get('X-Metadata') or request.args.get('metadata', '{}')
+    return _ingest_upload(saved, filename, metadata)
+
+@app.route('/api/uploads', methods=['POST'])
+@limiter.limit("10 per minute")
+def create_upload():
+    """Start a resumable chunked upload"""
+    data = request.json
+    if not data or not data.get('filename'):
+        return jsonify({'error': 'Filename is required'}), 400
+    if not qa_service.extractor.supports(data['filename']):
+        return jsonify({'error': 'File must be a PDF, text, markdown or HTML document'}), 400
+
+    # The declared size bounds what PATCH may append
+    size = data.get('size')
+    if not isinstance(size, int) or isinstance(size, bool) or size < 0:
+        return jsonify({'error': 'size must be a non-negative integer'}), 400
+    if size > app.config['STREAM_MAX_CONTENT_LENGTH']:
+        return jsonify({'error': 'File too large'}), 413
+
+    upload_id = upload_service.create_session(data['filename'], size)
+    return jsonify({'upload_id': upload_id, 'offset': 0}), 201
+
+@app.route('/api/uploads/<upload_id>', methods=['GET'])
+def get_upload(upload_id):
+    """Get the offset a resumable upload should continue from"""
+    session = upload_service.get_session(upload_id)
+    if not session:
+        return jsonify({'error': 'Upload not found'}), 404
+    return jsonify({'upload_id': upload_id, 'offset': session['offset'], 'size': session['total_size']}), 200
+
+@app.route('/api/uploads/<upload_id>', methods=['PATCH'])
+@limiter.limit("30 per minute")  # chunks of one upload arrive back to back
+def append_upload(upload_id):
+    """Append a chunk (raw body) at the offset given by the Upload-Offset header"""
+    request.max_content_length = app.config['STREAM_MAX_CONTENT_LENGTH']
+    try:
+        offset = int(request.headers.get('Upload-Offset', ''))
+    except ValueError:
+        return jsonify({'error': 'Upload-Offset header is required'}), 400
+
+    session = upload_service.get_session(upload_id)
+    if not session:
+        return jsonify({'error': 'Upload not found'}), 404
+
+    new_offset = upload_service.append_chunk(upload_id, offset, request.stream)
+    if new_offset is None:
+        return jsonify({'error': 'Offset mismatch', 'offset': session['offset']}), 409
+    return jsonify({'upload_id': upload_id, 'offset': new_offset}), 200
+
+def _session_cost(req):
+    session = upload_service.get_session(req.view_args['upload_id'])
+    return 1 + (session['offset'] if session else 0) / (256 * 1024)
+
+@app.route('/api/uploads/<upload_id>/complete', methods=['POST'])
+@limiter.limit("10 per minute")
+@admit('ingest', _session_cost)
+def complete_upload(upload_id):
+    """Finish a resumable upload and process the document"""
+    data = request.get_json(silent=True) or {}
+    session = upload_service.get_session(upload_id)
+    if not session:
+        return jsonify({'error': 'Upload not found'}), 404
+
+    saved = upload_service.complete_session(upload_id, data.get('sha256'))
+    if not saved:
+        return jsonify({'error': 'Upload incomplete or checksum mismatch'}), 400
+    return _ingest_upload(saved, session['filename'], data.get('metadata', '{}'))
+
+@app.route('/api/uploads/<upload_id>', methods=['DELETE'])
+def abort_upload(upload_id):
+    """Discard a resumable upload"""
+    if upload_service.abort_session(upload_id):
+        return jsonify({'message': 'Upload aborted'}), 200
+    return jsonify({'error': 'Upload not found'}), 404
 
 @app.route('/api/documents', methods=['GET'])
 def list_documents():
@@ -93,6 +386,7 @@ def delete_document(doc_id):
     return jsonify({'error': 'Failed to delete document or document not found'}), 404
 
 @app.route('/api/question', methods=['POST'])
+@admit('question', question_cost)
 def answer_question():
     """Answer a question based on document knowledge"""
     data = request.json
@@ -102,9 +396,148 @@ def answer_question():
     question = data['question']
     doc_id = data.get('document_id')  # Optional: limit to specific document
     top_k = data.get('top_k', 5)
+    filters = data.get('filter')  # Optional: limit to documents matching a filter expression
+    error = _filter_error(filters)
+    if error:
+        return error
+    try:
+        # Optional: e.g. ?fields=answer,sources to leave out the context
+        fields = parse_fields(request.args.get('fields', data.get('fields')), QUESTION_FIELDS)
+    except ValueError as e:
+        return jsonify({'error': f'Invalid fields: {e}'}), 400
+    offsets = bool(data.get('offsets'))  # Optional: chunk ids and answer offsets instead of the context
     
-    answer = qa_service.answer_question(question, doc_id, top_k)
+    answer = qa_service.answer_question(question, doc_id, top_k, filters, offsets=offsets, fields=fields)
     return jsonify(answer), 200
 
+@app.route('/api/question/stream', methods=['POST'])
+@admit('question', question_cost)
+def answer_question_stream():
+    """Answer a question, streaming sources before the answer
+
+    Responds with server-sent events by default, or newline-delimited JSON
+    when the client accepts application/x-ndjson.
+    """
+    data = request.json
+    if not data or 'question' not in data:
+        return jsonify({'error': 'Question is required'}), 400
+
+    question = data['question']
+    doc_id = data.get('document_id')
+    top_k = data.get('top_k', 5)
+    filters = data.get('filter')
+    error = _filter_error(filters)
+    if error:
+        return error
+    ndjson = request.accept_mimetypes.best_match(['text/event-stream', 'application/x-ndjson']) == 'application/x-ndjson'
+
+    environ = request.environ
+
+    def generate():
+        # The remaining stages are skipped once the client disconnects
+        events = qa_service.answer_question_stream(question, doc_id, top_k, filters,
+                                                   cancelled=lambda: _client_disconnected(environ))
+        try:
+            for event, payload in events:
+                if ndjson:
+                    yield app.json.dumps({'event': event, **payload}) + "\n"
+                else:
+                    yield f"event: {event}\ndata: {app.json.dumps(payload)}\n\n"
+        except GeneratorExit:
+            logger.info("question stream closed before completion")
+            raise
+        finally:
+            events.close()
+
+    mimetype = 'application/x-ndjson' if ndjson else 'text/event-stream'
+    return Response(stream_with_context(generate()), mimetype=mimetype,
+                    headers={'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'})
+
+@app.route('/api/search', methods=['POST'])
+@admit('search', search_cost)
+def search():
+    """Return relevant passages for one or more queries without generating an answer"""
+    data = request.json
+    if not data or not (data.get('query') or data.get('queries')):
+        return jsonify({'error': 'Query is required'}), 400
+
+    queries = data.get('queries') or [data['query']]
+    if not isinstance(queries, list) or not all(isinstance(q, str) and q for q in queries):
+        return jsonify({'error': 'Queries must be a list of non-empty strings'}), 400
+    if len(queries) > app.config['SEARCH_MAX_QUERIES']:
+        return jsonify({'error': f"At most {app.config['SEARCH_MAX_QUERIES']} queries per request"}), 400
+
+    try:
+        top_k = int(data.get('top_k', 5))
+        window = min(int(data.get('window', 0)), app.config['SEARCH_MAX_WINDOW'])
+        min_similarity = data.get('min_similarity')
+        min_similarity = float(min_similarity) if min_similarity is not None else None
+    except (TypeError, ValueError):
+        return jsonify({'error': 'top_k, window and min_similarity must be numbers'}), 400
+    if not 1 <= top_k <= app.config['SEARCH_MAX_TOP_K']:
+        return jsonify({'error': f"top_k must be between 1 and {app.config['SEARCH_MAX_TOP_K']}"}), 400
+    if window < 0:
+        return jsonify({'error': 'window must not be negative'}), 400
+    error = _filter_error(data.get('filter'))
+    if error:
+        return error
+
+    results = qa_service.search(
+        queries,
+        top_k=top_k,
+        doc_id=data.get('document_id'),
+        metadata=data.get('metadata'),
+        min_similarity=min_similarity,
+        window=window,
+        filters=data.get('filter')
+    )
+    return jsonify({'results': results}), 200
+
+@app.route('/healthz', methods=['GET'])
+@limiter.exempt
+def healthz():
+    """Liveness: the process is up and serving requests"""
+    return jsonify({'status': 'ok'}), 200
+
+@app.route('/readyz', methods=['GET'])
+@limiter.exempt
+def readyz():
+    """Readiness: 503 until the startup warmup has completed, with its step timings"""
+    status = warmup.status()
+    if not app.config['WARMUP_ENABLED']:
+        return jsonify({'ready': True, **status, 'state': 'disabled'}), 200
+    return jsonify({'ready': warmup.ready, **status}), 200 if warmup.ready else 503
+
+@app.route('/api/admin/profiles', methods=['GET'])
+@require_admin
+def list_profiles():
+    """List stored request profiles"""
+    return jsonify({'profiles': profiler.list_all()}), 200
+
+@app.route('/api/admin/profiles/<profile_id>', methods=['GET'])
+@require_admin
+def get_profile(profile_id):
+    """Get a request profile: duration, peak memory and top functions by cumulative time"""
+    profile = profiler.get(profile_id)
+    if not profile:
+        return jsonify({'error': 'Profile not found'}), 404
+    return jsonify({'profile': profile}), 200
+
+@app.route('/api/admin/profiles/<profile_id>/raw', methods=['GET'])
+@require_admin
+def download_profile(profile_id):
+    """Download the raw pstats dump of a request profile"""
+    path = profiler.stats_path(profile_id)
+    if not path:
+        return jsonify({'error': 'Profile not found'}), 404
+    return send_file(os.path.abspath(path), mimetype='application/octet-stream',
+                     as_attachment=True, download_name=f"{profile_id}.prof")
+
 if __name__ == '__main__':
+    # The debug reloader re-runs this module in a child; the pool and shards belong to the parent
+    if not os.environ.get('WERKZEUG_RUN_MAIN'):
+        if app.config['INFERENCE_MODE'] == 'pool' and app.config['INFERENCE_EMBEDDED']:
+            atexit.register(start_pool_process().terminate)
+        if app.config['SEARCH_BACKEND'] == 'sharded' and app.config['SEARCH_EMBEDDED']:
+            atexit.register(start_search_process().terminate)
     app.run(debug=app.config['DEBUG'], host=app.config['HOST'], port=app.config['PORT'])
\ No newline at end of file
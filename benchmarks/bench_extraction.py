@@ -0,0 +1,112 @@
+"""Text extraction throughput (pages/sec) of each backend on a fixed fixture set
+
+The fixtures are generated deterministically: text-heavy PDFs of 5, 50 and
+200 pages, plus the same text as plain text, markdown and HTML. Backends
+whose library or tool is not installed are reported as unavailable. Pass
+--files to add your own documents.
+
+    python -m benchmarks.bench_extraction --repeat 3
+"""
+import argparse
+import os
+import random
+import tempfile
+import time
+from services.extraction import EXTRACTORS
+
+WORDS = ("quality testing defect requirement release regression coverage manual automated "
+         "scenario verification validation acceptance integration system unit boundary value "
+         "equivalence partition severity priority report cycle environment build script").split()
+
+
+def _lines(rng, count, width=90):
+    for _ in range(count):
+        line = []
+        while sum(len(word) + 1 for word in line) < width:
+            line.append(rng.choice(WORDS))
+        yield " ".join(line)
+
+
+def write_pdf(path, pages, lines_per_page=60, seed=0):
+    """Write a text-only PDF with Helvetica text, one content stream per page"""
+    rng = random.Random(seed)
+    objects = [b"<< /Type /Catalog /Pages 2 0 R >>", None, b"<< /Type /Font /Subtype /Type1 /BaseFont /Helvetica >>"]
+    page_refs = []
+    for _ in range(pages):
+        body = "\n".join(f"({line}) Tj T*" for line in _lines(rng, lines_per_page))
+        stream = f"BT /F1 9 Tf 12 TL 40 800 Td\n{body}\nET".encode()
+        objects.append(b"<< /Length %d >>\nstream\n%s\nendstream" % (len(stream), stream))
+        content_ref = len(objects)
+        objects.append(b"<< /Type /Page /Parent 2 0 R /MediaBox [0 0 595 842] "
+                       b"/Resources << /Font << /F1 3 0 R >> >> /Contents %d 0 R >>" % content_ref)
+        page_refs.append(len(objects))
+    kids = " ".join(f"{ref} 0 R" for ref in page_refs).encode()
+    objects[1] = b"<< /Type /Pages /Kids [%s] /Count %d >>" % (kids, pages)
+
+    out = bytearray(b"%PDF-1.4\n")
+    offsets = []
+    for number, obj in enumerate(objects, 1):
+        offsets.append(len(out))
+        out += b"%d 0 obj\n%s\nendobj\n" % (number, obj)
+    xref = len(out)
+    out += b"xref\n0 %d\n0000000000 65535 f \n" % (len(objects) + 1)
+    out += b"".join(b"%010d 00000 n \n" % offset for offset in offsets)
+    out += b"trailer\n<< /Size %d /Root 1 0 R >>\nstartxref\n%d\n%%%%EOF\n" % (len(objects) + 1, xref)
+    with open(path, 'wb') as f:
+        f.write(out)
+
+
+def write_fixtures(directory):
+    """Create the fixture set and return (name, path, pages) tuples"""
+    fixtures = []
+    for pages in (5, 50, 200):
+        path = os.path.join(directory, f"text-{pages}p.pdf")
+        write_pdf(path, pages)
+        fixtures.append((os.path.basename(path), path, pages))
+
+    text = "\n".join(_lines(random.Random(1), 50 * 60))
+    documents = {
+        'text-50p.txt': text,
+        'text-50p.md': "# Fixture\n\n" + text.replace("\n", "\n\n"),
+        'text-50p.html': ("<html><head><style>p{}</style></head><body>"
+                          + "".join(f"<p>{line}</p>" for line in text.splitlines()) + "</body></html>"),
+    }
+    for name, content in documents.items():
+        path = os.path.join(directory, name)
+        with open(path, 'w') as f:
+            f.write(content)
+        fixtures.append((name, path, 50))
+    return fixtures
+
+
+def run(repeat, files):
+    with tempfile.TemporaryDirectory() as directory:
+        fixtures = write_fixtures(directory)
+        for path in files:
+            extension = os.path.splitext(path)[1].lower()
+            extractor = next(e for e in EXTRACTORS.values() if extension in e.extensions and e.available())
+            fixtures.append((os.path.basename(path), path, len(extractor.extract(path))))
+
+        print(f"{'fixture':<24} {'backend':<10} {'pages/s':>10} {'ms/doc':>10} {'chars':>10}")
+        for name, path, pages in fixtures:
+            extension = os.path.splitext(path)[1].lower()
+            for extractor in EXTRACTORS.values():
+                if extension not in extractor.extensions:
+                    continue
+                if not extractor.available():
+                    print(f"{name:<24} {extractor.name:<10} {'unavailable':>10}")
+                    continue
+                extractor.extract(path)  # warm up
+                start = time.perf_counter()
+                for _ in range(repeat):
+                    chars = sum(len(page) for page in extractor.extract(path))
+                elapsed = (time.perf_counter() - start) / repeat
+                print(f"{name:<24} {extractor.name:<10} {pages / elapsed:>10.1f} {elapsed * 1000:>10.2f} {chars:>10}")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--repeat', type=int, default=3)
+    parser.add_argument('--files', nargs='*', default=[], help="extra documents to include")
+    args = parser.parse_args()
+    run(args.repeat, args.files)
@@ -0,0 +1,79 @@
+"""Per-query overhead of the vector search: ad-hoc SQL vs. prepared statements
+
+"baseline" opens a connection per call and sends the query text with the
+embedding inlined twice, as search_similar used to. "pooled" sends the same
+SQL over a pooled connection, isolating connection setup. "prepared" borrows a
+pooled connection and EXECUTEs a statement prepared once on it, sending the
+embedding once. Requires a reachable database.
+
+    python -m benchmarks.bench_query_overhead --iterations 500
+"""
+import argparse
+import time
+import numpy as np
+from psycopg2.extras import RealDictCursor
+from config import Config
+from db.database import get_db_connection, pooled_connection
+from db.queries import execute_prepared
+
+
+def _ad_hoc_search(conn, embedding, top_k):
+    embedding = embedding.tolist()
+    with conn.cursor(cursor_factory=RealDictCursor) as cur:
+        cur.execute("""
+            SELECT c.chunk_id, c.text_content, d.doc_id, d.title,
+                   1 - (c.embedding <=> %s::vector) as similarity
+            FROM chunks c
+            JOIN documents d ON c.doc_id = d.doc_id
+            WHERE d.deleted_at IS NULL
+            ORDER BY c.embedding <=> %s::vector
+            LIMIT %s;
+        """, (embedding, embedding, top_k))
+        return cur.fetchall()
+
+
+def baseline(embedding, top_k):
+    conn = get_db_connection()
+    try:
+        return _ad_hoc_search(conn, embedding, top_k)
+    finally:
+        conn.close()
+
+
+def pooled(embedding, top_k):
+    with pooled_connection() as conn:
+        return _ad_hoc_search(conn, embedding, top_k)
+
+
+def prepared(embedding, top_k):
+    with pooled_connection() as conn:
+        with conn.cursor(cursor_factory=RealDictCursor) as cur:
+            execute_prepared(cur, 'search_similar', (embedding, top_k))
+            return cur.fetchall()
+
+
+def measure(fn, queries, top_k):
+    fn(queries[0], top_k)  # warm up (connect pool, PREPARE)
+    latencies = []
+    for query in queries:
+        start = time.perf_counter()
+        fn(query, top_k)
+        latencies.append((time.perf_counter() - start) * 1000)
+    return np.percentile(latencies, 50), np.percentile(latencies, 95), np.mean(latencies)
+
+
+def run(iterations, top_k, dimension):
+    queries = np.random.default_rng(0).standard_normal((iterations, dimension), dtype=np.float32)
+    print(f"{'path':<10} {'p50 ms':>8} {'p95 ms':>8} {'mean ms':>8}")
+    for name, fn in (('baseline', baseline), ('pooled', pooled), ('prepared', prepared)):
+        p50, p95, mean = measure(fn, queries, top_k)
+        print(f"{name:<10} {p50:>8.3f} {p95:>8.3f} {mean:>8.3f}")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--iterations', type=int, default=500)
+    parser.add_argument('--top-k', type=int, default=5)
+    parser.add_argument('--dimension', type=int, default=Config.EMBEDDING_DIM)
+    args = parser.parse_args()
+    run(args.iterations, args.top_k, args.dimension)
@@ -0,0 +1,118 @@
+"""Serialization time and size of API responses: Flask's encoder vs orjson, full vs lean shapes
+
+Payloads are generated deterministically: /api/question answers at top_k 5,
+20 and 50 (full, `fields=answer,sources` and `offsets`), and /api/documents
+listings with UUIDs, timestamps and metadata. Each payload is serialized
+into a response by Flask's default JSON provider and by FastJSONProvider,
+then compressed with gzip and, when installed, brotli at the configured
+levels. No database or models are needed.
+
+    python -m benchmarks.bench_responses --iterations 200
+"""
+import argparse
+import gzip
+import random
+import time
+import uuid
+from datetime import datetime, timedelta
+from flask import Flask
+from flask.json.provider import DefaultJSONProvider
+from config import Config
+from services.responses import FastJSONProvider, brotli, orjson
+
+WORDS = ("quality testing defect requirement release regression coverage manual automated "
+         "scenario verification validation acceptance integration system unit boundary value").split()
+
+
+def _chunk(rng, size=250):
+    words = []
+    while sum(len(word) + 1 for word in words) < size:
+        words.append(rng.choice(WORDS))
+    return " ".join(words)[:size]
+
+
+def answer_payloads(rng, top_k):
+    """Full, field-selected and offsets shapes of one answer"""
+    chunks = [{'chunk_id': str(uuid.UUID(int=rng.getrandbits(128))),
+               'doc_id': str(uuid.UUID(int=rng.getrandbits(128) % 8)),
+               'text': _chunk(rng), 'similarity': 0.9 - i * 0.01} for i in range(top_k)]
+    sources, with_chunks = {}, {}
+    for chunk in chunks:
+        source = {'id': chunk['doc_id'], 'title': f"document-{chunk['doc_id'][-4:]}.pdf",
+                  'similarity': chunk['similarity']}
+        sources.setdefault(chunk['doc_id'], source)
+        with_chunks.setdefault(chunk['doc_id'], {**source, 'chunks': []})['chunks'].append(
+            {'chunk_id': chunk['chunk_id'], 'similarity': chunk['similarity']})
+    answer = {'answer': "regression coverage of the release", 'confidence': 0.731}
+    full = {**answer, 'context': " ".join(chunk['text'] for chunk in chunks), 'sources': list(sources.values())}
+    return {
+        'full': full,
+        'fields=answer,sources': {'answer': answer['answer'], 'sources': full['sources']},
+        'offsets': {**answer, 'sources': list(with_chunks.values()),
+                    'answer_span': {'chunk_id': chunks[0]['chunk_id'], 'doc_id': chunks[0]['doc_id'],
+                                    'start': 12, 'end': 46}},
+    }
+
+
+def document_listing(rng, count):
+    added = datetime(2024, 1, 1)
+    return {'documents': [{
+        'doc_id': uuid.UUID(int=rng.getrandbits(128)),
+        'title': f"document-{i}.pdf",
+        'file_path': f"uploads/{uuid.UUID(int=rng.getrandbits(128)).hex}_document-{i}.pdf",
+        'date_added': added + timedelta(minutes=i),
+        'metadata': {'category': rng.choice(['manual', 'guide', 'spec']), 'year': 2015 + i % 10,
+                     'tags': rng.sample(WORDS, 3)},
+    } for i in range(count)]}
+
+
+def measure(fn, iterations):
+    fn()  # warm up
+    start = time.perf_counter()
+    for _ in range(iterations):
+        result = fn()
+    return (time.perf_counter() - start) / iterations * 1000, result
+
+
+def run(iterations, documents):
+    rng = random.Random(7)
+    payloads = []
+    for top_k in (5, 20, 50):
+        for shape, payload in answer_payloads(rng, top_k).items():
+            payloads.append((f"question top_k={top_k}", shape, payload))
+    payloads.append((f"documents n={documents}", 'full', document_listing(rng, documents)))
+
+    app = Flask(__name__)
+    providers = {'flask': DefaultJSONProvider(app), 'fast': FastJSONProvider(app)}
+    print(f"JSON encoder: {'orjson' if orjson else 'stdlib (orjson not installed)'}")
+    print(f"{'payload':<22} {'shape':<22} {'flask ms':>9} {'fast ms':>9} {'bytes':>9} "
+          f"{'gzip':>9} {'gzip ms':>8} {'br':>9} {'br ms':>8}")
+    with app.app_context():
+        for name, shape, payload in payloads:
+            timings = {}
+            for label, provider in providers.items():
+                try:
+                    timings[label], response = measure(lambda: provider.response(payload), iterations)
+                except TypeError:
+                    timings[label] = None  # e.g. values the default encoder cannot serialize
+            body = response.get_data()
+            gzip_ms, gzipped = measure(lambda: gzip.compress(body, Config.COMPRESS_GZIP_LEVEL, mtime=0), iterations)
+            row = (f"{name:<22} {shape:<22} "
+                   + "".join(f"{timings[label]:>9.3f} " if timings[label] is not None else f"{'error':>9} "
+                             for label in providers)
+                   + f"{len(body):>9} {len(gzipped):>9} {gzip_ms:>8.3f}")
+            if brotli is not None:
+                br_ms, compressed = measure(lambda: brotli.compress(body, quality=Config.COMPRESS_BROTLI_QUALITY),
+                                            iterations)
+                row += f" {len(compressed):>9} {br_ms:>8.3f}"
+            else:
+                row += f" {'n/a':>9} {'n/a':>8}"
+            print(row)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--iterations', type=int, default=200)
+    parser.add_argument('--documents', type=int, default=1000, help="documents in the listing payload")
+    args = parser.parse_args()
+    run(args.iterations, args.documents)
@@ -0,0 +1,110 @@
+"""Recall and latency of vector search at each storage precision and search strategy
+
+Uses embeddings of stored chunks as queries and an exact (index-free) scan
+at full precision as ground truth. The coarse strategy is measured for each
+number of candidate documents in --coarse-documents. Requires a populated
+database.
+
+    python -m benchmarks.bench_retrieval --queries 100 --top-k 5 --coarse-documents 5,20,50
+"""
+import argparse
+import time
+import numpy as np
+from psycopg2.extras import RealDictCursor
+from db.database import get_db_connection
+from models.embedding import EmbeddingModel
+
+INDEXES = ['chunks_embedding_idx', 'chunks_embedding_half_idx', 'chunks_embedding_bin_idx',
+           'document_centroids_embedding_idx']
+
+
+def sample_queries(n):
+    """Take n random chunk embeddings, with a little noise, as query vectors"""
+    conn = get_db_connection()
+    try:
+        with conn.cursor() as cur:
+            cur.execute("""
+                SELECT c.embedding::text FROM chunks c JOIN documents d ON c.doc_id = d.doc_id
+                WHERE d.deleted_at IS NULL ORDER BY random() LIMIT %s
+            """, (n,))
+            rows = cur.fetchall()
+    finally:
+        conn.close()
+    rng = np.random.default_rng(0)
+    queries = [np.array(row[0].strip('[]').split(','), dtype=np.float32) for row in rows]
+    return [q + rng.normal(0, 0.01, q.shape).astype(np.float32) for q in queries]
+
+
+def exact_top_k(query, top_k):
+    """Ground truth: full-precision brute-force scan over live documents, as search sees them"""
+    conn = get_db_connection()
+    try:
+        with conn.cursor(cursor_factory=RealDictCursor) as cur:
+            cur.execute("SET LOCAL enable_indexscan = off")
+            cur.execute("""
+                SELECT c.chunk_id FROM chunks c JOIN documents d ON c.doc_id = d.doc_id
+                WHERE d.deleted_at IS NULL
+                ORDER BY c.embedding <=> %s::vector LIMIT %s
+            """, (query.tolist(), top_k))
+            return {str(row['chunk_id']) for row in cur.fetchall()}
+    finally:
+        conn.close()
+
+
+def index_sizes():
+    conn = get_db_connection()
+    try:
+        with conn.cursor() as cur:
+            cur.execute("SELECT pg_relation_size('chunks')")
+            sizes = {'chunks (heap)': cur.fetchone()[0]}
+            for index in INDEXES:
+                cur.execute("SELECT to_regclass(%s)", (index,))
+                if cur.fetchone()[0]:
+                    cur.execute("SELECT pg_relation_size(%s)", (index,))
+                    sizes[index] = cur.fetchone()[0]
+            return sizes
+    finally:
+        conn.close()
+
+
+def measure(label, model, queries, truth, top_k):
+    latencies, hits = [], 0
+    for query, expected in zip(queries, truth):
+        start = time.perf_counter()
+        results = model.search_similar(query, top_k=top_k)
+        latencies.append((time.perf_counter() - start) * 1000)
+        hits += len(expected & {str(r['chunk_id']) for r in results})
+    recall = hits / sum(len(t) for t in truth)
+    print(f"{label:<16} {recall:>10.3f} {np.percentile(latencies, 50):>8.2f} {np.percentile(latencies, 95):>8.2f}")
+
+
+def run(precisions, coarse_documents, n_queries, top_k, rescore_factor):
+    queries = sample_queries(n_queries)
+    if not queries:
+        print("No chunks stored; upload some documents first.")
+        return
+    truth = [exact_top_k(q, top_k) for q in queries]
+
+    print(f"{'search':<16} {'recall@%d' % top_k:>10} {'p50 ms':>8} {'p95 ms':>8}")
+    for precision in precisions:
+        model = EmbeddingModel(precision=precision, rescore_factor=rescore_factor, strategy='flat')
+        measure(precision, model, queries, truth, top_k)
+    for documents in coarse_documents:
+        model = EmbeddingModel(strategy='coarse', coarse_documents=documents)
+        measure(f"coarse D={documents}", model, queries, truth, top_k)
+
+    print()
+    for name, size in index_sizes().items():
+        print(f"{name:<28} {size / 1024 / 1024:>10.1f} MB")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--queries', type=int, default=100)
+    parser.add_argument('--top-k', type=int, default=5)
+    parser.add_argument('--rescore-factor', type=int, default=4)
+    parser.add_argument('--precisions', default='full,halfvec,binary')
+    parser.add_argument('--coarse-documents', default='5,20,50', help="candidate documents per coarse search")
+    args = parser.parse_args()
+    coarse_documents = [int(d) for d in args.coarse_documents.split(',') if d]
+    run(args.precisions.split(','), coarse_documents, args.queries, args.top_k, args.rescore_factor)
@@ -0,0 +1,79 @@
+"""Latency and throughput of the sharded in-memory search as shards and concurrent clients are added
+
+Runs on synthetic normalized vectors, so no database is needed.
+
+    python -m benchmarks.bench_shard_search --chunks 1000000 --shards 1,2,4,8 --clients 1,4
+"""
+import argparse
+import os
+import tempfile
+import time
+from concurrent.futures import ThreadPoolExecutor
+import numpy as np
+from services.shard_search import ShardedSearchEngine, ShardSearchClient
+
+
+class SyntheticEmbeddings:
+    """Stands in for EmbeddingModel.iter_embedding_blocks with random documents"""
+
+    def __init__(self, chunks, dimension, chunks_per_doc=50):
+        self.chunks = chunks
+        self.dimension = dimension
+        self.chunks_per_doc = chunks_per_doc
+
+    def active_version(self):
+        return {'version': 1, 'dimension': self.dimension, 'column_name': 'embedding'}
+
+    def iter_embedding_blocks(self, version=None):
+        rng = np.random.default_rng(0)
+        batch = 100000
+        for offset in range(0, self.chunks, batch):
+            rows = range(offset, min(offset + batch, self.chunks))
+            yield ([f"chunk-{i}" for i in rows], [f"doc-{i // self.chunks_per_doc}" for i in rows],
+                   rng.standard_normal((len(rows), self.dimension), dtype=np.float32))
+
+
+def run(chunks, dimension, shard_counts, client_counts, n_queries, top_k):
+    model = SyntheticEmbeddings(chunks, dimension)
+    queries = np.random.default_rng(1).standard_normal((n_queries, dimension), dtype=np.float32)
+
+    print(f"{chunks} chunks x {dimension} dims, top_k={top_k}")
+    print(f"{'shards':>6} {'clients':>7} {'p50 ms':>8} {'p95 ms':>8} {'qps':>8}")
+    for num_shards in shard_counts:
+        socket_dir = tempfile.mkdtemp()
+        authkey = os.urandom(16)
+        engine = ShardedSearchEngine(model, num_shards=num_shards, socket_dir=socket_dir, authkey=authkey)
+        client = ShardSearchClient(model, socket_dir, num_shards=num_shards, authkey=authkey, timeout=60)
+        try:
+            engine.start()
+            engine.load()
+            client.search_ids(queries[0], top_k)  # warm up
+
+            def query(vector):
+                query_start = time.perf_counter()
+                client.search_ids(vector, top_k)
+                return (time.perf_counter() - query_start) * 1000
+
+            for clients in client_counts:
+                start = time.perf_counter()
+                with ThreadPoolExecutor(clients) as executor:
+                    latencies = list(executor.map(query, queries))
+                elapsed = time.perf_counter() - start
+                print(f"{num_shards:>6} {clients:>7} {np.percentile(latencies, 50):>8.2f} "
+                      f"{np.percentile(latencies, 95):>8.2f} {n_queries / elapsed:>8.1f}")
+        finally:
+            client.close()
+            engine.close()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--chunks', type=int, default=200000)
+    parser.add_argument('--dimension', type=int, default=384)
+    parser.add_argument('--shards', default='1,2,4')
+    parser.add_argument('--clients', default='1,4', help="concurrent querying threads")
+    parser.add_argument('--queries', type=int, default=200)
+    parser.add_argument('--top-k', type=int, default=5)
+    args = parser.parse_args()
+    run(args.chunks, args.dimension, [int(n) for n in args.shards.split(',')],
+        [int(n) for n in args.clients.split(',')], args.queries, args.top_k)
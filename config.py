@@ -1,4 +1,5 @@
 import os
+import secrets
 from dotenv import load_dotenv
 
 class Config:
@@ -10,18 +11,126 @@ class Config:
     DEBUG = os.environ.get('DEBUG', 'True') == 'True'
     HOST = os.environ.get('FLASK_HOST', '0.0.0.0')
     PORT = int(os.environ.get('FLASK_PORT', 5000))
+
+    # Response compression: buffered JSON responses of at least COMPRESS_MIN_SIZE bytes are
+    # sent with brotli (when installed) or gzip, as the client's Accept-Encoding allows
+    COMPRESS_RESPONSES = os.environ.get('COMPRESS_RESPONSES', 'True') == 'True'
+    COMPRESS_MIN_SIZE = int(os.environ.get('COMPRESS_MIN_SIZE', 1024))
+    COMPRESS_GZIP_LEVEL = int(os.environ.get('COMPRESS_GZIP_LEVEL', 6))
+    COMPRESS_BROTLI_QUALITY = int(os.environ.get('COMPRESS_BROTLI_QUALITY', 4))  # 0-11, low favours speed
     
     # Upload settings
     UPLOAD_FOLDER = os.environ.get('UPLOAD_FOLDER', 'uploads')
-    MAX_CONTENT_LENGTH = 16 * 1024 * 1024  # 16 MB max upload
+    MAX_CONTENT_LENGTH = int(os.environ.get('MAX_CONTENT_LENGTH', 16 * 1024 * 1024))  # 16 MB max multipart upload
+    STREAM_MAX_CONTENT_LENGTH = int(os.environ.get('STREAM_MAX_CONTENT_LENGTH', 512 * 1024 * 1024))  # raw/chunked uploads
+    UPLOAD_CHUNK_SIZE = int(os.environ.get('UPLOAD_CHUNK_SIZE', 1024 * 1024))
+    UPLOAD_SESSION_TTL = float(os.environ.get('UPLOAD_SESSION_TTL', 24 * 3600))  # idle resumable uploads are removed by the reaper
+    # PDF text extraction backends in order of preference: pdfium, pymupdf, pdftotext, pypdf2
+    PDF_BACKENDS = os.environ.get('PDF_BACKENDS', 'pdfium,pymupdf,pdftotext,pypdf2').split(',')
     
+    # Admission control: token buckets (cost units/sec, burst) and concurrency caps per route class
+    ADMISSION_ENABLED = os.environ.get('ADMISSION_ENABLED', 'True') == 'True'
+    ADMISSION_DB = os.environ.get('ADMISSION_DB', '/tmp/qa_rag_admission.sqlite3')
+    ADMISSION_POLICIES = {
+        'question': {
+            'rate': float(os.environ.get('QUESTION_COST_RATE', 20)),
+            'burst': float(os.environ.get('QUESTION_COST_BURST', 60)),
+            'concurrency': int(os.environ.get('QUESTION_CONCURRENCY', 8)),
+        },
+        'search': {
+            'rate': float(os.environ.get('SEARCH_COST_RATE', 50)),
+            'burst': float(os.environ.get('SEARCH_COST_BURST', 100)),
+            'concurrency': int(os.environ.get('SEARCH_CONCURRENCY', 16)),
+        },
+        'ingest': {
+            'rate': float(os.environ.get('INGEST_COST_RATE', 10)),
+            'burst': float(os.environ.get('INGEST_COST_BURST', 800)),
+            'concurrency': int(os.environ.get('INGEST_CONCURRENCY', 2)),
+        },
+    }
+
+    # Ingestion memory budget, shared by all workers on a host: uploads wait until their
+    # estimated peak memory fits, oversized documents are encoded and stored in parts
+    INGEST_MEMORY_BUDGET = int(os.environ.get('INGEST_MEMORY_BUDGET', 1024 * 1024 * 1024))  # bytes, 0 disables
+    INGEST_DB = os.environ.get('INGEST_DB', '/tmp/qa_rag_ingest.sqlite3')
+    INGEST_QUEUE_TIMEOUT = float(os.environ.get('INGEST_QUEUE_TIMEOUT', 10))  # seconds an upload waits for budget, keep below the worker timeout
+    INGEST_JOB_OVERHEAD = int(os.environ.get('INGEST_JOB_OVERHEAD', 64 * 1024 * 1024))  # native memory per job
+    INGEST_CALIBRATION_RATE = float(os.environ.get('INGEST_CALIBRATION_RATE', 0))  # jobs measured with tracemalloc, 0 disables
+
     # Database settings
     DB_HOST = os.environ.get('HOST', 'localhost')
     DB_PORT = int(os.environ.get('PORT', 5432))
     DB_NAME = os.environ.get('NAME', 'defaultdb')
     DB_USER = os.environ.get('DBUSER', 'postgres')
     DB_PASSWORD = os.environ.get('PASSWORD', 'postgres')
+    DB_POOL_MIN = int(os.environ.get('DB_POOL_MIN', 1))
+    DB_POOL_MAX = int(os.environ.get('DB_POOL_MAX', 20))
+    DB_POOL_TIMEOUT = float(os.environ.get('DB_POOL_TIMEOUT', 10))  # seconds to wait for a free pooled connection
+
+    # Deleted document cleanup
+    REAPER_ENABLED = os.environ.get('REAPER_ENABLED', 'True') == 'True'
+    REAPER_INTERVAL = float(os.environ.get('REAPER_INTERVAL', 30))
+    REAPER_BATCH_SIZE = int(os.environ.get('REAPER_BATCH_SIZE', 1000))
+    REAPER_VACUUM_THRESHOLD = int(os.environ.get('REAPER_VACUUM_THRESHOLD', 10000))
     
     # Model settings
     QA_MODEL = os.environ.get('QA_MODEL', 'deepset/roberta-base-squad2')
-    EMBEDDING_MODEL = os.environ.get('EMBEDDING_MODEL', 'sentence-transformers/all-MiniLM-L6-v2')
\ No newline at end of file
+    EMBEDDING_MODEL = os.environ.get('EMBEDDING_MODEL', 'sentence-transformers/all-MiniLM-L6-v2')
+    EMBEDDING_DIM = int(os.environ.get('EMBEDDING_DIM', 384))
+
+    # Model inference: 'local' loads the models in every web worker, 'pool' runs them
+    # in INFERENCE_WORKERS dedicated processes shared by all web workers
+    INFERENCE_MODE = os.environ.get('INFERENCE_MODE', 'local')
+    INFERENCE_WORKERS = int(os.environ.get('INFERENCE_WORKERS', 2))
+    INFERENCE_THREADS = int(os.environ.get('INFERENCE_THREADS', 0)) or None  # torch threads per process, default cores / workers
+    INFERENCE_PIN_CORES = os.environ.get('INFERENCE_PIN_CORES', 'True') == 'True'
+    INFERENCE_EMBEDDED = os.environ.get('INFERENCE_EMBEDDED', 'True') == 'True'  # start the pool with the app server
+    INFERENCE_SOCKET_DIR = os.environ.get('INFERENCE_SOCKET_DIR', '/tmp/qa_rag_inference')
+    # Unset, a random secret is generated and exported, so the pool started with the app
+    # server and its web workers share it; set it when the pool is started on its own
+    INFERENCE_AUTHKEY = os.environ.setdefault('INFERENCE_AUTHKEY', secrets.token_hex(16))
+    INFERENCE_TIMEOUT = float(os.environ.get('INFERENCE_TIMEOUT', 60))
+
+    # Embedding migration settings
+    EMBEDDING_VERSION_TTL = float(os.environ.get('EMBEDDING_VERSION_TTL', 10))  # seconds the active version is cached
+    BACKFILL_BATCH_SIZE = int(os.environ.get('BACKFILL_BATCH_SIZE', 256))
+    BACKFILL_MAX_RATE = float(os.environ.get('BACKFILL_MAX_RATE', 200))  # chunks per second, 0 for unthrottled
+
+    # Vector search settings
+    EMBEDDING_PRECISION = os.environ.get('EMBEDDING_PRECISION', 'full')  # full, halfvec or binary
+    RESCORE_FACTOR = int(os.environ.get('RESCORE_FACTOR', 4))  # candidates per result when quantized
+    SEARCH_STRATEGY = os.environ.get('SEARCH_STRATEGY', 'flat')  # flat, or coarse (documents by centroid, then their chunks)
+    COARSE_DOCUMENTS = int(os.environ.get('COARSE_DOCUMENTS', 20))  # documents whose chunks a coarse search ranks
+    FILTER_EXACT_MAX_CHUNKS = int(os.environ.get('FILTER_EXACT_MAX_CHUNKS', 10000))  # filters matching fewer chunks are searched exactly
+    FILTER_STATS_TTL = float(os.environ.get('FILTER_STATS_TTL', 60))  # seconds a filter's match count is cached
+    FILTER_STATS_CACHE_SIZE = int(os.environ.get('FILTER_STATS_CACHE_SIZE', 1000))
+    SEARCH_BACKEND = os.environ.get('SEARCH_BACKEND', 'pgvector')  # pgvector or sharded (in-memory, multi-process)
+    SEARCH_SHARDS = int(os.environ.get('SEARCH_SHARDS', 0)) or None  # defaults to the CPU count
+    SEARCH_SHARD_REFRESH = float(os.environ.get('SEARCH_SHARD_REFRESH', 300))  # seconds between reloads
+    SEARCH_EMBEDDED = os.environ.get('SEARCH_EMBEDDED', 'True') == 'True'  # start the shards with the app server
+    SEARCH_SOCKET_DIR = os.environ.get('SEARCH_SOCKET_DIR', '/tmp/qa_rag_search')
+    SEARCH_AUTHKEY = os.environ.setdefault('SEARCH_AUTHKEY', secrets.token_hex(16))  # like INFERENCE_AUTHKEY
+    SEARCH_SHARD_TIMEOUT = float(os.environ.get('SEARCH_SHARD_TIMEOUT', 5))  # seconds before falling back to pgvector
+    SEARCH_MAX_QUERIES = int(os.environ.get('SEARCH_MAX_QUERIES', 32))  # queries per /api/search request
+    SEARCH_MAX_TOP_K = int(os.environ.get('SEARCH_MAX_TOP_K', 100))  # passages per query
+    SEARCH_MAX_WINDOW = int(os.environ.get('SEARCH_MAX_WINDOW', 3))  # neighbouring chunks per side
+    CHUNK_CACHE_SIZE = int(os.environ.get('CHUNK_CACHE_SIZE', 20000))  # chunk texts cached per process, 0 disables
+    TITLE_CACHE_SIZE = int(os.environ.get('TITLE_CACHE_SIZE', 10000))  # document titles cached per process
+    TITLE_CACHE_TTL = float(os.environ.get('TITLE_CACHE_TTL', 300))  # seconds
+
+    # Corpus snapshots (python -m services.snapshot)
+    SNAPSHOT_ROW_GROUP = int(os.environ.get('SNAPSHOT_ROW_GROUP', 65536))  # rows per column block
+    SNAPSHOT_INDEX_MEMORY = os.environ.get('SNAPSHOT_INDEX_MEMORY', '1GB')  # maintenance_work_mem for the index build
+
+    # Startup warmup; /readyz reports ready once it has completed
+    WARMUP_ENABLED = os.environ.get('WARMUP_ENABLED', 'True') == 'True'
+    WARMUP_BATCH_SIZES = [int(n) for n in os.environ.get('WARMUP_BATCH_SIZES', '1,8,32').split(',')]  # passages per encode pass
+    WARMUP_PREWARM = os.environ.get('WARMUP_PREWARM', 'True') == 'True'  # load the vector indexes into Postgres buffers
+    WARMUP_RETRY_INTERVAL = float(os.environ.get('WARMUP_RETRY_INTERVAL', 5))  # seconds, while the models are unavailable
+
+    # Request profiling and admin endpoints
+    ADMIN_TOKEN = os.environ.get('ADMIN_TOKEN', '')  # unset disables /api/admin and on-demand profiling
+    PROFILE_DIR = os.environ.get('PROFILE_DIR', 'profiles')
+    PROFILE_SAMPLE_RATE = float(os.environ.get('PROFILE_SAMPLE_RATE', 0))  # fraction of requests profiled unasked
+    PROFILE_MEMORY = os.environ.get('PROFILE_MEMORY', 'True') == 'True'  # peak memory via tracemalloc
+    PROFILE_MAX_STORED = int(os.environ.get('PROFILE_MAX_STORED', 100))
@@ -1,10 +1,111 @@
+import atexit
+import contextvars
+import fcntl
+import json
 import logging
 import os
+import queue
+import random
 import sys
 import time
-from logging.handlers import RotatingFileHandler
+from contextlib import contextmanager
+from datetime import datetime, timezone
+from logging.handlers import RotatingFileHandler, QueueHandler, QueueListener
 from pathlib import Path
 
+# Request id of the request being handled on the current thread/context
+request_id_var = contextvars.ContextVar('request_id', default=None)
+
+# Attributes every LogRecord has; anything else was passed via `extra`
+_RESERVED_ATTRS = set(vars(logging.LogRecord('', 0, '', 0, '', (), None))) | {'message', 'asctime'}
+
+
+class RequestContextFilter(logging.Filter):
+    """Attach the current request id to every record"""
+
+    def filter(self, record):
+        record.request_id = request_id_var.get()
+        return True
+
+
+class SamplingFilter(logging.Filter):
+    """Keep only a fraction of records below a level, always keep the rest"""
+
+    def __init__(self, rate=1.0, level=logging.WARNING):
+        super().__init__()
+        self.rate = rate
+        self.level = level
+
+    def filter(self, record):
+        return record.levelno >= self.level or self.rate >= 1.0 or random.random() < self.rate
+
+
+class JsonFormatter(logging.Formatter):
+    """Format records as one JSON object per line, including `extra` fields"""
+
+    def format(self, record):
+        entry = {
+            'time': datetime.fromtimestamp(record.created, timezone.utc).isoformat(),
+            'level': record.levelname,
+            'logger': record.name,
+            'message': record.getMessage(),
+            'pid': record.process,
+        }
+        for key, value in vars(record).items():
+            if key not in _RESERVED_ATTRS and not key.startswith('_'):
+                entry[key] = value
+        if record.exc_info:
+            entry['exception'] = self.formatException(record.exc_info)
+        return json.dumps(entry, default=str)
+
+
+class ConcurrentRotatingFileHandler(RotatingFileHandler):
+    """
+    RotatingFileHandler that is safe to share between processes (e.g. gunicorn workers)
+
+    Writes and rollovers happen under an exclusive lock on a sidecar lock file,
+    the size check uses the file on disk, and a worker reopens its stream when
+    another worker has already rotated the file.
+    """
+
+    def __init__(self, filename, *args, **kwargs):
+        super().__init__(filename, *args, **kwargs)
+        self._lock_file = open(self.baseFilename + '.lock', 'a')
+
+    def _reopen_if_rotated(self):
+        try:
+            rotated = os.stat(self.baseFilename).st_ino != os.fstat(self.stream.fileno()).st_ino
+        except (FileNotFoundError, AttributeError, ValueError):
+            rotated = True
+        if rotated:
+            if self.stream:
+                self.stream.close()
+            self.stream = self._open()
+
+    def shouldRollover(self, record):
+        if self.maxBytes <= 0:
+            return False
+        try:
+            return os.path.getsize(self.baseFilename) >= self.maxBytes
+        except FileNotFoundError:
+            return False
+
+    def emit(self, record):
+        try:
+            fcntl.flock(self._lock_file, fcntl.LOCK_EX)
+            try:
+                self._reopen_if_rotated()
+                super().emit(record)
+            finally:
+                fcntl.flock(self._lock_file, fcntl.LOCK_UN)
+        except Exception:
+            self.handleError(record)
+
+    def close(self):
+        super().close()
+        self._lock_file.close()
+
+
 class CustomLogger:
     """
     - Rotating file handler to prevent large log files
@@ -22,7 +123,8 @@ class CustomLogger:
 
     def __init__(self, logger_name='app', log_level=logging.INFO, 
                  log_format='%(asctime)s - %(name)s - %(levelname)s - %(message)s',
-                 log_file='logs/app.log', max_file_size=10*1024*1024, backup_count=5):
+                 log_file='logs/app.log', max_file_size=10*1024*1024, backup_count=5,
+                 async_mode=None, json_format=None, hot_level=None, hot_sample_rate=None):
         """
         Initialize the logger with customizable options
         
@@ -33,25 +135,42 @@ class CustomLogger:
             log_file (str): Path to the log file
             max_file_size (int): Maximum size of each log file in bytes before rotation
             backup_count (int): Number of backup log files to keep
+            async_mode (bool): Hand records to a background thread instead of writing on
+                the calling thread (env LOG_ASYNC, default True)
+            json_format (bool): Emit structured JSON lines (env LOG_JSON, default False)
+            hot_level (int): Level of the hot-path logger (env LOG_HOT_LEVEL, default INFO)
+            hot_sample_rate (float): Fraction of hot-path records below WARNING that are
+                kept (env LOG_HOT_SAMPLE_RATE, default 1.0)
         """
         if self._initialized:
             return
+
+        if async_mode is None:
+            async_mode = os.environ.get('LOG_ASYNC', 'True') == 'True'
+        if json_format is None:
+            json_format = os.environ.get('LOG_JSON', 'False') == 'True'
+        if hot_level is None:
+            hot_level = logging.getLevelName(os.environ.get('LOG_HOT_LEVEL', 'INFO'))
+        if hot_sample_rate is None:
+            hot_sample_rate = float(os.environ.get('LOG_HOT_SAMPLE_RATE', 1.0))
             
         self.logger = logging.getLogger(logger_name)
         self.logger.setLevel(log_level)
         self.logger.propagate = False
+        self.listener = None
         
         # Clear any existing handlers
         if self.logger.handlers:
             self.logger.handlers.clear()
             
         # Create formatter
-        formatter = logging.Formatter(log_format)
+        formatter = JsonFormatter() if json_format else logging.Formatter(log_format)
+        handlers = []
         
         # Console handler
         console_handler = logging.StreamHandler(sys.stdout)
         console_handler.setFormatter(formatter)
-        self.logger.addHandler(console_handler)
+        handlers.append(console_handler)
         
         # File handler with rotation
         try:
@@ -60,15 +179,34 @@ class CustomLogger:
             if log_dir:
                 Path(log_dir).mkdir(parents=True, exist_ok=True)
                 
-            file_handler = RotatingFileHandler(
+            file_handler = ConcurrentRotatingFileHandler(
                 log_file, 
                 maxBytes=max_file_size, 
                 backupCount=backup_count
             )
             file_handler.setFormatter(formatter)
-            self.logger.addHandler(file_handler)
+            handlers.append(file_handler)
         except Exception as e:
             self.logger.error(f"Failed to create file handler: {e}")
+
+        if async_mode:
+            # Request threads only enqueue; a listener thread does the I/O
+            log_queue = queue.SimpleQueue()
+            queue_handler = QueueHandler(log_queue)
+            queue_handler.addFilter(RequestContextFilter())
+            self.logger.addHandler(queue_handler)
+            self.listener = QueueListener(log_queue, *handlers, respect_handler_level=True)
+            self.listener.start()
+            atexit.register(self.listener.stop)
+        else:
+            for handler in handlers:
+                handler.addFilter(RequestContextFilter())
+                self.logger.addHandler(handler)
+
+        # Per-request messages go through a child logger with its own level and sampling
+        self.hot_logger = self.logger.getChild('hot')
+        self.hot_logger.setLevel(hot_level)
+        self.hot_logger.addFilter(SamplingFilter(hot_sample_rate))
             
         self._initialized = True
         
@@ -76,8 +214,13 @@ class CustomLogger:
         """Return the configured logger instance"""
         return self.logger
 
+    def get_hot_logger(self):
+        """Return the sampled logger for per-request hot-path messages"""
+        return self.hot_logger
+
 # Create a default logger instance for direct import
 logger = CustomLogger().get_logger()
+hot_logger = CustomLogger().get_hot_logger()
 
 # Convenience methods that can be imported directly
 def debug(message):
@@ -98,6 +241,22 @@ def critical(message):
 def exception(message):
     logger.exception(message)
 
+def set_request_id(request_id):
+    """Bind a request id to records logged from the current context"""
+    return request_id_var.set(request_id)
+
+@contextmanager
+def log_stage(stage, log=None, level=logging.INFO):
+    """Log how long a block took, as `stage` and `duration_ms` record fields"""
+    log = log or hot_logger
+    start_time = time.perf_counter()
+    try:
+        yield
+    finally:
+        duration_ms = (time.perf_counter() - start_time) * 1000
+        log.log(level, f"{stage} took {duration_ms:.1f}ms",
+                extra={'stage': stage, 'duration_ms': round(duration_ms, 3)})
+
 # for performance tracking, can be implemented
 def log_execution_time(func):
     """Decorator to log execution time of functions"""
@@ -1,8 +1,32 @@
+import os
+import threading
+from contextlib import contextmanager
 import psycopg2
+from psycopg2.extensions import connection as _connection
 from psycopg2.extras import execute_values
+from psycopg2.pool import PoolError, ThreadedConnectionPool
 from config import Config
 from custom_logger import logger
 
+# Inverted lists of the ivfflat chunk indexes; filtered search scales probes against it
+IVFFLAT_LISTS = 100
+# pgvector rejects hnsw.ef_search above this, and a scan returns at most ef_search rows
+HNSW_MAX_EF_SEARCH = 1000
+
+_pool = None
+_pool_pid = None
+_pool_lock = threading.Lock()
+# One slot per pooled connection; borrowers wait for a slot instead of
+# getconn() raising PoolError as soon as all of them are checked out
+_pool_slots = None
+
+class PreparedConnection(_connection):
+    """Connection that remembers which statements were PREPAREd on it"""
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.prepared = set()
+
 def get_db_connection():
     """Create a new database connection"""
     return psycopg2.connect(
@@ -13,6 +37,113 @@ def get_db_connection():
         password=Config.DB_PASSWORD
     )
 
+def get_pool():
+    """Return this process's connection pool, creating it on first use"""
+    global _pool, _pool_pid, _pool_slots
+    with _pool_lock:
+        # A pool inherited across fork() shares sockets with the parent; start a fresh one
+        if _pool is None or _pool_pid != os.getpid():
+            _pool = ThreadedConnectionPool(
+                Config.DB_POOL_MIN,
+                Config.DB_POOL_MAX,
+                host=Config.DB_HOST,
+                port=Config.DB_PORT,
+                dbname=Config.DB_NAME,
+                user=Config.DB_USER,
+                password=Config.DB_PASSWORD,
+                connection_factory=PreparedConnection
+            )
+            _pool_slots = threading.BoundedSemaphore(Config.DB_POOL_MAX)
+            _pool_pid = os.getpid()
+        return _pool
+
+@contextmanager
+def pooled_connection(timeout=None):
+    """Borrow a connection from the pool, rolling back anything left uncommitted
+
+    When all DB_POOL_MAX connections are in use, waits for one to be returned.
+
+    Args:
+        timeout (float, optional): Seconds to wait for a free connection, defaults to Config.DB_POOL_TIMEOUT
+
+    Raises:
+        PoolError: If no connection was returned within the timeout
+    """
+    pool = get_pool()
+    slots = _pool_slots
+    timeout = Config.DB_POOL_TIMEOUT if timeout is None else timeout
+    if not slots.acquire(timeout=timeout):
+        logger.info(f"Error: no database connection free after {timeout}s ({Config.DB_POOL_MAX} in use)")
+        raise PoolError("connection pool exhausted")
+    try:
+        conn = pool.getconn()
+        try:
+            yield conn
+        finally:
+            if not conn.closed:
+                try:
+                    conn.rollback()
+                except psycopg2.Error:
+                    pass
+            pool.putconn(conn, close=bool(conn.closed))
+    finally:
+        slots.release()
+
+def create_compact_index(cur, precision, embedding_dim, column='embedding', concurrently=False):
+    """Create the HNSW expression index used by the given storage precision"""
+    concurrently = "CONCURRENTLY" if concurrently else ""
+    if precision == 'halfvec':
+        cur.execute(f"""
+            CREATE INDEX {concurrently} IF NOT EXISTS chunks_{column}_half_idx ON chunks
+            USING hnsw (({column}::halfvec({embedding_dim})) halfvec_cosine_ops);
+        """)
+    elif precision == 'binary':
+        cur.execute(f"""
+            CREATE INDEX {concurrently} IF NOT EXISTS chunks_{column}_bin_idx ON chunks
+            USING hnsw ((binary_quantize({column})::bit({embedding_dim})) bit_hamming_ops);
+        """)
+
+def create_vector_indexes(cur, embedding_dim, column='embedding', concurrently=False):
+    """Create the similarity search indexes for an embedding column"""
+    cur.execute(f"""
+        CREATE INDEX {"CONCURRENTLY" if concurrently else ""} IF NOT EXISTS chunks_{column}_idx ON chunks 
+        USING ivfflat ({column} vector_cosine_ops) WITH (lists = {IVFFLAT_LISTS});
+    """)
+
+    # Compact indexes over quantized copies of the embedding; search
+    # rescores their candidates against the full-precision column. They are
+    # built in addition to the ivfflat index above, which filtered, batched
+    # and full-precision searches still use, so a compact precision costs
+    # extra disk and build time in exchange for a smaller index to keep hot.
+    create_compact_index(cur, Config.EMBEDDING_PRECISION, embedding_dim, column, concurrently)
+
+    # One row per document rather than per chunk, so hnsw needs no training data
+    # and stays small
+    cur.execute(f"""
+        CREATE INDEX {"CONCURRENTLY" if concurrently else ""} IF NOT EXISTS document_centroids_{column}_idx
+        ON document_centroids USING hnsw ({column} vector_cosine_ops);
+    """)
+
+def build_document_centroids(cur, column='embedding'):
+    """Compute the missing centroids of an embedding column from the chunks
+
+    Only documents whose chunks all have a vector in the column are included.
+
+    Returns:
+        int: Number of centroids written
+    """
+    cur.execute(f"""
+        INSERT INTO document_centroids (doc_id, chunk_count, {column})
+        SELECT c.doc_id, COUNT(*), AVG(c.{column})
+        FROM chunks c
+        LEFT JOIN document_centroids dc ON dc.doc_id = c.doc_id
+        WHERE dc.{column} IS NULL
+        GROUP BY c.doc_id
+        HAVING COUNT(c.{column}) = COUNT(*)
+        ON CONFLICT (doc_id) DO UPDATE SET {column} = EXCLUDED.{column}, chunk_count = EXCLUDED.chunk_count;
+    """)
+    return cur.rowcount
+
 def initialize_database():
     """Initialize database schema if it doesn't exist"""
     conn = get_db_connection()
@@ -28,14 +159,35 @@ def initialize_database():
                     title TEXT NOT NULL,
                     file_path TEXT,
                     date_added TIMESTAMP,
-                    metadata JSONB
+                    metadata JSONB,
+                    deleted_at TIMESTAMP
                 );
             """)
 
-            cur.execute("CREATE EXTENSION IF NOT EXISTS vector;")
-            
+            # Tombstone column for soft deletes (older databases predate it)
+            cur.execute("ALTER TABLE documents ADD COLUMN IF NOT EXISTS deleted_at TIMESTAMP;")
+            cur.execute("""
+                CREATE INDEX IF NOT EXISTS documents_deleted_at_idx ON documents (deleted_at)
+                WHERE deleted_at IS NOT NULL;
+            """)
+
+            # Filtered search: containment on metadata, windows on date_added
+            cur.execute("""
+                CREATE INDEX IF NOT EXISTS documents_metadata_idx ON documents
+                USING gin (metadata jsonb_path_ops);
+            """)
+            cur.execute("CREATE INDEX IF NOT EXISTS documents_date_added_idx ON documents (date_added);")
+
+            # Optional: lets startup warmup load the search indexes into shared buffers
+            cur.execute("SAVEPOINT prewarm_extension;")
+            try:
+                cur.execute("CREATE EXTENSION IF NOT EXISTS pg_prewarm;")
+            except psycopg2.Error as e:
+                cur.execute("ROLLBACK TO SAVEPOINT prewarm_extension;")
+                logger.info(f"pg_prewarm unavailable, warmup will scan the vector index instead: {e}")
+
             # Get embedding dimension from config
-            embedding_dim = 1536  # Default for all-MiniLM-L6-v2
+            embedding_dim = Config.EMBEDDING_DIM  # 384 for all-MiniLM-L6-v2
             
             # Create chunks table with vector support
             cur.execute(f"""
@@ -49,16 +201,70 @@ def initialize_database():
                 );
             """)
             
-            # Create index for faster similarity search
+            # Mean chunk embedding of each document, for coarse-to-fine search. Columns
+            # are named after the chunks column they summarize.
+            cur.execute("SELECT to_regclass('document_centroids') IS NULL")
+            new_centroids = cur.fetchone()[0]
             cur.execute(f"""
-                CREATE INDEX IF NOT EXISTS chunks_embedding_idx ON chunks 
-                USING ivfflat (embedding vector_cosine_ops) WITH (lists = 100);
+                CREATE TABLE IF NOT EXISTS document_centroids (
+                    doc_id UUID PRIMARY KEY REFERENCES documents(doc_id) ON DELETE CASCADE,
+                    chunk_count INTEGER NOT NULL,
+                    embedding vector({embedding_dim})
+                );
+            """)
+            # Documents stored before centroids existed; later ones maintain their own
+            if new_centroids:
+                build_document_centroids(cur)
+            
+            # Create index for faster similarity search
+            create_vector_indexes(cur, embedding_dim)
+
+            # Which model produced which embedding column; exactly one is active
+            cur.execute("""
+                CREATE TABLE IF NOT EXISTS embedding_versions (
+                    version SERIAL PRIMARY KEY,
+                    model_name TEXT NOT NULL,
+                    dimension INTEGER NOT NULL,
+                    column_name TEXT NOT NULL,
+                    status TEXT NOT NULL,
+                    total_chunks INTEGER DEFAULT 0,
+                    backfilled_chunks INTEGER DEFAULT 0,
+                    chunks_per_sec REAL DEFAULT 0,
+                    created_at TIMESTAMP DEFAULT now(),
+                    activated_at TIMESTAMP
+                );
+            """)
+            cur.execute("""
+                CREATE UNIQUE INDEX IF NOT EXISTS embedding_versions_active_idx ON embedding_versions (status)
+                WHERE status = 'active';
             """)
+
+            # The original column is version 1, produced by the configured model
+            cur.execute("""
+                INSERT INTO embedding_versions (model_name, dimension, column_name, status, activated_at)
+                SELECT %s, %s, 'embedding', 'active', now()
+                WHERE NOT EXISTS (SELECT 1 FROM embedding_versions);
+            """, (Config.EMBEDDING_MODEL, embedding_dim))
             
         conn.commit()
         logger.info("Database initialized successfully")
     except Exception as e:
         conn.rollback()
         logger.info(f"Error initializing database: {e}")
+    finally:
+        conn.close()
+
+def vacuum_table(table):
+    """Run VACUUM (ANALYZE) on a table so dead tuples and index entries are reclaimed"""
+    conn = get_db_connection()
+    try:
+        # VACUUM cannot run inside a transaction block
+        conn.autocommit = True
+        with conn.cursor() as cur:
+            cur.execute(f"VACUUM (ANALYZE) {table};")
+        return True
+    except Exception as e:
+        logger.info(f"Error vacuuming {table}: {e}")
+        return False
     finally:
         conn.close()
\ No newline at end of file
@@ -0,0 +1,84 @@
+import json
+from datetime import datetime
+
+# Range operators of filter expressions and their SQL / jsonpath counterparts
+RANGE_OPERATORS = {'gt': '>', 'gte': '>=', 'lt': '<', 'lte': '<='}
+SCALAR_TYPES = (str, int, float, bool)
+
+def compile_filter(expression):
+    """Compile a document filter expression into a SQL predicate over `documents d`
+
+    The expression maps fields to conditions, all of which must hold:
+        {"category": "manual"}                      metadata key equals a value
+        {"category": ["manual", "guide"]}           metadata key equals any of the values
+        {"year": {"gte": 2020, "lt": 2024}}         metadata key within a range (JSON numbers or strings)
+        {"date_added": {"gte": "2024-01-01"}}       documents added within a window (ISO timestamps)
+
+    Equality on metadata compiles to containment (`@>`), which the GIN index
+    on documents.metadata serves; date_added conditions use its btree index.
+
+    Args:
+        expression (dict): Filter expression
+
+    Returns:
+        tuple: (SQL predicate, parameter list)
+
+    Raises:
+        ValueError: If the expression is malformed
+    """
+    if not isinstance(expression, dict) or not expression:
+        raise ValueError("filter must be a non-empty object")
+
+    clauses, params = [], []
+    for field, condition in expression.items():
+        if not isinstance(field, str) or not field:
+            raise ValueError("filter fields must be non-empty strings")
+        if field == 'date_added':
+            clause, clause_params = _compile_date_added(condition)
+        else:
+            clause, clause_params = _compile_metadata(field, condition)
+        clauses.append(clause)
+        params.extend(clause_params)
+    return " AND ".join(clauses), params
+
+def _compile_metadata(key, condition):
+    if isinstance(condition, SCALAR_TYPES) or condition is None:
+        return "d.metadata @> %s::jsonb", [json.dumps({key: condition})]
+
+    if isinstance(condition, list):
+        if not condition or not all(isinstance(v, SCALAR_TYPES) for v in condition):
+            raise ValueError(f"filter on '{key}' must list at least one value")
+        # OR of containments, so each branch can use the GIN index
+        clause = " OR ".join(["d.metadata @> %s::jsonb"] * len(condition))
+        return f"({clause})", [json.dumps({key: value}) for value in condition]
+
+    bounds = _range_bounds(key, condition)
+    # Bounds are jsonpath variables rather than part of the path text
+    predicate = " && ".join(f"@ {RANGE_OPERATORS[op]} ${op}" for op in bounds)
+    path = f"$.{json.dumps(key)} ? ({predicate})"
+    return "jsonb_path_exists(d.metadata, %s::jsonpath, %s::jsonb)", [path, json.dumps(bounds)]
+
+def _compile_date_added(condition):
+    if isinstance(condition, str):
+        return "d.date_added = %s", [_timestamp(condition)]
+
+    bounds = _range_bounds('date_added', condition)
+    clause = " AND ".join(f"d.date_added {RANGE_OPERATORS[op]} %s" for op in bounds)
+    return f"({clause})", [_timestamp(value) for value in bounds.values()]
+
+def _range_bounds(field, condition):
+    if not isinstance(condition, dict) or not condition:
+        raise ValueError(f"filter on '{field}' must be a value, a list of values or a range")
+    unknown = set(condition) - set(RANGE_OPERATORS)
+    if unknown:
+        raise ValueError(f"unknown operators for '{field}': {', '.join(sorted(unknown))}")
+    for value in condition.values():
+        if isinstance(value, bool) or not isinstance(value, (str, int, float)):
+            raise ValueError(f"range bounds for '{field}' must be numbers or strings")
+    return condition
+
+def _timestamp(value):
+    try:
+        return datetime.fromisoformat(value)
+    except (TypeError, ValueError):
+        raise ValueError(f"date_added values must be ISO timestamps, got {value!r}")
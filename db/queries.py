@@ -0,0 +1,99 @@
+import numpy as np
+from psycopg2.extensions import register_adapter, AsIs, QuotedString
+
+# name -> (parameter types, statement); prepared lazily once per pooled connection
+# and embedding column. The query vector is a single parameter referenced in both
+# SELECT and ORDER BY. Searches return ids and scores only; text and titles are
+# fetched for the final hits by hydrate_chunks.
+PREPARED_STATEMENTS = {
+    'search_similar': ("vector, integer", """
+        SELECT c.chunk_id, c.doc_id, 1 - (c.{column} <=> $1) AS similarity
+        FROM chunks c
+        JOIN documents d ON c.doc_id = d.doc_id
+        WHERE d.deleted_at IS NULL
+        ORDER BY c.{column} <=> $1
+        LIMIT $2
+    """),
+    'search_similar_doc': ("vector, uuid, integer", """
+        SELECT c.chunk_id, c.doc_id, 1 - (c.{column} <=> $1) AS similarity
+        FROM chunks c
+        JOIN documents d ON c.doc_id = d.doc_id
+        WHERE d.doc_id = $2 AND d.deleted_at IS NULL
+        ORDER BY c.{column} <=> $1
+        LIMIT $3
+    """),
+    # Coarse-to-fine: rank documents by centroid, then rank only their chunks. The
+    # materialized distances keep the planner from walking the (approximate) chunk
+    # index instead, so the fine stage is an exact sort over the candidates' chunks.
+    'search_coarse': ("vector, integer, integer", """
+        WITH candidate_docs AS (
+            SELECT dc.doc_id
+            FROM document_centroids dc
+            JOIN documents d ON dc.doc_id = d.doc_id
+            WHERE d.deleted_at IS NULL
+            ORDER BY dc.{column} <=> $1
+            LIMIT $2
+        ), candidate_chunks AS MATERIALIZED (
+            SELECT c.chunk_id, c.doc_id, c.{column} <=> $1 AS distance
+            FROM candidate_docs cd
+            JOIN chunks c ON c.doc_id = cd.doc_id
+        )
+        SELECT chunk_id, doc_id, 1 - distance AS similarity
+        FROM candidate_chunks
+        ORDER BY distance
+        LIMIT $3
+    """),
+    'insert_chunks': ("text[], uuid, integer[], text[], text[]", """
+        INSERT INTO chunks (chunk_id, doc_id, chunk_index, text_content, {column})
+        SELECT u.chunk_id::uuid, $2, u.chunk_index, u.text_content, u.embedding::vector
+        FROM unnest($1, $3, $4, $5) AS u(chunk_id, chunk_index, text_content, embedding)
+    """),
+    'upsert_centroid': ("uuid, integer, text", """
+        INSERT INTO document_centroids (doc_id, chunk_count, {column})
+        VALUES ($1, $2, $3::vector)
+        ON CONFLICT (doc_id) DO UPDATE SET {column} = EXCLUDED.{column}, chunk_count = EXCLUDED.chunk_count
+    """),
+    # Titles of live documents $1, plus the text of chunks $2 within them
+    'hydrate_chunks': ("text[], text[]", """
+        SELECT d.doc_id, d.title, c.chunk_id, c.text_content
+        FROM documents d
+        LEFT JOIN chunks c ON c.doc_id = d.doc_id AND c.chunk_id = ANY($2::uuid[])
+        WHERE d.doc_id = ANY($1::uuid[]) AND d.deleted_at IS NULL
+    """),
+}
+
+def vector_literal(vector):
+    """Render a 1-D array as pgvector's text form, e.g. '[0.1,0.2]'
+
+    Nine significant digits round-trip float32 exactly, which is what pgvector stores.
+    """
+    return "[" + ",".join(["%.9g" % x for x in np.asarray(vector, dtype=np.float32).tolist()]) + "]"
+
+def adapt_vector(numpy_array):
+    """psycopg2 adapter sending 1-D numpy arrays as a single quoted vector literal"""
+    if numpy_array.ndim != 1:
+        return AsIs(list(numpy_array))
+    return QuotedString(vector_literal(numpy_array))
+
+def register_vector_adapter():
+    register_adapter(np.ndarray, adapt_vector)
+
+def execute_prepared(cur, name, params, column='embedding'):
+    """Execute a named statement, PREPAREing it first if this connection hasn't yet
+
+    Args:
+        cur: Cursor of a PreparedConnection
+        name (str): Key of PREPARED_STATEMENTS
+        params (tuple): Statement parameters
+        column (str): Embedding column the statement reads or writes
+    """
+    conn = cur.connection
+    prepared_name = name if column == 'embedding' else f"{name}_{column}"
+    if prepared_name not in conn.prepared:
+        arg_types, statement = PREPARED_STATEMENTS[name]
+        cur.execute(f"PREPARE {prepared_name} ({arg_types}) AS {statement.format(column=column)}")
+        conn.prepared.add(prepared_name)
+    placeholders = ", ".join(["%s"] * len(params))
+    cur.execute(f"EXECUTE {prepared_name} ({placeholders})", params)
+
+register_vector_adapter()
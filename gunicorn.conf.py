@@ -0,0 +1,20 @@
+from config import Config
+from services.inference import start_pool_process
+from services.shard_search import start_search_process
+
+
+def on_starting(server):
+    """Start the shared inference pool and search shards before any web worker is forked"""
+    server.inference_pool = None
+    server.search_shards = None
+    if Config.INFERENCE_MODE == 'pool' and Config.INFERENCE_EMBEDDED:
+        server.inference_pool = start_pool_process()
+    if Config.SEARCH_BACKEND == 'sharded' and Config.SEARCH_EMBEDDED:
+        server.search_shards = start_search_process()
+
+
+def on_exit(server):
+    for process in (server.inference_pool, server.search_shards):
+        if process:
+            process.terminate()
+            process.wait(10)
@@ -3,6 +3,7 @@ from pathlib import Path
 import numpy as np
 from custom_logger import logger
 from psycopg2.extensions import register_adapter, AsIs
+from db.queries import adapt_vector
 
 # Add the project root directory to the Python path
 sys.path.append(str(Path(__file__).parent))
@@ -20,7 +21,8 @@ def addapt_numpy_int32(numpy_int32):
     return AsIs(numpy_int32)
 
 def addapt_numpy_array(numpy_array):
-    return AsIs(list(numpy_array))
+    # 1-D arrays go over the wire as a single pgvector literal
+    return adapt_vector(numpy_array)
 
 logger.info("Registering adapters")
 # register_adapter(np.float64, addapt_numpy_float64)
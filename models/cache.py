@@ -0,0 +1,53 @@
+import threading
+import time
+from collections import OrderedDict
+
+class LRUCache:
+    """Thread-safe in-process LRU cache with an optional time to live"""
+
+    def __init__(self, maxsize, ttl=None):
+        """
+        Args:
+            maxsize (int): Maximum number of entries, 0 disables the cache
+            ttl (float, optional): Seconds an entry stays valid, forever when None
+        """
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self._data = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get_many(self, keys):
+        """Return the cached entries among `keys` as a dictionary"""
+        now = time.monotonic()
+        found = {}
+        with self._lock:
+            for key in keys:
+                entry = self._data.get(key)
+                if entry is None:
+                    continue
+                value, stored = entry
+                if self.ttl is not None and now - stored > self.ttl:
+                    del self._data[key]
+                    continue
+                self._data.move_to_end(key)
+                found[key] = value
+        return found
+
+    def set_many(self, items):
+        """Cache key/value pairs, evicting the least recently used entries"""
+        if not self.maxsize:
+            return
+        now = time.monotonic()
+        with self._lock:
+            for key, value in items.items():
+                self._data[key] = (value, now)
+                self._data.move_to_end(key)
+            while len(self._data) > self.maxsize:
+                self._data.popitem(last=False)
+
+    def discard(self, key):
+        with self._lock:
+            self._data.pop(key, None)
+
+    def __len__(self):
+        return len(self._data)
@@ -57,7 +57,7 @@ class DocumentModel:
             conn = get_db_connection()
             with conn.cursor(cursor_factory=RealDictCursor) as cur:
                 cur.execute(
-                    "SELECT doc_id, title, file_path, date_added, metadata FROM documents WHERE doc_id = %s",
+                    "SELECT doc_id, title, file_path, date_added, metadata FROM documents WHERE doc_id = %s AND deleted_at IS NULL",
                     (doc_id,)
                 )
                 document = cur.fetchone()
@@ -80,7 +80,7 @@ class DocumentModel:
             conn = get_db_connection()
             with conn.cursor(cursor_factory=RealDictCursor) as cur:
                 cur.execute(
-                    "SELECT doc_id, title, file_path, date_added FROM documents ORDER BY date_added DESC"
+                    "SELECT doc_id, title, file_path, date_added FROM documents WHERE deleted_at IS NULL ORDER BY date_added DESC"
                 )
                 documents = cur.fetchall()
             return [dict(doc) for doc in documents]
@@ -92,7 +92,10 @@ class DocumentModel:
                 conn.close()
     
     def delete(self, doc_id):
-        """Delete document by ID
+        """Soft-delete document by ID
+
+        The document is tombstoned so it disappears from listings and search
+        immediately; its chunks are removed later by the background reaper.
         
         Args:
             doc_id (str): Document ID
@@ -104,7 +107,10 @@ class DocumentModel:
         try:
             conn = get_db_connection()
             with conn.cursor() as cur:
-                cur.execute("DELETE FROM documents WHERE doc_id = %s", (doc_id,))
+                cur.execute(
+                    "UPDATE documents SET deleted_at = %s WHERE doc_id = %s AND deleted_at IS NULL",
+                    (datetime.now(), doc_id)
+                )
                 rows_deleted = cur.rowcount
             conn.commit()
             return rows_deleted > 0
@@ -115,4 +121,59 @@ class DocumentModel:
             return False
         finally:
             if conn:
-                conn.close()
\ No newline at end of file
+                conn.close()
+
+    def list_deleted(self, limit=100):
+        """List tombstoned documents awaiting cleanup, oldest first
+        
+        Args:
+            limit (int): Maximum number of document IDs to return
+            
+        Returns:
+            list: List of document IDs
+        """
+        conn = None
+        try:
+            conn = get_db_connection()
+            with conn.cursor() as cur:
+                cur.execute(
+                    "SELECT doc_id FROM documents WHERE deleted_at IS NOT NULL ORDER BY deleted_at LIMIT %s",
+                    (limit,)
+                )
+                rows = cur.fetchall()
+            return [str(row[0]) for row in rows]
+        except Exception as e:
+            logger.info(f"Error listing deleted documents: {e}")
+            return []
+        finally:
+            if conn:
+                conn.close()
+
+    def purge(self, doc_id):
+        """Permanently remove a tombstoned document row
+        
+        Args:
+            doc_id (str): Document ID
+            
+        Returns:
+            bool: True if successful, False otherwise
+        """
+        conn = None
+        try:
+            conn = get_db_connection()
+            with conn.cursor() as cur:
+                cur.execute(
+                    "DELETE FROM documents WHERE doc_id = %s AND deleted_at IS NOT NULL",
+                    (doc_id,)
+                )
+                rows_deleted = cur.rowcount
+            conn.commit()
+            return rows_deleted > 0
+        except Exception as e:
+            if conn:
+                conn.rollback()
+            logger.info(f"Error purging document: {e}")
+            return False
+        finally:
+            if conn:
+                conn.close()
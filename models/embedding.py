@@ -1,130 +1,669 @@
+import json
+import math
+import re
+import struct
+import tempfile
+import time
+from contextlib import nullcontext
 import numpy as np
 import psycopg2
-from psycopg2.extras import execute_values, RealDictCursor
+from psycopg2.extras import RealDictCursor
 import uuid
-from db.database import get_db_connection
+from db.database import pooled_connection, IVFFLAT_LISTS, HNSW_MAX_EF_SEARCH
+from db.filters import compile_filter
+from db.queries import execute_prepared, vector_literal
+from models.cache import LRUCache
+from config import Config
 from custom_logger import logger
 
 class EmbeddingModel:
     """Model for embedding operations in the database"""
+
+    # First-pass distance expressions over the quantized indexes
+    COMPACT_DISTANCES = {
+        'halfvec': "c.{column}::halfvec({dim}) <=> %s::vector::halfvec({dim})",
+        'binary': "binary_quantize(c.{column})::bit({dim}) <~> binary_quantize(%s::vector)",
+    }
+
+    # Embedding column names are interpolated into SQL, so only these are accepted
+    COLUMN_PATTERN = re.compile(r'^embedding(_v\d+)?$')
     
-    def __init__(self):
-        pass
+    def __init__(self, precision=None, rescore_factor=None, dimension=None, strategy=None, coarse_documents=None):
+        """
+        Args:
+            precision (str, optional): 'full', 'halfvec' or 'binary', defaults to Config.EMBEDDING_PRECISION
+            rescore_factor (int, optional): Candidates fetched per result for quantized search
+            dimension (int, optional): Embedding dimension, defaults to Config.EMBEDDING_DIM
+            strategy (str, optional): 'flat' or 'coarse', defaults to Config.SEARCH_STRATEGY
+            coarse_documents (int, optional): Documents searched per query by the coarse strategy
+        """
+        self.precision = precision or Config.EMBEDDING_PRECISION
+        self.rescore_factor = rescore_factor or Config.RESCORE_FACTOR
+        self.strategy = strategy or Config.SEARCH_STRATEGY
+        # The centroid scan cannot return more than HNSW_MAX_EF_SEARCH documents
+        self.coarse_documents = min(coarse_documents or Config.COARSE_DOCUMENTS, HNSW_MAX_EF_SEARCH)
+        self.dimension = dimension or Config.EMBEDDING_DIM
+        self._active_version = None
+        self._active_version_checked = 0
+        # Chunk text never changes for a given chunk ID; titles are refreshed after a TTL
+        self.chunk_cache = LRUCache(Config.CHUNK_CACHE_SIZE)
+        self.title_cache = LRUCache(Config.TITLE_CACHE_SIZE, ttl=Config.TITLE_CACHE_TTL)
+        # (matching chunks, total chunks) per filter expression
+        self.filter_stats = LRUCache(Config.FILTER_STATS_CACHE_SIZE, ttl=Config.FILTER_STATS_TTL)
+        self._pgvector_version = None
+
+    def active_version(self):
+        """Embedding version currently used for search and ingestion
+
+        Cached for Config.EMBEDDING_VERSION_TTL seconds, so a cutover reaches
+        every worker within that time.
+
+        Returns:
+            dict: version, model_name, dimension and column_name
+        """
+        now = time.monotonic()
+        if self._active_version and now - self._active_version_checked < Config.EMBEDDING_VERSION_TTL:
+            return self._active_version
+
+        version = None
+        try:
+            with pooled_connection() as conn:
+                with conn.cursor(cursor_factory=RealDictCursor) as cur:
+                    cur.execute("""
+                        SELECT version, model_name, dimension, column_name
+                        FROM embedding_versions WHERE status = 'active'
+                    """)
+                    version = cur.fetchone()
+        except Exception as e:
+            logger.info(f"Error reading active embedding version: {e}")
+
+        if version and self.COLUMN_PATTERN.match(version['column_name']):
+            self._active_version = dict(version)
+        elif not self._active_version:
+            # Databases initialized before versioning only have the original column
+            self._active_version = {
+                'version': 1,
+                'model_name': Config.EMBEDDING_MODEL,
+                'dimension': self.dimension,
+                'column_name': 'embedding'
+            }
+        self._active_version_checked = now
+        return self._active_version
     
-    def create_chunks(self, doc_id, chunks, embeddings):
-        """Store document chunks and their embeddings
+    def create_chunks(self, doc_id, chunks, embeddings, version=None, start_index=0, centroid=True):
+        """Store document chunks and their embeddings, and the document's centroid
         
         Args:
             doc_id (str): Document ID
             chunks (list): List of text chunks
             embeddings (list): List of embedding vectors
+            version (dict, optional): Embedding version the vectors belong to, defaults to the active one
+            start_index (int): Index of the first chunk, for documents stored in parts
+            centroid (bool): Store the mean of these embeddings as the document's centroid;
+                documents stored in parts call upsert_centroid once all parts are in
             
         Returns:
-            bool: True if successful, False otherwise
+            bool: True if successful, False otherwise (also when the version was
+                retired by a migration meanwhile; active_version() then returns the new one)
         """
         if len(chunks) != len(embeddings):
             logger.info("Error: Number of chunks and embeddings must match")
             return False
         
-        conn = None
         try:
-            conn = get_db_connection()
+            column = (version or self.active_version())['column_name']
+            # One array per column, inserted by a single prepared statement
+            chunk_ids = [str(uuid.uuid4()) for _ in chunks]
+            vectors = [vector_literal(embedding) for embedding in embeddings]
             
-            # Prepare data for batch insert
-            chunk_data = []
-            for i, (chunk, embedding) in enumerate(zip(chunks, embeddings)):
-                chunk_id = str(uuid.uuid4())
-                chunk_data.append((chunk_id, doc_id, i, chunk, embedding.tolist()))
-            
-            with conn.cursor() as cur:
-                execute_values(
-                    cur,
-                    "INSERT INTO chunks (chunk_id, doc_id, chunk_index, text_content, embedding) VALUES %s",
-                    chunk_data,
-                    template="(%s, %s, %s, %s, %s)"
-                )
-            
-            conn.commit()
+            with pooled_connection() as conn:
+                with conn.cursor() as cur:
+                    execute_prepared(cur, 'insert_chunks', (
+                        chunk_ids, doc_id, list(range(start_index, start_index + len(chunks))), list(chunks), vectors
+                    ), column=column)
+                    # The insert's lock conflicts with the one activation takes, so a cutover
+                    # either waits for this commit (and sees these rows) or is visible here
+                    cur.execute("SELECT status FROM embedding_versions WHERE column_name = %s", (column,))
+                    status = cur.fetchone()
+                    if status and status[0] == 'retired':
+                        conn.rollback()
+                        self._active_version_checked = 0
+                        logger.info(f"Error: embedding column {column} was retired, chunks not stored")
+                        return False
+                    if centroid:
+                        # Cosine similarity ignores scale, so the plain mean serves as centroid
+                        mean = vector_literal(np.mean(np.asarray(embeddings, dtype=np.float32), axis=0))
+                        execute_prepared(cur, 'upsert_centroid', (doc_id, len(chunks), mean), column=column)
+                conn.commit()
             return True
         except Exception as e:
-            if conn:
-                conn.rollback()
             logger.info(f"Error storing chunks: {e}")
             return False
-        finally:
-            if conn:
-                conn.close()
+
+    def upsert_centroid(self, doc_id, centroid, chunk_count, version=None):
+        """Store a document's centroid
+        
+        Args:
+            doc_id (str): Document ID
+            centroid (list): Mean embedding of the document's chunks
+            chunk_count (int): Number of chunks the mean was taken over
+            version (dict, optional): Embedding version of the centroid, defaults to the active one
+            
+        Returns:
+            bool: True if successful, False otherwise
+        """
+        try:
+            column = (version or self.active_version())['column_name']
+            with pooled_connection() as conn:
+                with conn.cursor() as cur:
+                    execute_prepared(cur, 'upsert_centroid', (doc_id, chunk_count, vector_literal(centroid)), column=column)
+                conn.commit()
+            return True
+        except Exception as e:
+            logger.info(f"Error storing centroid: {e}")
+            return False
     
-    def search_similar(self, embedding, top_k=5, doc_id=None):
+    def search_similar(self, embedding, top_k=5, doc_id=None, precision=None, version=None, strategy=None,
+                       filters=None):
         """Search for chunks similar to the given embedding
         
         Args:
             embedding (list): Query embedding vector
             top_k (int): Number of results to return
             doc_id (str, optional): Limit search to specific document
+            precision (str, optional): Override the configured storage precision
+            version (dict, optional): Embedding version the query was encoded with,
+                defaults to the active one
+            strategy (str, optional): Override the configured search strategy. 'coarse'
+                only searches the chunks of the documents whose centroids are closest
+                to the query; it does not apply to single-document searches.
+            filters (dict, optional): Document filter expression, see db.filters.compile_filter
             
         Returns:
             list: List of dictionaries with chunk text, document title, and similarity score
         """
-        conn = None
+        version = version or self.active_version()
+        column = version['column_name']
+        precision = precision or self.precision
+        if filters:
+            return self._search_filtered(embedding, top_k, doc_id, filters, version)
+        if (strategy or self.strategy) == 'coarse' and not doc_id:
+            return self._search_coarse(embedding, top_k, version)
+        if precision in self.COMPACT_DISTANCES:
+            return self._search_rescored(embedding, top_k, doc_id, precision, version)
+
         try:
-            conn = get_db_connection()
-            embedding = embedding.tolist()
+            embedding = np.asarray(embedding, dtype=np.float32)
+            with pooled_connection() as conn:
+                with conn.cursor(cursor_factory=RealDictCursor) as cur:
+                    if doc_id:
+                        # Search only within the specified document
+                        execute_prepared(cur, 'search_similar_doc', (embedding, doc_id, top_k), column=column)
+                    else:
+                        # Search across all documents
+                        execute_prepared(cur, 'search_similar', (embedding, top_k), column=column)
+                    hits = cur.fetchall()
+            
+            return self.hydrate(hits)
+        except Exception as e:
+            logger.info(f"Error searching similar chunks: {e}")
+            return []
 
-            with conn.cursor(cursor_factory=RealDictCursor) as cur:
-                if doc_id:
-                    # Search only within the specified document
-                    cur.execute("""
-                        SELECT c.chunk_id, c.text_content, d.doc_id, d.title, 
-                               1 - (c.embedding <=> %s::vector) as similarity
+    def plan_filter(self, filters):
+        """Decide how to search the chunks of documents matching a filter expression
+
+        The number of matching chunks comes from the documents' indexes and
+        the chunk counts in document_centroids. It is cached per expression
+        for Config.FILTER_STATS_TTL seconds. The table size comes from the
+        planner statistics of chunks.
+
+        Args:
+            filters (dict): Document filter expression
+
+        Returns:
+            dict: predicate and params (SQL over documents d), matching_chunks,
+                total_chunks, selectivity, and strategy: 'exact' when few enough chunks match to
+                rank them all, 'ann' otherwise
+
+        Raises:
+            ValueError: If the expression is malformed
+        """
+        predicate, params = compile_filter(filters)
+        key = json.dumps(filters, sort_keys=True)
+        stats = self.filter_stats.get_many([key]).get(key)
+        if stats is None:
+            with pooled_connection() as conn:
+                with conn.cursor() as cur:
+                    cur.execute(f"""
+                        SELECT COALESCE(SUM(dc.chunk_count), 0),
+                               (SELECT GREATEST(reltuples, 0) FROM pg_class WHERE oid = 'chunks'::regclass)
+                        FROM documents d
+                        JOIN document_centroids dc ON dc.doc_id = d.doc_id
+                        WHERE d.deleted_at IS NULL AND {predicate}
+                    """, params)
+                    matching, total = cur.fetchone()
+            stats = (int(matching), int(total))
+            self.filter_stats.set_many({key: stats})
+
+        matching, total = stats
+        # Statistics lag behind inserts until the next ANALYZE
+        total = max(total, matching, 1)
+        return {
+            'predicate': predicate,
+            'params': params,
+            'matching_chunks': matching,
+            'total_chunks': total,
+            'selectivity': matching / total,
+            'strategy': 'exact' if matching <= Config.FILTER_EXACT_MAX_CHUNKS else 'ann',
+        }
+
+    def _search_filtered(self, embedding, top_k, doc_id, filters, version):
+        """Search only the chunks of documents matching a filter expression"""
+        try:
+            plan = self.plan_filter(filters)
+            column = version['column_name']
+            embedding = vector_literal(embedding)
+            where = f"d.deleted_at IS NULL AND ({plan['predicate']})"
+            params = list(plan['params'])
+            if doc_id:
+                where += " AND d.doc_id = %s"
+                params.append(doc_id)
+
+            with pooled_connection() as conn:
+                with conn.cursor(cursor_factory=RealDictCursor) as cur:
+                    if plan['strategy'] == 'exact' or doc_id:
+                        # Pre-filter through the documents indexes, then rank every matching chunk
+                        cur.execute(f"""
+                            WITH candidate_chunks AS MATERIALIZED (
+                                SELECT c.chunk_id, c.doc_id, c.{column} <=> %s::vector AS distance
+                                FROM documents d
+                                JOIN chunks c ON c.doc_id = d.doc_id
+                                WHERE {where}
+                            )
+                            SELECT chunk_id, doc_id, 1 - distance AS similarity
+                            FROM candidate_chunks
+                            ORDER BY distance
+                            LIMIT %s;
+                        """, [embedding] + params + [top_k])
+                        hits = cur.fetchall()
+                    else:
+                        hits = self._search_filtered_ann(cur, embedding, top_k, column, where, params, plan)
+
+            return self.hydrate(hits)
+        except Exception as e:
+            logger.info(f"Error searching similar chunks: {e}")
+            return []
+
+    def _search_filtered_ann(self, cur, embedding, top_k, column, where, params, plan):
+        """Walk the ANN index, filtering as it goes, until top_k chunks match
+
+        The index is asked for enough rows that top_k of them should pass the
+        filter. pgvector 0.8+ keeps scanning on its own (iterative scan); older
+        versions are retried with four times the probes until all lists are scanned.
+        """
+        probes = self._probes(top_k, plan)
+        iterative = self._scan_ivfflat(cur, probes)
+        while True:
+            cur.execute(f"""
+                WITH hits AS MATERIALIZED (
+                    SELECT c.chunk_id, c.doc_id, c.{column} <=> %s::vector AS distance
+                    FROM chunks c
+                    JOIN documents d ON c.doc_id = d.doc_id
+                    WHERE {where}
+                    ORDER BY c.{column} <=> %s::vector
+                    LIMIT %s
+                )
+                SELECT chunk_id, doc_id, 1 - distance AS similarity
+                FROM hits
+                ORDER BY distance;
+            """, [embedding] + params + [embedding, top_k])
+            hits = cur.fetchall()
+            if len(hits) >= top_k or iterative or probes >= IVFFLAT_LISTS:
+                return hits
+            probes = min(IVFFLAT_LISTS, probes * 4)
+            cur.execute("SET LOCAL ivfflat.probes = %s", (probes,))
+
+    def _probes(self, top_k, plan):
+        """ivfflat lists to probe for top_k rows to pass a filter, with a 2x margin"""
+        rows = 2 * top_k / max(plan['selectivity'], 1e-9)
+        return min(IVFFLAT_LISTS, max(1, math.ceil(rows * IVFFLAT_LISTS / plan['total_chunks'])))
+
+    def _scan_ivfflat(self, cur, probes):
+        """Configure the transaction's ivfflat scans for a filtered search
+
+        Returns:
+            bool: True if the index scan iterates until the LIMIT is filled
+        """
+        cur.execute("SET LOCAL ivfflat.probes = %s", (probes,))
+        if self._pgvector_version is None:
+            with cur.connection.cursor() as version_cur:
+                version_cur.execute("SELECT extversion FROM pg_extension WHERE extname = 'vector'")
+                extversion = version_cur.fetchone()[0]
+            self._pgvector_version = tuple(int(part) for part in re.findall(r'\d+', extversion)[:2])
+        if self._pgvector_version >= (0, 8):
+            cur.execute("SET LOCAL ivfflat.iterative_scan = relaxed_order")
+            return True
+        return False
+
+    def _search_coarse(self, embedding, top_k, version):
+        """Two-stage search: pick documents by centroid, rank their chunks exactly"""
+        try:
+            embedding = np.asarray(embedding, dtype=np.float32)
+            with pooled_connection() as conn:
+                with conn.cursor(cursor_factory=RealDictCursor) as cur:
+                    # hnsw only returns ef_search rows per scan
+                    cur.execute("SET LOCAL hnsw.ef_search = %s",
+                                (min(max(40, self.coarse_documents), HNSW_MAX_EF_SEARCH),))
+                    execute_prepared(cur, 'search_coarse', (embedding, self.coarse_documents, top_k),
+                                     column=version['column_name'])
+                    hits = cur.fetchall()
+
+            return self.hydrate(hits)
+        except Exception as e:
+            logger.info(f"Error searching similar chunks: {e}")
+            return []
+
+    def _search_rescored(self, embedding, top_k, doc_id, precision, version):
+        """Two-pass search: rank candidates on a quantized index, rescore at full precision"""
+        try:
+            embedding = np.asarray(embedding, dtype=np.float32).tolist()
+            # A scan cannot return more than HNSW_MAX_EF_SEARCH candidates
+            candidates = max(top_k, min(top_k * self.rescore_factor, HNSW_MAX_EF_SEARCH))
+            column = version['column_name']
+            # The candidate expression must match the index expression in db.database
+            distance = self.COMPACT_DISTANCES[precision].format(dim=version['dimension'], column=column)
+            doc_filter = "WHERE c.doc_id = %s" if doc_id else ""
+            params = [embedding] + ([doc_id] if doc_id else []) + [candidates, embedding, embedding, top_k]
+
+            with pooled_connection() as conn, conn.cursor(cursor_factory=RealDictCursor) as cur:
+                # hnsw only returns ef_search rows per scan
+                cur.execute("SET LOCAL hnsw.ef_search = %s", (min(max(40, candidates), HNSW_MAX_EF_SEARCH),))
+                cur.execute(f"""
+                    WITH candidates AS (
+                        SELECT c.chunk_id, c.doc_id, c.{column} AS embedding
                         FROM chunks c
-                        JOIN documents d ON c.doc_id = d.doc_id
-                        WHERE d.doc_id = %s
-                        ORDER BY c.embedding <=> %s::vector
-                        LIMIT %s;
-                    """, (embedding, doc_id, embedding, top_k))
-                else:
-                    # Search across all documents
-                    cur.execute("""
-                        SELECT c.chunk_id, c.text_content, d.doc_id, d.title, 
-                               1 - (c.embedding <=> %s::vector) as similarity
+                        {doc_filter}
+                        ORDER BY {distance}
+                        LIMIT %s
+                    )
+                    SELECT cand.chunk_id, cand.doc_id,
+                           1 - (cand.embedding <=> %s::vector) as similarity
+                    FROM candidates cand
+                    JOIN documents d ON cand.doc_id = d.doc_id
+                    WHERE d.deleted_at IS NULL
+                    ORDER BY cand.embedding <=> %s::vector
+                    LIMIT %s;
+                """, params)
+                hits = cur.fetchall()
+
+            return self.hydrate(hits)
+        except Exception as e:
+            logger.info(f"Error searching similar chunks: {e}")
+            return []
+    
+    def search_batch(self, embeddings, top_k=5, doc_id=None, metadata=None,
+                     min_similarity=None, window=0, version=None, filters=None):
+        """Search for chunks similar to several query embeddings in one round trip
+        
+        Args:
+            embeddings (list): Query embedding vectors
+            top_k (int): Number of results to return per query
+            doc_id (str, optional): Limit search to specific document
+            metadata (dict, optional): Only match documents whose metadata contains these key/values
+            min_similarity (float, optional): Drop results below this similarity
+            window (int): Number of neighbouring chunks on each side to include as context
+            version (dict, optional): Embedding version the queries were encoded with,
+                defaults to the active one
+            filters (dict, optional): Document filter expression, see db.filters.compile_filter
+            
+        Returns:
+            list: One list of result dictionaries per query embedding, in input order
+        """
+        if not len(embeddings):
+            return []
+
+        try:
+            column = (version or self.active_version())['column_name']
+            vectors = [vector_literal(embedding) for embedding in embeddings]
+
+            clauses = ["d.deleted_at IS NULL"]
+            filter_params = []
+            if doc_id:
+                clauses.append("c.doc_id = %s")
+                filter_params.append(doc_id)
+            if metadata:
+                clauses.append("d.metadata @> %s::jsonb")
+                filter_params.append(json.dumps(metadata))
+            plan = self.plan_filter(filters) if filters else None
+            if plan:
+                clauses.append(f"({plan['predicate']})")
+                filter_params.extend(plan['params'])
+
+            if plan and plan['strategy'] == 'exact':
+                # Selective filter: collect the matching chunks once, rank them exactly per query
+                candidates = f""", candidates AS MATERIALIZED (
+                        SELECT c.chunk_id, c.doc_id, c.chunk_index, c.{column} AS embedding
                         FROM chunks c
                         JOIN documents d ON c.doc_id = d.doc_id
-                        ORDER BY c.embedding <=> %s::vector
-                        LIMIT %s;
-                    """, (embedding, embedding, top_k))
-                
-                results = cur.fetchall()
-            
-            return [dict(result) for result in results]
+                        WHERE {" AND ".join(clauses)}
+                    )"""
+                source = "candidates c"
+                order_column = "c.embedding"
+                where = "TRUE"
+                # Parameters in the order their placeholders appear in the SQL
+                params = [vectors] + filter_params + [window, window, top_k, min_similarity, min_similarity]
+            else:
+                candidates = ""
+                source = "chunks c JOIN documents d ON c.doc_id = d.doc_id"
+                order_column = f"c.{column}"
+                where = " AND ".join(clauses)
+                params = [vectors, window, window] + filter_params + [top_k, min_similarity, min_similarity]
+
+            with pooled_connection() as conn, conn.cursor(cursor_factory=RealDictCursor) as cur:
+                if plan and plan['strategy'] == 'ann':
+                    self._scan_ivfflat(cur, self._probes(top_k, plan))
+                cur.execute(f"""
+                    WITH queries AS (
+                        SELECT q.ord, q.embedding::vector AS embedding
+                        FROM unnest(%s::text[]) WITH ORDINALITY AS q(embedding, ord)
+                    ){candidates}
+                    SELECT q.ord, h.chunk_id, h.doc_id, h.chunk_index, h.similarity,
+                           (SELECT string_agg(n.text_content, ' ' ORDER BY n.chunk_index)
+                            FROM chunks n
+                            WHERE n.doc_id = h.doc_id
+                              AND n.chunk_index BETWEEN h.chunk_index - %s AND h.chunk_index + %s) AS context
+                    FROM queries q
+                    CROSS JOIN LATERAL (
+                        SELECT c.chunk_id, c.doc_id, c.chunk_index,
+                               1 - ({order_column} <=> q.embedding) AS similarity
+                        FROM {source}
+                        WHERE {where}
+                        ORDER BY {order_column} <=> q.embedding
+                        LIMIT %s
+                    ) h
+                    WHERE %s::float IS NULL OR h.similarity >= %s
+                    ORDER BY q.ord, h.similarity DESC;
+                """, params)
+                rows = cur.fetchall()
+
+            results = [[] for _ in embeddings]
+            for row in self.hydrate(rows):
+                results[row.pop('ord') - 1].append(row)
+            return results
         except Exception as e:
             logger.info(f"Error searching similar chunks: {e}")
+            return [[] for _ in embeddings]
+
+    def hydrate(self, hits, check_live=False):
+        """Attach chunk text and document titles to search hits
+        
+        Text and titles come from the in-process caches where possible; the
+        rest is fetched in a single query. Hits whose document has been
+        deleted are dropped.
+        
+        Args:
+            hits (list): Dictionaries with at least chunk_id, doc_id and similarity, best first
+            check_live (bool): Check every hit's document is still live, for hits that
+                did not come from a query filtering deleted documents
+            
+        Returns:
+            list: The hits, in order, with text_content and title added
+        """
+        if not hits:
             return []
-        finally:
-            if conn:
-                conn.close()
-    
-    def delete_by_document(self, doc_id):
-        """Delete all chunks for a document
+
+        hits = [{**hit, 'chunk_id': str(hit['chunk_id']), 'doc_id': str(hit['doc_id'])} for hit in hits]
+        texts = self.chunk_cache.get_many([hit['chunk_id'] for hit in hits])
+        titles = {} if check_live else self.title_cache.get_many({hit['doc_id'] for hit in hits})
+
+        missing_chunks = {hit['chunk_id'] for hit in hits if hit['chunk_id'] not in texts}
+        missing_docs = {hit['doc_id'] for hit in hits
+                        if hit['doc_id'] not in titles or hit['chunk_id'] in missing_chunks}
+        if missing_docs:
+            fetched_texts, fetched_titles = {}, {}
+            with pooled_connection() as conn:
+                with conn.cursor() as cur:
+                    execute_prepared(cur, 'hydrate_chunks', (list(missing_docs), list(missing_chunks)))
+                    for doc_id, title, chunk_id, text_content in cur.fetchall():
+                        fetched_titles[str(doc_id)] = title
+                        if chunk_id:
+                            fetched_texts[str(chunk_id)] = text_content
+            self.chunk_cache.set_many(fetched_texts)
+            self.title_cache.set_many(fetched_titles)
+            texts.update(fetched_texts)
+            titles.update(fetched_titles)
+
+        results = []
+        for hit in hits:
+            if hit['chunk_id'] in texts and hit['doc_id'] in titles:
+                results.append({**hit, 'text_content': texts[hit['chunk_id']], 'title': titles[hit['doc_id']]})
+        return results
+
+    def prewarm(self, version=None):
+        """Read the tables and indexes searched for an embedding version into memory
+
+        With the pg_prewarm extension every relation is loaded into shared
+        buffers. Without it, one ivfflat scan probing every list reads the
+        chunks index instead, and the other relations stay cold.
+
+        Args:
+            version (dict, optional): Embedding version to warm, defaults to the active one
+
+        Returns:
+            dict: method ('pg_prewarm' or 'scan') and blocks loaded per relation, None on error
+        """
+        column = (version or self.active_version())['column_name']
+        relations = ['chunks', f'chunks_{column}_idx', 'documents', 'document_centroids',
+                     f'document_centroids_{column}_idx']
+        compact_index = {'halfvec': f'chunks_{column}_half_idx', 'binary': f'chunks_{column}_bin_idx'}
+        if self.precision in compact_index:
+            relations.append(compact_index[self.precision])
+
+        try:
+            with pooled_connection() as conn:
+                with conn.cursor() as cur:
+                    cur.execute("SELECT 1 FROM pg_extension WHERE extname = 'pg_prewarm'")
+                    if cur.fetchone():
+                        cur.execute("""
+                            SELECT relation, pg_prewarm(relation::regclass)
+                            FROM unnest(%s::text[]) AS relation
+                            WHERE to_regclass(relation) IS NOT NULL
+                        """, (relations,))
+                        return {'method': 'pg_prewarm', 'relations': dict(cur.fetchall())}
+
+                    cur.execute("SET LOCAL ivfflat.probes = %s", (IVFFLAT_LISTS,))
+                    cur.execute(f"""
+                        SELECT chunk_id FROM chunks
+                        WHERE {column} IS NOT NULL
+                        ORDER BY {column} <=> (SELECT {column} FROM chunks WHERE {column} IS NOT NULL LIMIT 1)
+                        LIMIT 1
+                    """)
+                    cur.fetchall()
+                    return {'method': 'scan', 'relations': {f'chunks_{column}_idx': None}}
+        except Exception as e:
+            logger.info(f"Error prewarming search indexes: {e}")
+            return None
+
+    def iter_embedding_blocks(self, batch_size=100000, version=None, conn=None):
+        """Stream the embeddings of all chunks of live documents in blocks
+
+        Rows are read with a binary COPY, so vectors arrive as raw float4s
+        rather than text to parse. The COPY is spooled to a temporary file
+        and read back `batch_size` rows at a time. Rows come grouped by
+        document, in chunk order.
+
+        Args:
+            batch_size (int): Rows per block
+            version (dict, optional): Embedding version to read, defaults to the active one
+            conn (optional): Connection to read with, e.g. one holding a snapshot
+                transaction, defaults to a pooled one
+
+        Yields:
+            tuple: (chunk_ids, doc_ids, float32 matrix with one row per chunk)
+        """
+        version = version or self.active_version()
+        column = version['column_name']
+        # Every row has the same layout: field count, two uuids and a
+        # pgvector (int16 dimension, int16 unused, big-endian float4s)
+        row_type = np.dtype([
+            ('fields', '>i2'),
+            ('chunk_id_length', '>i4'), ('chunk_id', 'V16'),
+            ('doc_id_length', '>i4'), ('doc_id', 'V16'),
+            ('vector_length', '>i4'), ('dimension', '>i2'), ('unused', '>i2'),
+            ('embedding', '>f4', (version['dimension'],)),
+        ])
+        with tempfile.TemporaryFile() as spool:
+            with nullcontext(conn) if conn else pooled_connection() as conn:
+                with conn.cursor() as cur:
+                    cur.copy_expert(f"""
+                        COPY (
+                            SELECT c.chunk_id, c.doc_id, c.{column}
+                            FROM chunks c
+                            JOIN documents d ON c.doc_id = d.doc_id
+                            WHERE d.deleted_at IS NULL AND c.{column} IS NOT NULL
+                            ORDER BY c.doc_id, c.chunk_index
+                        ) TO STDOUT WITH (FORMAT binary)
+                    """, spool)
+
+            # Signature, flags, then a header extension of the given length
+            spool.seek(15)
+            (extension,) = struct.unpack('>i', spool.read(4))
+            spool.seek(19 + extension)
+            while True:
+                rows = np.fromfile(spool, dtype=row_type, count=batch_size)
+                # The trailer is a lone int16 -1, shorter than a row
+                if not len(rows):
+                    break
+                yield ([str(uuid.UUID(bytes=value.tobytes())) for value in rows['chunk_id']],
+                       [str(uuid.UUID(bytes=value.tobytes())) for value in rows['doc_id']],
+                       rows['embedding'].astype(np.float32))
+
+    def delete_by_document(self, doc_id, batch_size=None):
+        """Delete chunks for a document
         
         Args:
             doc_id (str): Document ID
+            batch_size (int, optional): Delete at most this many chunks in one
+                short transaction instead of all of them at once
             
         Returns:
-            bool: True if successful, False otherwise
+            int: Number of chunks deleted, None on error
         """
-        conn = None
         try:
-            conn = get_db_connection()
-            with conn.cursor() as cur:
-                cur.execute("DELETE FROM chunks WHERE doc_id = %s", (doc_id,))
-            conn.commit()
-            return True
+            with pooled_connection() as conn:
+                with conn.cursor() as cur:
+                    if batch_size:
+                        cur.execute("""
+                            DELETE FROM chunks WHERE chunk_id IN (
+                                SELECT chunk_id FROM chunks WHERE doc_id = %s LIMIT %s
+                            )
+                        """, (doc_id, batch_size))
+                    else:
+                        cur.execute("DELETE FROM chunks WHERE doc_id = %s", (doc_id,))
+                    rows_deleted = cur.rowcount
+                conn.commit()
+            return rows_deleted
         except Exception as e:
-            if conn:
-                conn.rollback()
+            # Uncommitted work is rolled back when the connection returns to the pool
             logger.info(f"Error deleting chunks: {e}")
-            return False
-        finally:
-            if conn:
-                conn.close()
\ No newline at end of file
+            return None
@@ -0,0 +1,250 @@
+import psycopg2
+from psycopg2.extras import RealDictCursor
+from db.database import get_db_connection, create_vector_indexes, build_document_centroids
+from db.queries import vector_literal
+from custom_logger import logger
+
+class EmbeddingVersionModel:
+    """Model for embedding versions and their backfill in the database"""
+
+    def __init__(self):
+        pass
+
+    def list_all(self):
+        """List all embedding versions, newest first
+
+        Returns:
+            list: List of version dictionaries
+        """
+        conn = None
+        try:
+            conn = get_db_connection()
+            with conn.cursor(cursor_factory=RealDictCursor) as cur:
+                cur.execute("SELECT * FROM embedding_versions ORDER BY version DESC")
+                versions = cur.fetchall()
+            return [dict(version) for version in versions]
+        except Exception as e:
+            logger.info(f"Error listing embedding versions: {e}")
+            return []
+        finally:
+            if conn:
+                conn.close()
+
+    def get(self, version):
+        """Get an embedding version by number
+
+        Args:
+            version (int): Version number
+
+        Returns:
+            dict: Version details or None if not found
+        """
+        conn = None
+        try:
+            conn = get_db_connection()
+            with conn.cursor(cursor_factory=RealDictCursor) as cur:
+                cur.execute("SELECT * FROM embedding_versions WHERE version = %s", (version,))
+                row = cur.fetchone()
+            return dict(row) if row else None
+        except Exception as e:
+            logger.info(f"Error retrieving embedding version: {e}")
+            return None
+        finally:
+            if conn:
+                conn.close()
+
+    def create(self, model_name, dimension):
+        """Register a new embedding version and add its (empty) columns to chunks and document_centroids
+
+        Adding a nullable column without a default is a catalog-only change,
+        so it does not rewrite the table.
+
+        Args:
+            model_name (str): Sentence transformer model name
+            dimension (int): Embedding dimension of the model
+
+        Returns:
+            dict: The new version, None on error
+        """
+        conn = None
+        try:
+            conn = get_db_connection()
+            with conn.cursor(cursor_factory=RealDictCursor) as cur:
+                cur.execute("""
+                    INSERT INTO embedding_versions (model_name, dimension, column_name, status, total_chunks)
+                    VALUES (%s, %s, '', 'backfilling', (SELECT COUNT(*) FROM chunks))
+                    RETURNING version
+                """, (model_name, dimension))
+                version = cur.fetchone()['version']
+                column = f"embedding_v{version}"
+                cur.execute(f"ALTER TABLE chunks ADD COLUMN {column} vector({int(dimension)})")
+                cur.execute(f"ALTER TABLE document_centroids ADD COLUMN {column} vector({int(dimension)})")
+                cur.execute(
+                    "UPDATE embedding_versions SET column_name = %s WHERE version = %s RETURNING *",
+                    (column, version)
+                )
+                row = cur.fetchone()
+            conn.commit()
+            return dict(row)
+        except Exception as e:
+            if conn:
+                conn.rollback()
+            logger.info(f"Error creating embedding version: {e}")
+            return None
+        finally:
+            if conn:
+                conn.close()
+
+    def next_batch(self, version, batch_size):
+        """Fetch chunks that have no embedding for this version yet
+
+        Args:
+            version (dict): Embedding version
+            batch_size (int): Maximum number of chunks
+
+        Returns:
+            list: (chunk_id, text_content) tuples
+        """
+        conn = None
+        try:
+            conn = get_db_connection()
+            with conn.cursor() as cur:
+                cur.execute(f"""
+                    SELECT chunk_id, text_content FROM chunks
+                    WHERE {version['column_name']} IS NULL
+                    LIMIT %s
+                """, (batch_size,))
+                rows = cur.fetchall()
+            return [(str(chunk_id), text) for chunk_id, text in rows]
+        except Exception as e:
+            logger.info(f"Error fetching backfill batch: {e}")
+            return []
+        finally:
+            if conn:
+                conn.close()
+
+    def store_batch(self, version, chunk_ids, embeddings, chunks_per_sec=None):
+        """Write re-encoded embeddings for a batch of chunks and record progress
+
+        Args:
+            version (dict): Embedding version
+            chunk_ids (list): Chunk IDs
+            embeddings (list): Embedding vectors, in the same order
+            chunks_per_sec (float, optional): Current backfill throughput
+
+        Returns:
+            bool: True if successful, False otherwise
+        """
+        conn = None
+        try:
+            conn = get_db_connection()
+            with conn.cursor() as cur:
+                cur.execute(f"""
+                    UPDATE chunks c SET {version['column_name']} = u.embedding::vector
+                    FROM unnest(%s::uuid[], %s::text[]) AS u(chunk_id, embedding)
+                    WHERE c.chunk_id = u.chunk_id
+                """, (chunk_ids, [vector_literal(embedding) for embedding in embeddings]))
+                cur.execute("""
+                    UPDATE embedding_versions
+                    SET backfilled_chunks = backfilled_chunks + %s,
+                        chunks_per_sec = COALESCE(%s, chunks_per_sec)
+                    WHERE version = %s
+                """, (len(chunk_ids), chunks_per_sec, version['version']))
+            conn.commit()
+            return True
+        except Exception as e:
+            if conn:
+                conn.rollback()
+            logger.info(f"Error storing backfill batch: {e}")
+            return False
+        finally:
+            if conn:
+                conn.close()
+
+    def build_centroids(self, version):
+        """Compute the version's document centroids for documents whose chunks are all backfilled
+
+        Args:
+            version (dict): Embedding version
+
+        Returns:
+            int: Number of centroids written, None on error
+        """
+        conn = None
+        try:
+            conn = get_db_connection()
+            with conn.cursor() as cur:
+                written = build_document_centroids(cur, version['column_name'])
+            conn.commit()
+            return written
+        except Exception as e:
+            if conn:
+                conn.rollback()
+            logger.info(f"Error building document centroids: {e}")
+            return None
+        finally:
+            if conn:
+                conn.close()
+
+    def build_indexes(self, version):
+        """Build the search indexes for a version's column without blocking writes
+
+        Args:
+            version (dict): Embedding version
+
+        Returns:
+            bool: True if successful, False otherwise
+        """
+        conn = None
+        try:
+            conn = get_db_connection()
+            # CREATE INDEX CONCURRENTLY cannot run inside a transaction block
+            conn.autocommit = True
+            with conn.cursor() as cur:
+                create_vector_indexes(cur, version['dimension'], version['column_name'], concurrently=True)
+            return True
+        except Exception as e:
+            logger.info(f"Error building indexes for embedding version: {e}")
+            return False
+        finally:
+            if conn:
+                conn.close()
+
+    def activate(self, version):
+        """Atomically switch search and ingestion to a fully backfilled version
+
+        Chunk writes are blocked for the duration of the check so no chunk
+        without a vector for the new version can slip in before the switch.
+
+        Args:
+            version (dict): Embedding version
+
+        Returns:
+            bool: True if the version is now active, False if chunks are still missing or on error
+        """
+        conn = None
+        try:
+            conn = get_db_connection()
+            with conn.cursor() as cur:
+                cur.execute("LOCK TABLE chunks IN SHARE MODE")
+                cur.execute(
+                    f"SELECT EXISTS (SELECT 1 FROM chunks WHERE {version['column_name']} IS NULL)"
+                )
+                if cur.fetchone()[0]:
+                    conn.rollback()
+                    return False
+                cur.execute("UPDATE embedding_versions SET status = 'retired' WHERE status = 'active'")
+                cur.execute(
+                    "UPDATE embedding_versions SET status = 'active', activated_at = now() WHERE version = %s",
+                    (version['version'],)
+                )
+            conn.commit()
+            return True
+        except Exception as e:
+            if conn:
+                conn.rollback()
+            logger.info(f"Error activating embedding version: {e}")
+            return False
+        finally:
+            if conn:
+                conn.close()
@@ -0,0 +1,168 @@
+import functools
+import math
+import os
+import sqlite3
+import time
+import uuid
+from flask import jsonify, make_response, request
+from config import Config
+from custom_logger import logger
+
+class AdmissionController:
+    """
+    Cost-aware admission control shared by all workers on a host
+
+    Each route class has a token bucket refilled at `rate` cost units per
+    second up to `burst`, and a cap on concurrently running requests. State
+    lives in a small SQLite file so every gunicorn worker sees the same
+    buckets and in-flight counts.
+    """
+
+    def __init__(self, db_path, policies, lease_timeout=300):
+        """
+        Initialize the admission controller
+
+        Args:
+            db_path (str): Path of the SQLite file holding shared state
+            policies (dict): Route class -> {'rate', 'burst', 'concurrency'}
+            lease_timeout (float): Seconds after which an unreleased slot is
+                considered leaked (e.g. the worker was killed) and reclaimed
+        """
+        self.db_path = db_path
+        self.policies = policies
+        self.lease_timeout = lease_timeout
+
+        db_dir = os.path.dirname(db_path)
+        if db_dir:
+            os.makedirs(db_dir, exist_ok=True)
+        with self._connect() as conn:
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("CREATE TABLE IF NOT EXISTS buckets (name TEXT PRIMARY KEY, tokens REAL, updated REAL)")
+            conn.execute("CREATE TABLE IF NOT EXISTS slots (slot_id TEXT PRIMARY KEY, name TEXT, started REAL)")
+
+    def _connect(self):
+        return sqlite3.connect(self.db_path, timeout=5, isolation_level=None)
+
+    def try_acquire(self, name, cost):
+        """
+        Try to admit a request of the given cost
+
+        Args:
+            name (str): Route class
+            cost (float): Estimated cost in bucket units
+
+        Returns:
+            tuple: (slot_id, None, None) when admitted, otherwise
+                (None, HTTP status, retry-after seconds)
+        """
+        policy = self.policies[name]
+        # A request costlier than the whole bucket could never be admitted otherwise
+        cost = min(cost, policy['burst'])
+        now = time.time()
+
+        conn = self._connect()
+        try:
+            conn.execute("BEGIN IMMEDIATE")
+            conn.execute("DELETE FROM slots WHERE started < ?", (now - self.lease_timeout,))
+            in_flight = conn.execute("SELECT COUNT(*) FROM slots WHERE name = ?", (name,)).fetchone()[0]
+            if in_flight >= policy['concurrency']:
+                conn.execute("ROLLBACK")
+                return None, 503, 1
+
+            row = conn.execute("SELECT tokens, updated FROM buckets WHERE name = ?", (name,)).fetchone()
+            tokens = policy['burst'] if row is None else min(
+                policy['burst'], row[0] + (now - row[1]) * policy['rate']
+            )
+            if tokens < cost:
+                conn.execute("ROLLBACK")
+                return None, 429, math.ceil((cost - tokens) / policy['rate'])
+
+            slot_id = uuid.uuid4().hex
+            conn.execute("INSERT OR REPLACE INTO buckets (name, tokens, updated) VALUES (?, ?, ?)",
+                         (name, tokens - cost, now))
+            conn.execute("INSERT INTO slots (slot_id, name, started) VALUES (?, ?, ?)", (slot_id, name, now))
+            conn.execute("COMMIT")
+            return slot_id, None, None
+        except Exception as e:
+            # Fail open: admission control must not take the API down with it
+            logger.info(f"Error in admission control: {e}")
+            if conn.in_transaction:
+                conn.execute("ROLLBACK")
+            return "", None, None
+        finally:
+            conn.close()
+
+    def release(self, slot_id):
+        """Free a concurrency slot taken by try_acquire"""
+        if not slot_id:
+            return
+        conn = self._connect()
+        try:
+            conn.execute("DELETE FROM slots WHERE slot_id = ?", (slot_id,))
+        except Exception as e:
+            logger.info(f"Error releasing admission slot: {e}")
+        finally:
+            conn.close()
+
+    def admit(self, name, cost_fn=None):
+        """
+        Decorator for Flask views that rejects requests fast when over budget
+
+        The slot is held until the response is closed, so streamed responses
+        count against the concurrency cap until the stream ends.
+
+        Args:
+            name (str): Route class
+            cost_fn (callable, optional): Maps the current request to a cost, defaults to 1
+        """
+        def decorator(view):
+            @functools.wraps(view)
+            def wrapper(*args, **kwargs):
+                cost = cost_fn(request) if cost_fn else 1
+                slot_id, status, retry_after = self.try_acquire(name, cost)
+                if slot_id is None:
+                    error = 'Server busy' if status == 503 else 'Request budget exceeded'
+                    response = make_response(jsonify({'error': error, 'retry_after': retry_after}), status)
+                    response.headers['Retry-After'] = str(retry_after)
+                    return response
+                try:
+                    response = make_response(view(*args, **kwargs))
+                except Exception:
+                    self.release(slot_id)
+                    raise
+                response.call_on_close(lambda: self.release(slot_id))
+                return response
+            return wrapper
+        return decorator
+
+
+def _clamp(value, low, high):
+    return min(max(value, low), high)
+
+# Costs are computed from values clamped to what the views accept, so a
+# malformed request is rejected with 400 instead of draining the bucket
+
+def question_cost(req):
+    """Questions cost more the more context the reader has to scan"""
+    data = req.get_json(silent=True) or {}
+    try:
+        top_k = _clamp(int(data.get('top_k', 5)), 1, Config.SEARCH_MAX_TOP_K)
+    except (TypeError, ValueError):
+        top_k = 5
+    return 1 + 0.25 * top_k + len(str(data.get('question', ''))) / 1000
+
+def search_cost(req):
+    """Retrieval cost scales with the number of queries and results"""
+    data = req.get_json(silent=True) or {}
+    queries = data.get('queries') or [data.get('query')]
+    count = _clamp(len(queries) if isinstance(queries, list) else 1, 1, Config.SEARCH_MAX_QUERIES)
+    try:
+        top_k = _clamp(int(data.get('top_k', 5)), 1, Config.SEARCH_MAX_TOP_K)
+        window = _clamp(int(data.get('window', 0)), 0, Config.SEARCH_MAX_WINDOW)
+    except (TypeError, ValueError):
+        top_k, window = 5, 0
+    return count * (0.2 + 0.02 * top_k * (1 + 2 * window))
+
+def upload_cost(req):
+    """Ingestion cost scales with body size, a proxy for pages and chunk count"""
+    return 1 + (req.content_length or 0) / (256 * 1024)
@@ -0,0 +1,137 @@
+import argparse
+import time
+from sentence_transformers import SentenceTransformer
+from models.embedding_version import EmbeddingVersionModel
+from config import Config
+from custom_logger import logger
+
+class EmbeddingMigration:
+    """Re-encode every chunk with a new embedding model, then cut search over to it"""
+
+    def __init__(self, version_model, encoder, batch_size=256, max_chunks_per_sec=None):
+        """
+        Initialize the migration
+
+        Args:
+            version_model: Model for embedding version operations
+            encoder: Object with an encode(list of str) method, e.g. a SentenceTransformer
+            batch_size (int): Chunks re-encoded and written per batch
+            max_chunks_per_sec (float, optional): Throttle so live traffic keeps its share
+                of the database and CPU; unthrottled when None
+        """
+        self.version_model = version_model
+        self.encoder = encoder
+        self.batch_size = batch_size
+        self.max_chunks_per_sec = max_chunks_per_sec
+
+    def backfill(self, version):
+        """
+        Fill the version's column for every chunk that lacks it
+
+        Chunks ingested during the backfill are written to the active column
+        only, so they are picked up by later batches. Document centroids are
+        computed once all of a document's chunks have been re-encoded.
+
+        Args:
+            version (dict): Embedding version
+
+        Returns:
+            int: Number of chunks re-encoded
+        """
+        done = 0
+        started = time.monotonic()
+        while True:
+            batch = self.version_model.next_batch(version, self.batch_size)
+            if not batch:
+                break
+
+            batch_started = time.monotonic()
+            chunk_ids = [chunk_id for chunk_id, _ in batch]
+            embeddings = self.encoder.encode([text for _, text in batch])
+            done += len(batch)
+            chunks_per_sec = done / max(time.monotonic() - started, 1e-9)
+            if not self.version_model.store_batch(version, chunk_ids, embeddings, chunks_per_sec):
+                break
+
+            total = max(version['total_chunks'], done)
+            logger.info(f"backfill v{version['version']}: {done}/{total} chunks "
+                        f"({100 * done / total:.1f}%), {chunks_per_sec:.0f} chunks/s")
+
+            if self.max_chunks_per_sec:
+                # Sleep off whatever time the batch saved against the rate limit
+                min_duration = len(batch) / self.max_chunks_per_sec
+                time.sleep(max(0, min_duration - (time.monotonic() - batch_started)))
+
+        centroids = self.version_model.build_centroids(version)
+        logger.info(f"backfill v{version['version']}: {centroids} document centroids computed")
+        return done
+
+    def run(self, version, attempts=5):
+        """
+        Backfill, build indexes, then activate the version
+
+        Activation is retried after another backfill pass when new chunks
+        arrived between the last batch and the cutover. Workers that still
+        cache the previous version have their inserts into the retired
+        column refused and re-encode the document for this one; one final
+        pass runs after the cache expires to catch anything left behind.
+
+        Args:
+            version (dict): Embedding version
+            attempts (int): Cutover attempts before giving up
+
+        Returns:
+            bool: True if the version was activated
+        """
+        self.backfill(version)
+        logger.info(f"building indexes for {version['column_name']}")
+        if not self.version_model.build_indexes(version):
+            return False
+
+        for _ in range(attempts):
+            if self.version_model.activate(version):
+                logger.info(f"embedding version {version['version']} ({version['model_name']}) is now active")
+                time.sleep(Config.EMBEDDING_VERSION_TTL)
+                self.backfill(version)
+                return True
+            self.backfill(version)
+        logger.info(f"Error: embedding version {version['version']} could not be activated")
+        return False
+
+
+def _print_status(version_model):
+    for version in version_model.list_all():
+        total = version['total_chunks'] or 0
+        done = version['backfilled_chunks'] or 0
+        progress = f"{done}/{total}" if version['status'] == 'backfilling' else ""
+        print(f"v{version['version']:<3} {version['status']:<12} {version['model_name']:<50} "
+              f"dim={version['dimension']:<5} {progress} {version['chunks_per_sec'] or 0:.0f} chunks/s")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Online migration of chunk embeddings to a new model")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+    start = subparsers.add_parser("start", help="create a new version and backfill it")
+    start.add_argument("model_name")
+    resume = subparsers.add_parser("resume", help="continue backfilling an existing version")
+    resume.add_argument("version", type=int)
+    for sub in (start, resume):
+        sub.add_argument("--batch-size", type=int, default=Config.BACKFILL_BATCH_SIZE)
+        sub.add_argument("--max-rate", type=float, default=Config.BACKFILL_MAX_RATE,
+                         help="chunks per second, 0 for unthrottled")
+    subparsers.add_parser("status", help="show versions and backfill progress")
+    args = parser.parse_args()
+
+    version_model = EmbeddingVersionModel()
+    if args.command == "status":
+        _print_status(version_model)
+    else:
+        if args.command == "start":
+            encoder = SentenceTransformer(args.model_name)
+            version = version_model.create(args.model_name, encoder.get_sentence_embedding_dimension())
+        else:
+            version = version_model.get(args.version)
+            encoder = SentenceTransformer(version['model_name']) if version else None
+        if version:
+            migration = EmbeddingMigration(version_model, encoder, args.batch_size, args.max_rate or None)
+            migration.run(version)
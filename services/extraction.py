@@ -0,0 +1,238 @@
+import os
+import re
+import shutil
+import subprocess
+from html.parser import HTMLParser
+from PyPDF2 import PdfReader
+from config import Config
+from custom_logger import logger
+
+# Native PDF libraries are optional; backends without their library are skipped
+try:
+    import pypdfium2
+except ImportError:
+    pypdfium2 = None
+
+try:
+    import pymupdf
+except ImportError:
+    try:
+        import fitz as pymupdf
+    except ImportError:
+        pymupdf = None
+
+
+class TextExtractor:
+    """Base class for text extraction backends"""
+
+    name = None
+    extensions = ()
+
+    def available(self):
+        """Whether the backend's library or tool is installed"""
+        return True
+
+    def extract(self, path):
+        """
+        Extract the text of a file
+
+        Args:
+            path (str): File path
+
+        Returns:
+            list: Text of each page (a single item for unpaginated formats)
+        """
+        raise NotImplementedError
+
+
+class PyPDF2Extractor(TextExtractor):
+    """Pure-Python extraction with PyPDF2; slow, but always installed"""
+
+    name = 'pypdf2'
+    extensions = ('.pdf',)
+
+    def extract(self, path):
+        return [page.extract_text() or "" for page in PdfReader(path).pages]
+
+
+class PdfiumExtractor(TextExtractor):
+    """Native extraction with pdfium (pypdfium2)"""
+
+    name = 'pdfium'
+    extensions = ('.pdf',)
+
+    def available(self):
+        return pypdfium2 is not None
+
+    def extract(self, path):
+        pdf = pypdfium2.PdfDocument(path)
+        try:
+            pages = []
+            for page in pdf:
+                textpage = page.get_textpage()
+                pages.append(textpage.get_text_range())
+                textpage.close()
+                page.close()
+            return pages
+        finally:
+            pdf.close()
+
+
+class PyMuPDFExtractor(TextExtractor):
+    """Native extraction with MuPDF (PyMuPDF)"""
+
+    name = 'pymupdf'
+    extensions = ('.pdf',)
+
+    def available(self):
+        return pymupdf is not None
+
+    def extract(self, path):
+        with pymupdf.open(path) as pdf:
+            return [page.get_text() for page in pdf]
+
+
+class PdftotextExtractor(TextExtractor):
+    """Native extraction with poppler's pdftotext command line tool"""
+
+    name = 'pdftotext'
+    extensions = ('.pdf',)
+
+    def available(self):
+        return shutil.which('pdftotext') is not None
+
+    def extract(self, path):
+        result = subprocess.run(['pdftotext', '-enc', 'UTF-8', path, '-'],
+                                capture_output=True, check=True, timeout=300)
+        # Pages are separated by form feeds, with one after the last page
+        return result.stdout.decode('utf-8', errors='replace').split('\f')[:-1]
+
+
+class PlainTextExtractor(TextExtractor):
+    """Plain text and markdown files are used as they are"""
+
+    name = 'text'
+    extensions = ('.txt', '.md', '.markdown')
+
+    def extract(self, path):
+        with open(path, encoding='utf-8', errors='replace') as f:
+            return [f.read()]
+
+
+class _HTMLText(HTMLParser):
+    """Collects the visible text of an HTML document"""
+
+    SKIP = {'script', 'style', 'head', 'noscript', 'template'}
+
+    def __init__(self):
+        super().__init__()
+        self.parts = []
+        self._skipping = 0
+
+    def handle_starttag(self, tag, attrs):
+        if tag in self.SKIP:
+            self._skipping += 1
+        # Keep words of adjacent block elements apart
+        self.parts.append(" ")
+
+    def handle_endtag(self, tag):
+        if tag in self.SKIP and self._skipping:
+            self._skipping -= 1
+        self.parts.append(" ")
+
+    def handle_data(self, data):
+        if not self._skipping:
+            self.parts.append(data)
+
+
+class HTMLExtractor(TextExtractor):
+    """Visible text of HTML files, without scripts and styles"""
+
+    name = 'html'
+    extensions = ('.html', '.htm')
+
+    def extract(self, path):
+        parser = _HTMLText()
+        with open(path, encoding='utf-8', errors='replace') as f:
+            parser.feed(f.read())
+        parser.close()
+        return ["".join(parser.parts)]
+
+
+EXTRACTORS = {extractor.name: extractor for extractor in (
+    PdfiumExtractor(), PyMuPDFExtractor(), PdftotextExtractor(), PyPDF2Extractor(),
+    PlainTextExtractor(), HTMLExtractor(),
+)}
+
+
+class DocumentExtractor:
+    """Extract normalized text from uploaded documents with the configured backends"""
+
+    def __init__(self, pdf_backends=None):
+        """
+        Args:
+            pdf_backends (list, optional): PDF backend names in order of preference,
+                defaults to Config.PDF_BACKENDS. Unavailable backends are skipped, and
+                the next one is tried when a backend fails or finds no text.
+        """
+        self.pdf_backends = pdf_backends or Config.PDF_BACKENDS
+
+    def supports(self, filename):
+        """Whether files with this name can be ingested"""
+        extension = os.path.splitext(filename)[1].lower()
+        return any(extension in extractor.extensions for extractor in EXTRACTORS.values())
+
+    def backends_for(self, path):
+        """Available extractors for a file, in the order they are tried"""
+        extension = os.path.splitext(path)[1].lower()
+        names = self.pdf_backends if extension == '.pdf' else EXTRACTORS
+        return [EXTRACTORS[name] for name in names
+                if name in EXTRACTORS and extension in EXTRACTORS[name].extensions
+                and EXTRACTORS[name].available()]
+
+    def count_pages(self, path):
+        """
+        Count the pages of a PDF without extracting its text
+
+        Args:
+            path (str): File path
+
+        Returns:
+            int: Page count, None for unpaginated formats or unreadable files
+        """
+        if os.path.splitext(path)[1].lower() != '.pdf':
+            return None
+        try:
+            if pypdfium2 is not None:
+                pdf = pypdfium2.PdfDocument(path)
+                try:
+                    return len(pdf)
+                finally:
+                    pdf.close()
+            return len(PdfReader(path).pages)
+        except Exception as e:
+            logger.info(f"Error counting pages of {path}: {e}")
+            return None
+
+    def extract(self, path):
+        """
+        Extract the text of a document
+
+        Args:
+            path (str): File path
+
+        Returns:
+            tuple: (text with whitespace collapsed, page count, backend name),
+                (None, 0, None) if no backend produced any text
+        """
+        for extractor in self.backends_for(path):
+            try:
+                pages = extractor.extract(path)
+            except Exception as e:
+                logger.info(f"Error extracting text with {extractor.name}: {e}")
+                continue
+            text = re.sub(r'\s+', ' ', " ".join(pages)).strip()
+            if text:
+                return text, len(pages), extractor.name
+            logger.info(f"{extractor.name} found no text in {path}")
+        return None, 0, None
@@ -0,0 +1,463 @@
+import atexit
+import itertools
+import multiprocessing
+import os
+import queue
+import signal
+import subprocess
+import sys
+import threading
+import time
+import numpy as np
+from multiprocessing import resource_tracker
+from multiprocessing.connection import Client, Listener
+from multiprocessing.shared_memory import SharedMemory
+from custom_logger import logger
+
+
+def _attach(name):
+    """Attach to a client's shared memory without taking ownership of it"""
+    try:
+        return SharedMemory(name=name, track=False)
+    except TypeError:
+        # Before Python 3.13 attaching registers the block with our resource
+        # tracker, which would unlink it when this process exits
+        shm = SharedMemory(name=name)
+        resource_tracker.unregister(shm._name, 'shared_memory')
+        return shm
+
+
+class _InferenceWorker:
+    """Models of one inference process and the per-connection request loop"""
+
+    def __init__(self, qa_model_name, embedding_model_name):
+        self.qa_model_name = qa_model_name
+        self.embedding_model_name = embedding_model_name
+        self._encoders = {}
+        self._qa_pipelines = {}
+        # Jobs run one at a time; each already uses every thread this process is given
+        self._lock = threading.Lock()
+
+    def encoder(self, model_name):
+        if model_name not in self._encoders:
+            from sentence_transformers import SentenceTransformer
+            logger.info(f"Loading embedding model: {model_name}")
+            self._encoders[model_name] = SentenceTransformer(model_name)
+        return self._encoders[model_name]
+
+    def qa_pipeline(self, model_name):
+        if model_name not in self._qa_pipelines:
+            from transformers import pipeline
+            logger.info(f"Loading QA model: {model_name}")
+            self._qa_pipelines[model_name] = pipeline('question-answering', model=model_name)
+        return self._qa_pipelines[model_name]
+
+    def serve(self, conn):
+        """Answer requests from one client connection until it closes"""
+        attached = {}
+        pending = None
+        try:
+            while True:
+                request = conn.recv()
+                op = request[0]
+                try:
+                    if op == 'encode':
+                        _, model_name, texts, shm_name, options = request
+                        with self._lock:
+                            pending = np.asarray(self.encoder(model_name).encode(texts, **options), dtype=np.float32)
+                        reply = self._write(attached, shm_name, pending)
+                    elif op == 'fetch':
+                        # The client grew its buffer after a 'grow' reply
+                        reply = self._write(attached, request[1], pending)
+                    elif op == 'qa':
+                        _, model_name, question, context = request
+                        with self._lock:
+                            result = self.qa_pipeline(model_name)(question=question, context=context)
+                        # Offsets into the context locate the answer (answer_span)
+                        reply = ('ok', {'answer': result['answer'], 'score': float(result['score']),
+                                        'start': result.get('start'), 'end': result.get('end')})
+                    elif op == 'ping':
+                        reply = ('ok', os.getpid())
+                    else:
+                        reply = ('error', f"unknown operation {op}")
+                except Exception as e:
+                    logger.info(f"Error in inference job: {e}")
+                    reply = ('error', str(e))
+                conn.send(reply)
+        except (EOFError, OSError):
+            pass
+        finally:
+            for shm in attached.values():
+                shm.close()
+            conn.close()
+
+    def _write(self, attached, shm_name, vectors):
+        """Copy the result into the client's buffer, or ask for a bigger one"""
+        if shm_name not in attached:
+            # A grown buffer replaces the previous one
+            for shm in attached.values():
+                shm.close()
+            attached.clear()
+            attached[shm_name] = _attach(shm_name)
+        shm = attached[shm_name]
+        if vectors.nbytes > shm.size:
+            return ('grow', vectors.shape)
+        np.ndarray(vectors.shape, dtype=np.float32, buffer=shm.buf)[:] = vectors
+        return ('ok', vectors.shape)
+
+
+def _inference_process(address, authkey, threads, cores, qa_model_name, embedding_model_name):
+    """Entry point of an inference process: pin, load the models, serve clients"""
+    if threads:
+        # Must be set before torch is imported
+        for var in ('OMP_NUM_THREADS', 'MKL_NUM_THREADS'):
+            os.environ[var] = str(threads)
+    os.environ['TOKENIZERS_PARALLELISM'] = 'false'
+    if cores and hasattr(os, 'sched_setaffinity'):
+        os.sched_setaffinity(0, cores)
+    signal.signal(signal.SIGINT, signal.SIG_IGN)
+
+    import torch
+    if threads:
+        torch.set_num_threads(threads)
+        torch.set_num_interop_threads(1)
+
+    worker = _InferenceWorker(qa_model_name, embedding_model_name)
+    worker.encoder(embedding_model_name)
+    worker.qa_pipeline(qa_model_name)
+
+    if os.path.exists(address):
+        os.remove(address)
+    listener = Listener(address, family='AF_UNIX', authkey=authkey)
+    logger.info(f"inference worker {os.getpid()} ready on {address} ({threads} threads, cores {cores})")
+    while True:
+        try:
+            conn = listener.accept()
+        except Exception as e:
+            logger.info(f"Error accepting inference connection: {e}")
+            continue
+        threading.Thread(target=worker.serve, args=(conn,), daemon=True).start()
+
+
+def _socket_path(socket_dir, index):
+    return os.path.join(socket_dir, f"worker-{index}.sock")
+
+
+class InferencePool:
+    """
+    Fixed pool of dedicated model inference processes
+
+    Each process loads the QA pipeline and sentence transformer once, is
+    limited to `threads` torch threads and, when pinning is enabled, to its
+    own set of cores. Web workers reach the pool through InferenceClient.
+    Processes that die are restarted.
+    """
+
+    def __init__(self, socket_dir, num_workers, qa_model_name, embedding_model_name,
+                 threads=None, pin_cores=True, authkey=None):
+        """
+        Initialize the pool
+
+        Args:
+            socket_dir (str): Directory for the workers' Unix sockets
+            num_workers (int): Number of inference processes
+            qa_model_name (str): Hugging Face QA model name
+            embedding_model_name (str): Sentence transformer model name
+            threads (int, optional): Torch threads per process, defaults to an even share of the cores
+            pin_cores (bool): Bind each process to its own cores
+            authkey (bytes): Shared secret clients must present, must not be empty
+        """
+        if not authkey:
+            # An empty key makes the listener skip authentication while clients still wait for it
+            raise ValueError("authkey must be a non-empty shared secret")
+        self.socket_dir = socket_dir
+        self.num_workers = num_workers
+        self.qa_model_name = qa_model_name
+        self.embedding_model_name = embedding_model_name
+        self.authkey = authkey
+
+        cpus = sorted(os.sched_getaffinity(0)) if hasattr(os, 'sched_getaffinity') else list(range(os.cpu_count()))
+        self.threads = threads or max(1, len(cpus) // num_workers)
+        self.cores = [None] * num_workers
+        if pin_cores and self.threads * num_workers <= len(cpus):
+            self.cores = [cpus[i * self.threads:(i + 1) * self.threads] for i in range(num_workers)]
+
+        # Spawned, so workers do not inherit the web application's state
+        self._ctx = multiprocessing.get_context('spawn')
+        self._processes = [None] * num_workers
+        self._stop_event = threading.Event()
+
+    def _start_worker(self, index):
+        process = self._ctx.Process(
+            target=_inference_process,
+            args=(_socket_path(self.socket_dir, index), self.authkey, self.threads, self.cores[index],
+                  self.qa_model_name, self.embedding_model_name),
+            name=f"inference-{index}",
+            daemon=True
+        )
+        process.start()
+        self._processes[index] = process
+
+    def start(self):
+        """Start the inference processes and a thread restarting any that die"""
+        os.makedirs(self.socket_dir, mode=0o700, exist_ok=True)
+        for index in range(self.num_workers):
+            self._start_worker(index)
+
+        def monitor():
+            while not self._stop_event.wait(1):
+                for index, process in enumerate(self._processes):
+                    if not process.is_alive():
+                        logger.info(f"Error: inference worker {index} exited with {process.exitcode}, restarting")
+                        self._start_worker(index)
+
+        threading.Thread(target=monitor, name="inference-monitor", daemon=True).start()
+        logger.info(f"started {self.num_workers} inference workers with {self.threads} threads each")
+
+    def stop(self):
+        """Terminate the inference processes"""
+        self._stop_event.set()
+        for process in self._processes:
+            if process and process.is_alive():
+                process.terminate()
+                process.join(5)
+
+
+class _Channel:
+    """One connection to an inference worker plus its shared-memory result buffer"""
+
+    MIN_BUFFER = 1024 * 1024
+
+    def __init__(self, conn):
+        self.conn = conn
+        self.shm = SharedMemory(create=True, size=self.MIN_BUFFER)
+
+    def reserve(self, nbytes):
+        """Make sure the result buffer holds at least `nbytes`"""
+        if nbytes > self.shm.size:
+            self.shm.close()
+            self.shm.unlink()
+            self.shm = SharedMemory(create=True, size=max(nbytes, 2 * self.shm.size))
+
+    def close(self):
+        try:
+            self.conn.close()
+        finally:
+            self.shm.close()
+            self.shm.unlink()
+
+
+class InferenceClient:
+    """
+    Submit encode and QA jobs to an InferencePool
+
+    Connections are opened lazily and reused. Each carries a shared-memory
+    buffer owned by this process, which the worker writes embeddings into,
+    so only the texts and the result shape are pickled.
+    """
+
+    def __init__(self, socket_dir, num_workers, authkey=None, timeout=60):
+        """
+        Initialize the client
+
+        Args:
+            socket_dir (str): Directory of the workers' Unix sockets
+            num_workers (int): Number of inference processes in the pool
+            authkey (bytes): Shared secret of the pool, must not be empty
+            timeout (float): Seconds to wait for a job before giving up
+        """
+        if not authkey:
+            # An empty key makes the listener skip authentication while clients still wait for it
+            raise ValueError("authkey must be a non-empty shared secret")
+        self.socket_dir = socket_dir
+        self.num_workers = num_workers
+        self.authkey = authkey
+        self.timeout = timeout
+        self._dimensions = {}
+        self._reset()
+        atexit.register(self.close)
+
+    def _reset(self):
+        self._pid = os.getpid()
+        self._idle = queue.LifoQueue()
+        # Spread processes and their connections over the workers
+        self._next_worker = itertools.count(self._pid)
+
+    def _checkout(self):
+        if self._pid != os.getpid():
+            # Forked: connections belong to the parent
+            self._reset()
+        try:
+            return self._idle.get_nowait()
+        except queue.Empty:
+            index = next(self._next_worker) % self.num_workers
+            address = _socket_path(self.socket_dir, index)
+            # Workers may still be loading their models right after startup or a restart
+            deadline = time.monotonic() + self.timeout
+            while True:
+                try:
+                    return _Channel(Client(address, family='AF_UNIX', authkey=self.authkey))
+                except (FileNotFoundError, ConnectionRefusedError):
+                    if time.monotonic() > deadline:
+                        raise
+                    time.sleep(0.5)
+
+    def _request(self, channel, request):
+        channel.conn.send(request)
+        if not channel.conn.poll(self.timeout):
+            raise TimeoutError("inference job timed out")
+        status, payload = channel.conn.recv()
+        if status == 'error':
+            raise RuntimeError(f"inference job failed: {payload}")
+        return status, payload
+
+    def _call(self, job):
+        """Run job(channel) on a pooled connection, retrying once on a broken connection"""
+        for attempt in range(2):
+            channel = self._checkout()
+            try:
+                result = job(channel)
+            except RuntimeError:
+                # The worker reported a failed job; the connection itself is fine
+                self._idle.put(channel)
+                raise
+            except TimeoutError:
+                # The reply to the abandoned job could arrive later; never reuse the connection
+                channel.close()
+                raise
+            except (EOFError, OSError) as e:
+                channel.close()
+                if attempt:
+                    raise
+                logger.info(f"Error talking to inference worker, retrying: {e}")
+                continue
+            except Exception:
+                channel.close()
+                raise
+            self._idle.put(channel)
+            return result
+
+    def close(self):
+        """Close idle connections and free their shared memory"""
+        if self._pid != os.getpid():
+            return
+        while True:
+            try:
+                self._idle.get_nowait().close()
+            except queue.Empty:
+                break
+
+    def encode(self, model_name, texts, **options):
+        """
+        Encode texts with a sentence transformer in the pool
+
+        Args:
+            model_name (str): Sentence transformer model name
+            texts (list): Texts to encode
+            **options: Keyword arguments for SentenceTransformer.encode, e.g. batch_size
+
+        Returns:
+            numpy.ndarray: float32 matrix, one row per text
+        """
+        def job(channel):
+            dimension = self._dimensions.get(model_name)
+            if dimension:
+                channel.reserve(len(texts) * dimension * 4)
+            status, shape = self._request(channel, ('encode', model_name, list(texts), channel.shm.name, options))
+            if status == 'grow':
+                channel.reserve(int(np.prod(shape)) * 4)
+                status, shape = self._request(channel, ('fetch', channel.shm.name))
+            if len(shape) == 2:
+                self._dimensions[model_name] = shape[1]
+            return np.ndarray(shape, dtype=np.float32, buffer=channel.shm.buf).copy()
+        return self._call(job)
+
+    def answer(self, model_name, question, context):
+        """
+        Run extractive question answering in the pool
+
+        Returns:
+            dict: 'answer', 'score' and the answer's 'start' and 'end' offsets in the
+                context, as returned by the transformers pipeline
+        """
+        return self._call(lambda channel: self._request(channel, ('qa', model_name, question, context))[1])
+
+    def encoder(self, model_name):
+        """Stand-in for a SentenceTransformer that encodes in the pool"""
+        return RemoteEncoder(self, model_name)
+
+    def qa_pipeline(self, model_name):
+        """Stand-in for a question-answering pipeline that runs in the pool"""
+        return RemoteQAPipeline(self, model_name)
+
+
+class RemoteEncoder:
+    """SentenceTransformer-like encode() backed by an InferenceClient"""
+
+    def __init__(self, client, model_name):
+        self.client = client
+        self.model_name = model_name
+
+    def encode(self, sentences, **kwargs):
+        single = isinstance(sentences, str)
+        embeddings = self.client.encode(self.model_name, [sentences] if single else list(sentences), **kwargs)
+        return embeddings[0] if single else embeddings
+
+
+class RemoteQAPipeline:
+    """Question-answering pipeline callable backed by an InferenceClient"""
+
+    def __init__(self, client, model_name):
+        self.client = client
+        self.model_name = model_name
+
+    def __call__(self, question, context):
+        return self.client.answer(self.model_name, question, context)
+
+
+def create_pool(config):
+    """Build the InferencePool described by a config object (e.g. config.Config)"""
+    return InferencePool(
+        socket_dir=config.INFERENCE_SOCKET_DIR,
+        num_workers=config.INFERENCE_WORKERS,
+        qa_model_name=config.QA_MODEL,
+        embedding_model_name=config.EMBEDDING_MODEL,
+        threads=config.INFERENCE_THREADS,
+        pin_cores=config.INFERENCE_PIN_CORES,
+        authkey=config.INFERENCE_AUTHKEY.encode()
+    )
+
+
+def start_pool_process():
+    """
+    Run the configured pool in its own `python -m services.inference` process
+
+    Spawned inference workers re-import the parent's main module, so the
+    pool must not be started from inside the web application's process.
+
+    Returns:
+        subprocess.Popen: The pool supervisor; terminate it to stop the pool
+    """
+    root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+    return subprocess.Popen([sys.executable, '-m', 'services.inference'], cwd=root)
+
+
+if __name__ == "__main__":
+    from dotenv import load_dotenv
+
+    load_dotenv()
+    # Started with the app server, the secret generated for it is inherited; started
+    # on its own, a generated one would not be known to the web workers
+    if not os.environ.get('INFERENCE_AUTHKEY'):
+        sys.exit("Set INFERENCE_AUTHKEY to the secret the web workers use to reach the pool")
+    from config import Config
+
+    pool = create_pool(Config)
+    pool.start()
+    stopped = threading.Event()
+    signal.signal(signal.SIGTERM, lambda *_: stopped.set())
+    try:
+        stopped.wait()
+    except KeyboardInterrupt:
+        pass
+    pool.stop()
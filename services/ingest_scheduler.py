@@ -0,0 +1,358 @@
+import math
+import os
+import random
+import sqlite3
+import sys
+import time
+import tracemalloc
+import uuid
+from contextlib import contextmanager
+from custom_logger import logger
+from services.profiler import start_tracing, stop_tracing
+
+# Starting points of the memory model, replaced by measurements as jobs complete.
+# extract is per byte of the file, text per extracted character, the rest per chunk.
+DEFAULT_COEFFICIENTS = {
+    'extract': 4.0,           # parser peak
+    'chars_per_page': 2000.0,  # PDFs only; other formats have about one character per byte
+    'text': 1.0,              # full text, kept until the last part is stored
+    'chunk': 350.0,           # chunk strings, kept until the last part is stored
+    'encode': 8192.0,         # embeddings and tokenizer output while encoding; not measured, see TRACED_STAGES
+    'store': 8192.0,          # vector literals and the insert statement
+}
+
+# Stages whose memory tracemalloc sees. Encoding mostly allocates in torch and the
+# tokenizers, outside the Python allocator, so its coefficient is not recalibrated.
+TRACED_STAGES = ('extract', 'store')
+
+
+class IngestionScheduler:
+    """
+    Memory-budgeted admission of document ingestion, shared by all workers on a host
+
+    Before a document is processed its peak memory is estimated from the
+    file size and page count, and a lease of that many bytes is taken from a
+    global budget. Jobs wait in FIFO order until their lease fits. Documents
+    whose estimate exceeds the budget are encoded and stored in parts and run
+    with the whole budget. Measured stage peaks recalibrate the estimates.
+    Leases, waiters and the calibration live in a small SQLite file, like
+    the admission controller's state.
+    """
+
+    def __init__(self, db_path, budget, chunk_stride, overhead=64 * 1024 * 1024, queue_timeout=10,
+                 calibration_rate=0.2, min_part=32, headroom=1.25, lease_timeout=3600, poll_interval=0.25):
+        """
+        Initialize the scheduler
+
+        Args:
+            db_path (str): Path of the SQLite file holding shared state
+            budget (int): Bytes all running ingestion jobs on the host may use, 0 disables scheduling
+            chunk_stride (int): Characters between chunk starts (chunk size minus overlap)
+            overhead (int): Bytes reserved per job for native memory tracemalloc cannot see,
+                e.g. model activations and parser buffers
+            queue_timeout (float): Seconds a job waits for budget before giving up; the request
+                thread waits, so keep it well below the server's worker timeout
+            calibration_rate (float): Fraction of jobs whose stages are measured once
+                every stage has a few measurements; 0 disables measuring, which
+                traces every allocation of the worker while a job runs
+            min_part (int): Fewest chunks encoded and stored at once
+            headroom (float): Factor applied to the estimates
+            lease_timeout (float): Seconds after which a lease whose job stopped reporting
+                progress is considered leaked (e.g. the worker was killed) and reclaimed
+            poll_interval (float): Seconds between checks while waiting for budget
+        """
+        self.db_path = db_path
+        self.budget = budget
+        self.chunk_stride = chunk_stride
+        self.overhead = overhead
+        self.queue_timeout = queue_timeout
+        self.calibration_rate = calibration_rate
+        self.min_part = min_part
+        self.headroom = headroom
+        self.lease_timeout = lease_timeout
+        self.poll_interval = poll_interval
+
+        db_dir = os.path.dirname(db_path)
+        if db_dir:
+            os.makedirs(db_dir, exist_ok=True)
+        with self._connect() as conn:
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("""CREATE TABLE IF NOT EXISTS leases (lease_id TEXT PRIMARY KEY, bytes INTEGER,
+                            state TEXT, enqueued REAL, heartbeat REAL)""")
+            conn.execute("CREATE TABLE IF NOT EXISTS coefficients (name TEXT PRIMARY KEY, value REAL, samples INTEGER)")
+
+    def _connect(self):
+        return sqlite3.connect(self.db_path, timeout=5, isolation_level=None)
+
+    def coefficients(self):
+        """
+        Current memory model
+
+        Returns:
+            dict: name -> (value, samples), defaults for names not measured yet
+        """
+        coefficients = {name: (value, 0) for name, value in DEFAULT_COEFFICIENTS.items()}
+        conn = self._connect()
+        try:
+            for name, value, samples in conn.execute("SELECT name, value, samples FROM coefficients"):
+                coefficients[name] = (value, samples)
+        except Exception as e:
+            logger.info(f"Error reading ingestion memory model: {e}")
+        finally:
+            conn.close()
+        return coefficients
+
+    def record(self, name, value):
+        """
+        Fold a measurement into the memory model
+
+        The first measurements are averaged, later ones move the coefficient
+        by an exponentially weighted average.
+
+        Args:
+            name (str): Coefficient name, see DEFAULT_COEFFICIENTS
+            value (float): Measured bytes (or characters) per unit
+        """
+        conn = self._connect()
+        try:
+            conn.execute("BEGIN IMMEDIATE")
+            row = conn.execute("SELECT value, samples FROM coefficients WHERE name = ?", (name,)).fetchone()
+            current, samples = row if row else (value, 0)
+            alpha = max(1 / (samples + 1), 0.2)
+            conn.execute("INSERT OR REPLACE INTO coefficients (name, value, samples) VALUES (?, ?, ?)",
+                         (name, current + alpha * (value - current), samples + 1))
+            conn.execute("COMMIT")
+        except Exception as e:
+            logger.info(f"Error recording ingestion memory: {e}")
+            if conn.in_transaction:
+                conn.execute("ROLLBACK")
+        finally:
+            conn.close()
+
+    def estimate(self, size, pages=None, coefficients=None):
+        """
+        Estimate the memory needed to ingest a document
+
+        Args:
+            size (int): File size in bytes
+            pages (int, optional): Page count of a PDF
+            coefficients (dict, optional): Memory model, defaults to the current one
+
+        Returns:
+            dict: size, pages, chars and chunks expected, peak bytes, and reserve,
+                the lease to take: the peak, or the whole budget for a split document
+        """
+        k = {name: value for name, (value, _) in (coefficients or self.coefficients()).items()}
+        chars = pages * k['chars_per_page'] if pages else size
+        chunks = max(math.ceil(chars / self.chunk_stride), 1)
+        retained = chars * k['text'] + chunks * k['chunk']
+        per_chunk = max(k['encode'], k['store'])
+
+        peak = max(size * k['extract'], retained + chunks * per_chunk) * self.headroom + self.overhead
+        minimal = max(size * k['extract'], retained + min(chunks, self.min_part) * per_chunk) * self.headroom + self.overhead
+        if minimal > self.budget:
+            logger.info(f"ingesting {size} bytes needs about {minimal:.0f} bytes, over the {self.budget} byte budget")
+        return {
+            'size': size,
+            'pages': pages,
+            'chars': int(chars),
+            'chunks': chunks,
+            'peak': int(peak),
+            'reserve': int(min(peak, self.budget)),
+        }
+
+    def admit(self, path, pages=None):
+        """
+        Wait until a document's estimated memory fits the budget and lease it
+
+        Args:
+            path (str): Saved upload
+            pages (int, optional): Page count of a PDF
+
+        Returns:
+            IngestionJob: Holder of the lease, to be released when processing ends,
+                None if the budget did not free up within queue_timeout
+        """
+        if self.budget <= 0:
+            return IngestionJob()
+
+        coefficients = self.coefficients()
+        plan = self.estimate(os.path.getsize(path), pages, coefficients)
+        lease_id = uuid.uuid4().hex
+        deadline = time.monotonic() + self.queue_timeout
+        try:
+            while not self._try_lease(lease_id, plan['reserve']):
+                if time.monotonic() >= deadline:
+                    self.release(lease_id)
+                    logger.info(f"ingestion of {path} timed out waiting for {plan['reserve']} bytes of budget")
+                    return None
+                time.sleep(self.poll_interval)
+        except Exception as e:
+            # Fail open: the scheduler must not stop ingestion with it
+            logger.info(f"Error in ingestion scheduler: {e}")
+            lease_id = ""
+
+        # Only the coefficients this document's stages can measure; chars_per_page comes from PDFs
+        measured = TRACED_STAGES + ('text', 'chunk') + (('chars_per_page',) if plan['pages'] else ())
+        calibrated = all(coefficients[name][1] >= 3 for name in measured)
+        trace = self.calibration_rate > 0 and (not calibrated or random.random() < self.calibration_rate)
+        logger.info(f"admitted ingestion of {path}: ~{plan['chunks']} chunks, "
+                    f"{plan['reserve']} of {plan['peak']} estimated bytes leased")
+        return IngestionJob(self, lease_id, plan, coefficients, trace=trace)
+
+    def _try_lease(self, lease_id, nbytes):
+        """Queue a lease, or run it if it is first in line and fits the remaining budget"""
+        now = time.time()
+        conn = self._connect()
+        try:
+            conn.execute("BEGIN IMMEDIATE")
+            # Running jobs report progress each stage; waiters every poll
+            conn.execute("DELETE FROM leases WHERE heartbeat < ? OR (state = 'waiting' AND heartbeat < ?)",
+                         (now - self.lease_timeout, now - max(30, 10 * self.poll_interval)))
+            conn.execute("""INSERT INTO leases (lease_id, bytes, state, enqueued, heartbeat)
+                            VALUES (?, ?, 'waiting', ?, ?)
+                            ON CONFLICT (lease_id) DO UPDATE SET heartbeat = excluded.heartbeat""",
+                         (lease_id, nbytes, now, now))
+            head = conn.execute("SELECT lease_id FROM leases WHERE state = 'waiting' ORDER BY enqueued LIMIT 1").fetchone()
+            reserved = conn.execute("SELECT COALESCE(SUM(bytes), 0) FROM leases WHERE state = 'running'").fetchone()[0]
+            admitted = head[0] == lease_id and reserved + nbytes <= self.budget
+            if admitted:
+                conn.execute("UPDATE leases SET state = 'running' WHERE lease_id = ?", (lease_id,))
+            conn.execute("COMMIT")
+            return admitted
+        except Exception:
+            if conn.in_transaction:
+                conn.execute("ROLLBACK")
+            raise
+        finally:
+            conn.close()
+
+    def touch(self, lease_id):
+        """Mark a running lease as still in use"""
+        if not lease_id:
+            return
+        conn = self._connect()
+        try:
+            conn.execute("UPDATE leases SET heartbeat = ? WHERE lease_id = ?", (time.time(), lease_id))
+        except Exception as e:
+            logger.info(f"Error refreshing ingestion lease: {e}")
+        finally:
+            conn.close()
+
+    def release(self, lease_id):
+        """Return a lease's bytes to the budget, or leave the queue"""
+        if not lease_id:
+            return
+        conn = self._connect()
+        try:
+            conn.execute("DELETE FROM leases WHERE lease_id = ?", (lease_id,))
+        except Exception as e:
+            logger.info(f"Error releasing ingestion lease: {e}")
+        finally:
+            conn.close()
+
+
+class IngestionJob:
+    """
+    A document's memory lease: measures its stages and sizes the parts it is
+    encoded and stored in. Created without a scheduler it measures nothing
+    and processes the document in one part.
+    """
+
+    def __init__(self, scheduler=None, lease_id="", plan=None, coefficients=None, trace=False):
+        self.scheduler = scheduler
+        self.lease_id = lease_id
+        self.plan = plan or {}
+        self.coefficients = {name: value for name, (value, _) in (coefficients or {}).items()}
+        self.trace = trace and scheduler is not None
+        self.peak = 0
+        self._measured = {}
+        self._touched = time.monotonic()
+        self._owns_tracemalloc = False
+        self._baseline = 0
+
+        # Skipped while a profiled request or another job is measuring
+        if self.trace and start_tracing():
+            self._owns_tracemalloc = True
+            self._baseline = tracemalloc.get_traced_memory()[0]
+        else:
+            self.trace = False
+
+    @contextmanager
+    def stage(self, name, units):
+        """
+        Run a stage, measuring its peak memory per unit when this job is traced
+        and the stage is one of TRACED_STAGES
+
+        Args:
+            name (str): 'extract', 'encode' or 'store'
+            units (int): File bytes for extract, chunks otherwise
+        """
+        if not self.scheduler:
+            yield
+            return
+        if time.monotonic() - self._touched > self.scheduler.lease_timeout / 10:
+            self.scheduler.touch(self.lease_id)
+            self._touched = time.monotonic()
+        if not self.trace or name not in TRACED_STAGES:
+            yield
+            return
+
+        start = tracemalloc.get_traced_memory()[0]
+        tracemalloc.reset_peak()
+        yield
+        peak = tracemalloc.get_traced_memory()[1]
+        self.peak = max(self.peak, peak - self._baseline)
+        # Parts of a split document are recorded once, as their combined ratio
+        measured_bytes, measured_units = self._measured.get(name, (0, 0))
+        self._measured[name] = (measured_bytes + max(peak - start, 0), measured_units + units)
+
+    def observe_text(self, text, pages):
+        """Calibrate the text estimates from an extracted document"""
+        if not self.scheduler or not text:
+            return
+        if self.plan.get('pages') and pages:
+            self.scheduler.record('chars_per_page', len(text) / pages)
+        self.scheduler.record('text', sys.getsizeof(text) / len(text))
+
+    def observe_chunks(self, chunks):
+        """Calibrate the chunk estimate from a document's chunks"""
+        if not self.scheduler or not chunks:
+            return
+        retained = sys.getsizeof(chunks) + sum(sys.getsizeof(chunk) for chunk in chunks)
+        self.scheduler.record('chunk', retained / len(chunks))
+
+    def parts(self, text, chunks):
+        """
+        Split a document's chunks so encoding and storing one part fits the lease
+
+        Args:
+            text (str): Full text, held until the document is stored
+            chunks (list): The document's chunks
+
+        Returns:
+            list: (start, end) chunk ranges, a single one when everything fits
+        """
+        if not self.scheduler or not chunks:
+            return [(0, len(chunks))]
+
+        k = self.coefficients
+        retained = (sys.getsizeof(text) + sum(sys.getsizeof(chunk) for chunk in chunks)) * self.scheduler.headroom
+        per_chunk = max(k['encode'], k['store']) * self.scheduler.headroom
+        room = self.plan['reserve'] - self.scheduler.overhead - retained
+        size = min(max(int(room // per_chunk), self.scheduler.min_part), len(chunks))
+        return [(start, min(start + size, len(chunks))) for start in range(0, len(chunks), size)]
+
+    def release(self):
+        """Stop measuring and return the lease to the budget"""
+        if self._owns_tracemalloc:
+            stop_tracing()
+            self._owns_tracemalloc = False
+            logger.info(f"ingestion peaked at {self.peak} traced bytes, "
+                        f"{self.plan.get('peak')} estimated")
+        if self.scheduler:
+            for name, (measured_bytes, units) in self._measured.items():
+                if units:
+                    self.scheduler.record(name, measured_bytes / units)
+            self.scheduler.release(self.lease_id)
+            self.scheduler = None
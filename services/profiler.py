@@ -0,0 +1,205 @@
+import cProfile
+import hmac
+import io
+import json
+import os
+import pstats
+import random
+import threading
+import time
+import tracemalloc
+import uuid
+from custom_logger import logger
+
+# tracemalloc has one peak counter per process, so a single owner (a profiled
+# request or a calibrated ingestion job) may start, reset and stop it at a time
+_tracing_lock = threading.Lock()
+
+def start_tracing():
+    """
+    Start tracemalloc on behalf of the caller
+
+    Returns:
+        bool: True if the caller owns tracing and must call stop_tracing, False if
+            someone else is measuring or tracing was started outside the application
+    """
+    if not _tracing_lock.acquire(blocking=False):
+        return False
+    if tracemalloc.is_tracing():
+        _tracing_lock.release()
+        return False
+    tracemalloc.start()
+    return True
+
+def stop_tracing():
+    """Stop tracemalloc started by start_tracing"""
+    tracemalloc.stop()
+    _tracing_lock.release()
+
+class RequestProfiler:
+    """
+    Opt-in cProfile/tracemalloc profiling of individual requests
+
+    A request is profiled when it carries the admin token in the
+    X-Profile header or `profile` query argument, or when it is picked by
+    the sampling rate. Profiles are written to disk so any worker can serve
+    them. With no token and a zero sampling rate, the per-request cost is a
+    single attribute check.
+    """
+
+    def __init__(self, profile_dir, token=None, sample_rate=0.0, trace_memory=True, max_profiles=100):
+        """
+        Initialize the profiler
+
+        Args:
+            profile_dir (str): Directory where profiles are stored
+            token (str, optional): Secret that authorizes callers to request profiling
+            sample_rate (float): Fraction of requests profiled without being asked
+            trace_memory (bool): Record peak memory with tracemalloc (slows the profiled request down);
+                skipped while an ingestion job is being measured
+            max_profiles (int): Profiles kept on disk, oldest are removed first
+        """
+        self.profile_dir = profile_dir
+        self.token = token
+        self.sample_rate = sample_rate
+        self.trace_memory = trace_memory
+        self.max_profiles = max_profiles
+        self.enabled = bool(token) or sample_rate > 0
+        # cProfile and tracemalloc are process-wide, so only one request per process is profiled at a time
+        self._lock = threading.Lock()
+
+        os.makedirs(profile_dir, exist_ok=True)
+
+    def is_authorized(self, value):
+        """Check a caller-supplied token against the admin token"""
+        return bool(self.token and value) and hmac.compare_digest(str(value), self.token)
+
+    def should_profile(self, req):
+        """Decide whether a request should be profiled"""
+        if not self.enabled:
+            return False
+        if self.is_authorized(req.headers.get('X-Profile') or req.args.get('profile')):
+            return True
+        return random.random() < self.sample_rate
+
+    def start(self):
+        """
+        Start profiling the current thread
+
+        Returns:
+            dict: Profiling session, None if another request is already being profiled
+        """
+        if not self._lock.acquire(blocking=False):
+            return None
+        session = {
+            'id': uuid.uuid4().hex,
+            'profile': cProfile.Profile(),
+            'started': time.perf_counter(),
+            'owns_tracemalloc': self.trace_memory and start_tracing(),
+        }
+        session['profile'].enable()
+        return session
+
+    def finish(self, session, info=None):
+        """
+        Stop profiling and store the result
+
+        Args:
+            session (dict): Session returned by start
+            info (dict, optional): Request details saved with the profile (path, status, ...)
+
+        Returns:
+            str: Profile ID, None on error
+        """
+        try:
+            session['profile'].disable()
+            duration = time.perf_counter() - session['started']
+            peak = None
+            if session['owns_tracemalloc']:
+                peak = tracemalloc.get_traced_memory()[1]
+                stop_tracing()
+                session['owns_tracemalloc'] = False
+
+            profile_id = session['id']
+            session['profile'].dump_stats(os.path.join(self.profile_dir, f"{profile_id}.prof"))
+            stats = io.StringIO()
+            pstats.Stats(session['profile'], stream=stats).sort_stats('cumulative').print_stats(40)
+            with open(os.path.join(self.profile_dir, f"{profile_id}.json"), 'w') as f:
+                json.dump({
+                    'id': profile_id,
+                    'created_at': time.time(),
+                    'duration_ms': round(duration * 1000, 3),
+                    'peak_memory_bytes': peak,
+                    **(info or {}),
+                    'stats': stats.getvalue(),
+                }, f)
+            logger.info(f"stored profile {profile_id} ({duration * 1000:.1f} ms, peak {peak} bytes)")
+            self._prune()
+            return profile_id
+        except Exception as e:
+            logger.info(f"Error storing profile: {e}")
+            return None
+        finally:
+            self._lock.release()
+
+    def _prune(self):
+        summaries = sorted(
+            (entry for entry in os.scandir(self.profile_dir) if entry.name.endswith('.json')),
+            key=lambda entry: entry.stat().st_mtime
+        )
+        for entry in summaries[:max(0, len(summaries) - self.max_profiles)]:
+            profile_id = entry.name[:-len('.json')]
+            for suffix in ('.json', '.prof'):
+                try:
+                    os.remove(os.path.join(self.profile_dir, profile_id + suffix))
+                except FileNotFoundError:
+                    pass
+
+    def _valid_id(self, profile_id):
+        return len(profile_id) == 32 and all(c in '0123456789abcdef' for c in profile_id)
+
+    def get(self, profile_id):
+        """
+        Get a stored profile
+
+        Args:
+            profile_id (str): Profile ID
+
+        Returns:
+            dict: Request details, duration, peak memory and the top functions by
+                cumulative time, None if not found
+        """
+        if not self._valid_id(profile_id):
+            return None
+        try:
+            with open(os.path.join(self.profile_dir, f"{profile_id}.json")) as f:
+                return json.load(f)
+        except FileNotFoundError:
+            return None
+        except Exception as e:
+            logger.info(f"Error reading profile: {e}")
+            return None
+
+    def stats_path(self, profile_id):
+        """Path of the raw pstats dump, for snakeviz/pstats, None if not found"""
+        if not self._valid_id(profile_id):
+            return None
+        path = os.path.join(self.profile_dir, f"{profile_id}.prof")
+        return path if os.path.exists(path) else None
+
+    def list_all(self, limit=50):
+        """
+        List stored profiles, newest first, without their stats
+
+        Returns:
+            list: Profile summaries
+        """
+        profiles = []
+        for entry in os.scandir(self.profile_dir):
+            if entry.name.endswith('.json'):
+                profile = self.get(entry.name[:-len('.json')])
+                if profile:
+                    profile.pop('stats', None)
+                    profiles.append(profile)
+        profiles.sort(key=lambda profile: profile['created_at'], reverse=True)
+        return profiles[:limit]
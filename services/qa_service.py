@@ -1,17 +1,17 @@
 import os
-import re
 import numpy as np
-from PyPDF2 import PdfReader
-from custom_logger import logger
+from custom_logger import logger, hot_logger, log_stage
+from services.extraction import DocumentExtractor
+from services.ingest_scheduler import IngestionJob
 from transformers import pipeline
 from sentence_transformers import SentenceTransformer
-from custom_logger import logger
 # import ollama, openai
 
 class QuestionAnsweringService:
     """Service for PDF processing and question answering"""
     
-    def __init__(self, document_model, embedding_model, qa_model_name, embedding_model_name):
+    def __init__(self, document_model, embedding_model, qa_model_name, embedding_model_name,
+                 search_engine=None, inference_client=None, extractor=None):
         """
         Initialize the QA service
         
@@ -20,89 +20,147 @@ class QuestionAnsweringService:
             embedding_model: Model for embedding operations
             qa_model_name (str): Hugging Face QA model name
             embedding_model_name (str): Sentence transformer model name
+            search_engine (optional): Alternative to embedding_model.search_similar for
+                question retrieval, e.g. a ShardedSearchEngine
+            inference_client (optional): InferenceClient running the models in dedicated
+                processes instead of loading them into this one
+            extractor (optional): DocumentExtractor, defaults to one using Config.PDF_BACKENDS
         """
         self.document_model = document_model
         self.embedding_model = embedding_model
+        self.search_engine = search_engine or embedding_model
+        self.inference_client = inference_client
+        self.extractor = extractor or DocumentExtractor()
+        self.embedding_model_name = embedding_model_name
         
-        # Load NLP models
-        logger.info(f"Loading QA model: {qa_model_name}")
-        self.qa_pipeline = pipeline('question-answering', model=qa_model_name)
-        
-        logger.info(f"Loading embedding model: {embedding_model_name}")
-        self.sentence_transformer = SentenceTransformer(embedding_model_name)
+        if inference_client:
+            logger.info(f"Using inference pool for {qa_model_name} and {embedding_model_name}")
+            self.qa_pipeline = inference_client.qa_pipeline(qa_model_name)
+            self.sentence_transformer = inference_client.encoder(embedding_model_name)
+        else:
+            # Load NLP models
+            logger.info(f"Loading QA model: {qa_model_name}")
+            self.qa_pipeline = pipeline('question-answering', model=qa_model_name)
+            
+            logger.info(f"Loading embedding model: {embedding_model_name}")
+            self.sentence_transformer = SentenceTransformer(embedding_model_name)
+        self._encoders = {embedding_model_name: self.sentence_transformer}
         
         # Configuration
         self.chunk_size = 250
         self.overlap = 50
     
-    def process_pdf(self, pdf_path, metadata=None):
+    def process_document(self, path, metadata=None, title=None, job=None):
         """
-        Process a PDF file and store its chunks and embeddings
+        Process a PDF, plain text, markdown or HTML file and store its chunks and embeddings
         
         Args:
-            pdf_path (str): Path to the PDF file
+            path (str): Path to the file
             metadata (dict): Optional metadata
+            title (str, optional): Document title, defaults to the file name
+            job (IngestionJob, optional): Memory lease from the ingestion scheduler. Its
+                stages are measured, and chunks are encoded and stored in parts that fit it.
             
         Returns:
             str: Document ID if successful, None otherwise
         """
-        if not os.path.exists(pdf_path):
-            logger.info(f"Error: File {pdf_path} not found")
+        if not os.path.exists(path):
+            logger.info(f"Error: File {path} not found")
             return None
+        job = job or IngestionJob()
             
         try:
-            logger.info(f"Processing PDF: {pdf_path}")
-            reader = PdfReader(pdf_path)
-            
-            # Extract text from PDF
-            logger.info("extracting pdf text")
-            full_text = ""
-            for page in reader.pages:
-                text = page.extract_text()
-                if text:
-                    full_text += text + " "
+            logger.info(f"Processing document: {path}")
             
-            full_text = re.sub(r'\s+', ' ', full_text).strip()
+            # Extract text with the first backend that succeeds
+            with log_stage("extract_text", logger), job.stage("extract", os.path.getsize(path)):
+                full_text, pages, backend = self.extractor.extract(path)
             
             if not full_text:
-                logger.info("Error: No text content extracted from PDF")
+                logger.info("Error: No text content extracted from document")
                 return None
+            logger.info(f"extracted {len(full_text)} characters from {pages} pages with {backend}")
+            job.observe_text(full_text, pages)
             
             # Create document record
             logger.info("creating doc record")
-            title = os.path.basename(pdf_path)
-            doc_id = self.document_model.create(title, pdf_path, metadata)
+            title = title or os.path.basename(path)
+            doc_id = self.document_model.create(title, path, metadata)
             
             if not doc_id:
                 logger.info("Error: Failed to create document record")
                 return None
             
             # Generate chunks
-            logger.info("creating chunks")
-            chunks = self._create_chunks(full_text)
+            with log_stage("create_chunks", logger):
+                chunks = self._create_chunks(full_text)
             if not chunks:
                 logger.info("Error: Failed to create text chunks")
                 self.document_model.delete(doc_id)
                 return None
+            job.observe_chunks(chunks)
             
-            # Create embeddings for chunks
-            logger.info("Create embeddings for chunks")
-            embeddings = self.sentence_transformer.encode(chunks)
-            
-            # Store chunks and embeddings
-            logger.info("Store chunks and embeddings")
-            if not self.embedding_model.create_chunks(doc_id, chunks, embeddings):
+            # Create and store embeddings, in parts if the whole document would not fit its lease
+            version = self.embedding_model.active_version()
+            parts = job.parts(full_text, chunks)
+            if len(parts) > 1:
+                logger.info(f"storing {len(chunks)} chunks in {len(parts)} parts")
+            stored = self._store_chunks(doc_id, chunks, version, parts, job)
+            if not stored and self.embedding_model.active_version()['version'] != version['version']:
+                # A migration was activated mid-ingestion and the retired column is refused;
+                # store the document again, encoded for the new version
+                logger.info(f"embedding version changed during ingestion, re-encoding {doc_id}")
+                self.embedding_model.delete_by_document(doc_id)
+                version = self.embedding_model.active_version()
+                stored = self._store_chunks(doc_id, chunks, version, parts, job)
+            if not stored:
                 logger.info("Error: Failed to store chunks and embeddings")
                 self.document_model.delete(doc_id)
                 return None
             
-            logger.info(f"PDF processed and stored successfully. Document ID: {doc_id}")
+            logger.info(f"Document processed and stored successfully. Document ID: {doc_id}")
             return doc_id
             
         except Exception as e:
-            logger.info(f"Error processing PDF: {e}")
+            logger.info(f"Error processing document: {e}")
             return None
     
+    # Kept for callers written when only PDFs were supported
+    process_pdf = process_document
+
+    def _store_chunks(self, doc_id, chunks, version, parts, job):
+        """Encode and store a document's chunks one part at a time, then its centroid"""
+        encoder = self._encoder_for(version)
+        if len(parts) == 1:
+            with log_stage("encode_chunks", logger), job.stage("encode", len(chunks)):
+                embeddings = encoder.encode(chunks)
+            with log_stage("store_chunks", logger), job.stage("store", len(chunks)):
+                return self.embedding_model.create_chunks(doc_id, chunks, embeddings, version=version)
+
+        # Only one part's vectors are held at a time; the centroid is summed as they pass
+        total = 0
+        for start, end in parts:
+            with log_stage("encode_chunks", logger), job.stage("encode", end - start):
+                embeddings = encoder.encode(chunks[start:end])
+            with log_stage("store_chunks", logger), job.stage("store", end - start):
+                stored = self.embedding_model.create_chunks(doc_id, chunks[start:end], embeddings, version=version,
+                                                            start_index=start, centroid=False)
+            if not stored:
+                return False
+            total = total + np.asarray(embeddings, dtype=np.float32).sum(axis=0)
+        return self.embedding_model.upsert_centroid(doc_id, total / len(chunks), len(chunks), version=version)
+    
+    def _encoder_for(self, version):
+        """Sentence transformer matching an embedding version, loaded on first use"""
+        model_name = version['model_name'] if version else self.embedding_model_name
+        if model_name not in self._encoders:
+            if self.inference_client:
+                self._encoders[model_name] = self.inference_client.encoder(model_name)
+            else:
+                logger.info(f"Loading embedding model: {model_name}")
+                self._encoders[model_name] = SentenceTransformer(model_name)
+        return self._encoders[model_name]
+    
     def _create_chunks(self, text):
         """Split text into overlapping chunks for embedding"""
         chunks = []
@@ -126,77 +184,238 @@ class QuestionAnsweringService:
                         end = space
 
             chunks.append(text[start:end].strip())
-            start += (end - start) - self.overlap
-            if start+self.overlap == end:
+            if end == text_len:
                 break
+            # Chunks end past the midpoint of their window, which is wider than the overlap
+            start = end - self.overlap
         return chunks
     
-    def answer_question(self, question, doc_id=None, top_k=5):
+    def retrieve_context(self, question, doc_id=None, top_k=5, filters=None, cancelled=None):
         """
-        Answer a question using stored document embeddings
+        Retrieve the chunks relevant to a question
         
         Args:
             question (str): Question to answer
             doc_id (str, optional): Limit search to specific document
             top_k (int): Number of relevant chunks to consider
+            filters (dict, optional): Document filter expression, see db.filters.compile_filter
+            cancelled (callable, optional): Checked between encoding and search; the search
+                is skipped once it returns True
             
         Returns:
-            dict: Answer with metadata
+            tuple: (context string, list of source documents), ("", []) if nothing matched
         """
-        # Get question embedding
-        logger.info("reading question.")
-        logger.info(f"question: {question}")
-        logger.info(f"doc id: {doc_id}")
-        question_embedding = self.sentence_transformer.encode(question)
-        
-        # Search for similar chunks
-        similar_chunks = self.embedding_model.search_similar(
-            embedding=question_embedding,
-            top_k=top_k,
-            doc_id=doc_id
-        )
-        
+        similar_chunks = self._retrieve_chunks(question, doc_id, top_k, filters, cancelled)
         if not similar_chunks:
-            return {
-                "answer": "No relevant information found.",
-                "confidence": 0,
-                "context": "",
-                "sources": []
-            }
+            return "", []
         
         # Combine chunks to create context
         context = " ".join([chunk["text_content"] for chunk in similar_chunks])
+        return context, self._sources(similar_chunks)
 
+    def _retrieve_chunks(self, question, doc_id, top_k, filters, cancelled=None):
+        """Chunks most similar to a question, best first"""
+        # Get question embedding
+        hot_logger.info("reading question.", extra={'doc_id': doc_id, 'top_k': top_k})
+        hot_logger.debug(f"question: {question}")
+        # Queries must be encoded with the same model as the vectors searched
+        version = self.embedding_model.active_version()
+        with log_stage("encode_question"):
+            question_embedding = self._encoder_for(version).encode(question)
+        if cancelled and cancelled():
+            return []
+        
+        # Search for similar chunks
+        with log_stage("search_similar"):
+            similar_chunks = self.search_engine.search_similar(
+                embedding=question_embedding,
+                top_k=top_k,
+                doc_id=doc_id,
+                version=version,
+                filters=filters
+            )
+        
+        return similar_chunks
+
+    def _sources(self, similar_chunks, with_chunks=False):
+        """Documents the chunks came from, most similar first, optionally listing their chunks"""
         # Track which documents the answer came from
-        source_docs = []
+        source_docs = {}
         for chunk in similar_chunks:
-            if chunk["doc_id"] not in [doc["id"] for doc in source_docs]:
-                source_docs.append({
+            if chunk["doc_id"] not in source_docs:
+                source_docs[chunk["doc_id"]] = {
                     "id": chunk["doc_id"],
                     "title": chunk["title"],
                     "similarity": float(chunk["similarity"])
+                }
+                if with_chunks:
+                    source_docs[chunk["doc_id"]]["chunks"] = []
+            if with_chunks:
+                source_docs[chunk["doc_id"]]["chunks"].append({
+                    "chunk_id": chunk["chunk_id"],
+                    "similarity": float(chunk["similarity"])
                 })
         
         # Sort sources by similarity
-        source_docs.sort(key=lambda x: x["similarity"], reverse=True)
+        return sorted(source_docs.values(), key=lambda x: x["similarity"], reverse=True)
+
+    def search(self, queries, top_k=5, doc_id=None, metadata=None, min_similarity=None, window=0, filters=None):
+        """
+        Retrieve relevant passages for one or more queries without running the QA model
+        
+        Args:
+            queries (list): Query strings
+            top_k (int): Number of passages per query
+            doc_id (str, optional): Limit search to specific document
+            metadata (dict, optional): Only match documents whose metadata contains these key/values
+            min_similarity (float, optional): Drop passages below this similarity
+            window (int): Number of neighbouring chunks on each side to return as context
+            filters (dict, optional): Document filter expression, see db.filters.compile_filter
+            
+        Returns:
+            list: One list of passages per query
+        """
+        version = self.embedding_model.active_version()
+        query_embeddings = self._encoder_for(version).encode(list(queries))
+        return self.embedding_model.search_batch(
+            query_embeddings,
+            top_k=top_k,
+            doc_id=doc_id,
+            metadata=metadata,
+            min_similarity=min_similarity,
+            window=window,
+            version=version,
+            filters=filters
+        )
+
+    def _no_answer(self):
+        return {
+            "answer": "No relevant information found.",
+            "confidence": 0,
+            "context": "",
+            "sources": []
+        }
+
+    def answer_question(self, question, doc_id=None, top_k=5, filters=None, offsets=False, fields=None):
+        """
+        Answer a question using stored document embeddings
+        
+        Args:
+            question (str): Question to answer
+            doc_id (str, optional): Limit search to specific document
+            top_k (int): Number of relevant chunks to consider
+            filters (dict, optional): Only use documents matching this filter expression
+            offsets (bool): Replace the context with the chunks behind each source and
+                the answer's position within its chunk (answer_span)
+            fields (list, optional): Only return these fields. The QA model is skipped
+                when none of answer, confidence and answer_span is asked for.
+            
+        Returns:
+            dict: Answer with metadata
+        """
+        similar_chunks = self._retrieve_chunks(question, doc_id, top_k, filters)
+        if not similar_chunks:
+            result = self._no_answer()
+            if offsets:
+                result.pop("context")
+                result["answer_span"] = None
+            return self._select(result, fields)
+
+        context = " ".join([chunk["text_content"] for chunk in similar_chunks])
+        source_docs = self._sources(similar_chunks, with_chunks=offsets)
+        if fields and not {"answer", "confidence", "answer_span"} & set(fields):
+            return self._select({"context": context, "sources": source_docs}, fields)
         
-        return self.generate_answer_pipeline(question, context, source_docs)
+        return self._select(self.generate_answer_pipeline(
+            question, context, source_docs, chunks=similar_chunks if offsets else None
+        ), fields)
         # if os.environ.get("GENERAL"):
             # logger.info("generating answer via general.")
             # return self.generate_answer_pipeline(question, context, source_docs)
         # logger.info("generating answer via model.")
         # return self.generate_answer_model(question, context, source_docs)
+
+    @staticmethod
+    def _select(result, fields):
+        """Keep only the requested fields of a result, all of them when fields is empty"""
+        if not fields:
+            return result
+        return {field: result[field] for field in fields if field in result}
+
+    def answer_question_stream(self, question, doc_id=None, top_k=5, filters=None, cancelled=None):
+        """
+        Answer a question stage by stage
+        
+        Yields ("sources", {...}) as soon as retrieval finishes, then
+        ("answer", {...}) once the QA model is done. The QA model runs when
+        the consumer asks for the answer event, so a consumer that closes the
+        generator after the sources does not run it.
+        
+        Args:
+            question (str): Question to answer
+            doc_id (str, optional): Limit search to specific document
+            top_k (int): Number of relevant chunks to consider
+            filters (dict, optional): Only use documents matching this filter expression
+            cancelled (callable, optional): Checked between the encode, search and QA
+                stages; once it returns True the remaining stages are skipped and
+                the generator ends
+            
+        Yields:
+            tuple: (event name, payload dict)
+        """
+        context, source_docs = self.retrieve_context(question, doc_id, top_k, filters, cancelled)
+        if cancelled and cancelled():
+            logger.info("question stream cancelled before the search finished")
+            return
+        yield "sources", {"sources": source_docs}
+
+        if cancelled and cancelled():
+            logger.info("question stream cancelled before the QA model ran")
+            return
+        if not source_docs:
+            result = self._no_answer()
+        else:
+            result = self.generate_answer_pipeline(question, context, source_docs)
+        yield "answer", {
+            "answer": result["answer"],
+            "confidence": result["confidence"],
+            "context": result["context"]
+        }
     
-    def generate_answer_pipeline(self, question, context, source_docs):
+    def generate_answer_pipeline(self, question, context, source_docs, chunks=None):
         # Use QA model to find answer in context
-        qa_result = self.qa_pipeline(question=question, context=context)
+        with log_stage("qa_model"):
+            qa_result = self.qa_pipeline(question=question, context=context)
         
-        return {
+        result = {
             "answer": qa_result["answer"],
             "confidence": float(qa_result["score"]),
             "context": context,
             "sources": source_docs
         }
+        if chunks is not None:
+            result.pop("context")
+            result["answer_span"] = self._answer_span(chunks, qa_result.get("start"), qa_result.get("end"))
+        return result
+
+    @staticmethod
+    def _answer_span(chunks, start, end):
+        """Locate an answer given as context offsets within the chunk it starts in"""
+        if start is None or end is None:
+            return None
+        chunk_start = 0
+        for chunk in chunks:
+            chunk_end = chunk_start + len(chunk["text_content"])
+            if start < chunk_end:
+                return {
+                    "chunk_id": chunk["chunk_id"],
+                    "doc_id": chunk["doc_id"],
+                    "start": max(start - chunk_start, 0),
+                    "end": min(end, chunk_end) - chunk_start
+                }
+            # Chunks are joined with a single space
+            chunk_start = chunk_end + 1
+        return None
 
     # def generate_answer_model(self, question, context, source_docs):
     #     prompt = f"Using the following context, answer the question:\n\nContext: {context}\n\nQuestion: {question}\n\nAnswer:"
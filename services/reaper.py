@@ -0,0 +1,89 @@
+import threading
+from db.database import vacuum_table
+from custom_logger import logger
+
+class ChunkReaper:
+    """Background cleanup of chunks belonging to soft-deleted documents and of idle upload sessions"""
+
+    def __init__(self, document_model, embedding_model, batch_size=1000, interval=30,
+                 vacuum_threshold=10000, upload_service=None, upload_session_ttl=24 * 3600):
+        """
+        Initialize the reaper
+
+        Args:
+            document_model: Model for document operations
+            embedding_model: Model for embedding operations
+            batch_size (int): Chunks deleted per transaction
+            interval (float): Seconds to sleep between cleanup passes
+            vacuum_threshold (int): Chunks removed before VACUUM is triggered
+            upload_service: Service whose idle resumable uploads are expired, None to keep them
+            upload_session_ttl (float): Seconds a resumable upload may go without a chunk
+        """
+        self.document_model = document_model
+        self.embedding_model = embedding_model
+        self.batch_size = batch_size
+        self.interval = interval
+        self.vacuum_threshold = vacuum_threshold
+        self.upload_service = upload_service
+        self.upload_session_ttl = upload_session_ttl
+
+        self._pending_vacuum = 0
+        self._stop_event = threading.Event()
+        self._thread = None
+
+    def run_once(self):
+        """
+        Remove chunks of every tombstoned document in small batches, then the
+        document rows themselves
+
+        Returns:
+            int: Number of chunks removed in this pass
+        """
+        removed = 0
+        for doc_id in self.document_model.list_deleted():
+            if self._stop_event.is_set():
+                break
+
+            deleted = self.embedding_model.delete_by_document(doc_id, batch_size=self.batch_size)
+            while deleted:
+                removed += deleted
+                deleted = self.embedding_model.delete_by_document(doc_id, batch_size=self.batch_size)
+
+            if deleted is None:
+                # Leave the tombstone in place and retry on the next pass
+                continue
+
+            if self.document_model.purge(doc_id):
+                logger.info(f"reaped document {doc_id}")
+
+        self._pending_vacuum += removed
+        if self._pending_vacuum >= self.vacuum_threshold:
+            logger.info(f"vacuuming chunks after removing {self._pending_vacuum} rows")
+            if vacuum_table("chunks"):
+                self._pending_vacuum = 0
+
+        if self.upload_service:
+            self.upload_service.expire_sessions(self.upload_session_ttl)
+        return removed
+
+    def _run(self):
+        while not self._stop_event.wait(self.interval):
+            try:
+                self.run_once()
+            except Exception as e:
+                logger.info(f"Error reaping deleted documents: {e}")
+
+    def start(self):
+        """Start the reaper in a daemon thread"""
+        if self._thread and self._thread.is_alive():
+            return
+        self._stop_event.clear()
+        self._thread = threading.Thread(target=self._run, name="chunk-reaper", daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        """Signal the reaper thread to stop and wait for it"""
+        self._stop_event.set()
+        if self._thread:
+            self._thread.join()
+            self._thread = None
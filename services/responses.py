@@ -0,0 +1,152 @@
+import gzip
+import json
+from datetime import date, datetime
+from decimal import Decimal
+from uuid import UUID
+import numpy as np
+from flask.json.provider import DefaultJSONProvider
+
+# Optional native libraries; without them the stdlib encoder is used and
+# responses are only gzip-compressed
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+# Fields of an /api/question response that a `fields` selection may name
+QUESTION_FIELDS = ('answer', 'confidence', 'context', 'sources', 'answer_span')
+
+
+def _default(obj):
+    """Serialize what neither encoder handles natively (orjson: only Decimal)"""
+    if isinstance(obj, (datetime, date)):
+        return obj.isoformat()
+    if isinstance(obj, np.generic):
+        return obj.item()
+    if isinstance(obj, np.ndarray):
+        return obj.tolist()
+    if isinstance(obj, UUID):
+        return str(obj)
+    if isinstance(obj, Decimal):
+        return float(obj)
+    raise TypeError(f"Object of type {type(obj).__name__} is not JSON serializable")
+
+
+class FastJSONProvider(DefaultJSONProvider):
+    """
+    Flask JSON provider backed by orjson, falling back to the stdlib encoder
+
+    Datetimes are written as ISO 8601, numpy scalars and arrays as numbers
+    and lists, and UUIDs as strings. Keys keep their insertion order.
+    """
+
+    sort_keys = False
+
+    def _dumpb(self, obj, indent=False, sort_keys=False):
+        option = orjson.OPT_SERIALIZE_NUMPY | orjson.OPT_NON_STR_KEYS
+        if indent:
+            option |= orjson.OPT_INDENT_2
+        if sort_keys:
+            option |= orjson.OPT_SORT_KEYS
+        return orjson.dumps(obj, default=_default, option=option)
+
+    def dumps(self, obj, **kwargs):
+        if orjson is None:
+            kwargs.setdefault('default', _default)
+            return json.dumps(obj, **kwargs)
+        return self._dumpb(obj, kwargs.get('indent'), kwargs.get('sort_keys')).decode()
+
+    def loads(self, s, **kwargs):
+        if orjson is None:
+            return json.loads(s, **kwargs)
+        return orjson.loads(s)
+
+    def response(self, *args, **kwargs):
+        if orjson is None:
+            return super().response(*args, **kwargs)
+        # Hand orjson's bytes straight to the response instead of decoding them to str
+        obj = self._prepare_response_obj(args, kwargs)
+        indent = self.compact is False or (self.compact is None and self._app.debug)
+        return self._app.response_class(self._dumpb(obj, indent, self.sort_keys) + b"\n", mimetype=self.mimetype)
+
+
+def parse_fields(value, allowed):
+    """
+    Parse a response field selection
+
+    Args:
+        value (str or list): Comma-separated field names or a list of them, None for all fields
+        allowed (tuple): Field names that may be selected
+
+    Returns:
+        list: Selected field names, None when every field is wanted
+
+    Raises:
+        ValueError: If the selection names an unknown field
+    """
+    if value is None or value == '':
+        return None
+    fields = value.split(',') if isinstance(value, str) else value
+    if not isinstance(fields, list) or not all(isinstance(field, str) for field in fields):
+        raise ValueError("fields must be a comma-separated string or a list of names")
+    fields = [field.strip() for field in fields if field.strip()]
+    unknown = [field for field in fields if field not in allowed]
+    if unknown:
+        raise ValueError(f"unknown fields {', '.join(unknown)}; choose from {', '.join(allowed)}")
+    return fields or None
+
+
+def negotiate_encoding(accept_encodings):
+    """
+    Pick the response encoding the client prefers among those available
+
+    Args:
+        accept_encodings: The request's parsed Accept-Encoding header
+
+    Returns:
+        str: 'br' or 'gzip', None to send the body uncompressed
+    """
+    available = ['br', 'gzip'] if brotli is not None else ['gzip']
+    # Equal preference goes to brotli, which compresses JSON smaller
+    encoding = max(available, key=accept_encodings.quality)
+    return encoding if accept_encodings.quality(encoding) > 0 else None
+
+
+def compress_response(response, accept_encodings, min_size=1024, gzip_level=6, brotli_quality=4):
+    """
+    Compress a buffered JSON or text response with gzip or brotli, as negotiated
+
+    Streamed and file responses, and bodies under min_size bytes, are left as they are.
+
+    Args:
+        response: Flask response
+        accept_encodings: The request's parsed Accept-Encoding header
+        min_size (int): Smallest body worth compressing
+        gzip_level (int): gzip compression level
+        brotli_quality (int): brotli quality, low values favour speed
+
+    Returns:
+        The response, compressed in place when worthwhile
+    """
+    if (response.direct_passthrough or response.is_streamed or 'Content-Encoding' in response.headers
+            or not (response.is_json or response.mimetype.startswith('text/'))):
+        return response
+    response.vary.add('Accept-Encoding')
+    if (response.content_length or 0) < min_size:
+        return response
+
+    encoding = negotiate_encoding(accept_encodings)
+    if encoding is None:
+        return response
+    data = response.get_data()
+    if encoding == 'br':
+        response.set_data(brotli.compress(data, quality=brotli_quality))
+    else:
+        response.set_data(gzip.compress(data, compresslevel=gzip_level, mtime=0))
+    response.headers['Content-Encoding'] = encoding
+    return response
@@ -0,0 +1,506 @@
+import atexit
+import multiprocessing
+import os
+import queue
+import signal
+import subprocess
+import sys
+import threading
+import time
+import zlib
+import numpy as np
+from multiprocessing import resource_tracker
+from multiprocessing.connection import Client, Listener
+from multiprocessing.shared_memory import SharedMemory
+from custom_logger import logger
+
+
+def shard_for(doc_id, num_shards):
+    """Shard that owns all chunks of a document"""
+    return zlib.crc32(str(doc_id).encode()) % num_shards
+
+
+def _socket_path(socket_dir, index):
+    return os.path.join(socket_dir, f"shard-{index}.sock")
+
+
+def _connect(address, authkey, wait=0):
+    """Connect to a shard worker, retrying for up to `wait` seconds while it starts"""
+    deadline = time.monotonic() + wait
+    while True:
+        try:
+            return Client(address, family='AF_UNIX', authkey=authkey)
+        except (FileNotFoundError, ConnectionRefusedError):
+            if time.monotonic() > deadline:
+                raise
+            time.sleep(0.1)
+
+
+class _ShardState:
+    """
+    Rows one shard serves: its shared-memory matrix, chunk and document ids
+
+    Each search holds the state it started with, so a reload swaps in a new
+    state without waiting for running searches. The old block is unmapped
+    when the last of them returns.
+    """
+
+    def __init__(self, name=None, shape=(0, 0), chunk_ids=(), doc_ids=(), version=None):
+        self.shm = SharedMemory(name=name) if name else None
+        if self.shm:
+            self.matrix = np.ndarray(shape, dtype=np.float32, buffer=self.shm.buf)
+        else:
+            self.matrix = np.empty(shape, dtype=np.float32)
+        self.chunk_ids = chunk_ids
+        self.doc_ids = doc_ids
+        self.version = version
+        # Rows arrive grouped by document, so each document is one contiguous range
+        self.doc_ranges = {}
+        for row, doc_id in enumerate(doc_ids):
+            self.doc_ranges.setdefault(doc_id, [row, row])[1] = row + 1
+
+    def search(self, query, top_k, doc_id=None):
+        """Local top-k as (similarity, chunk_id, doc_id) tuples"""
+        start, end = self.doc_ranges.get(doc_id, (0, 0)) if doc_id else (0, len(self.chunk_ids))
+        if end <= start:
+            return []
+        scores = self.matrix[start:end] @ query
+        k = min(top_k, len(scores))
+        rows = np.argpartition(-scores, k - 1)[:k]
+        return [(float(scores[row]), self.chunk_ids[start + row], self.doc_ids[start + row]) for row in rows]
+
+    def __del__(self):
+        # Drop the view before closing, or the buffer is still exported
+        self.matrix = None
+        if self.shm:
+            self.shm.close()
+
+
+class _ShardWorker:
+    """State of one shard process and the per-connection request loop"""
+
+    def __init__(self):
+        self.state = _ShardState()
+
+    def serve(self, conn):
+        """Answer requests from one connection until it closes"""
+        try:
+            while True:
+                request = conn.recv()
+                op = request[0]
+                try:
+                    if op == 'search':
+                        _, query, top_k, doc_id = request
+                        # Reading the attribute once pins the state for this search
+                        state = self.state
+                        reply = ('ok', (state.version, state.search(query, top_k, doc_id)))
+                    elif op == 'attach':
+                        _, name, shape, chunk_ids, doc_ids, version = request
+                        self.state = _ShardState(name, shape, chunk_ids, doc_ids, version)
+                        reply = ('ok', len(chunk_ids))
+                    elif op == 'ping':
+                        reply = ('ok', os.getpid())
+                    else:
+                        reply = ('error', f"unknown operation {op}")
+                except Exception as e:
+                    logger.info(f"Error in search shard: {e}")
+                    reply = ('error', str(e))
+                conn.send(reply)
+        except (EOFError, OSError):
+            pass
+        finally:
+            conn.close()
+
+
+def _shard_process(address, authkey):
+    """Entry point of a shard process: serve every connection in its own thread"""
+    signal.signal(signal.SIGINT, signal.SIG_IGN)
+    worker = _ShardWorker()
+    if os.path.exists(address):
+        os.remove(address)
+    listener = Listener(address, family='AF_UNIX', authkey=authkey)
+    while True:
+        try:
+            conn = listener.accept()
+        except Exception as e:
+            logger.info(f"Error accepting search shard connection: {e}")
+            continue
+        # numpy releases the GIL while scoring, so concurrent searches run in parallel
+        threading.Thread(target=worker.serve, args=(conn,), daemon=True).start()
+
+
+class ShardedSearchEngine:
+    """
+    Exact cosine search over chunk embeddings partitioned across worker processes
+
+    One engine runs per host, started by gunicorn.conf.py, app.run or
+    `python -m services.shard_search`. It loads the embeddings from the
+    database into one shared-memory matrix per shard, with each document's
+    chunks placed on a single shard, and hands each block to its shard
+    process. Web workers query the shards directly through
+    ShardSearchClient. Shard processes that die are restarted and given
+    their block again.
+    """
+
+    def __init__(self, embedding_model, num_shards=None, socket_dir='/tmp/qa_rag_search', authkey=None,
+                 timeout=60):
+        """
+        Initialize the engine
+
+        Args:
+            embedding_model: Model for embedding operations, used to load vectors
+            num_shards (int, optional): Number of shards/worker processes, defaults to the CPU count
+            socket_dir (str): Directory for the shards' Unix sockets
+            authkey (bytes): Shared secret clients must present, must not be empty
+            timeout (float): Seconds to wait for a shard process to come up
+        """
+        if not authkey:
+            # An empty key makes the listener skip authentication while clients still wait for it
+            raise ValueError("authkey must be a non-empty shared secret")
+        self.embedding_model = embedding_model
+        self.num_shards = num_shards or multiprocessing.cpu_count()
+        self.socket_dir = socket_dir
+        self.authkey = authkey
+        self.timeout = timeout
+        self.version = None
+
+        # Spawned, so shards do not inherit the database pool or the models
+        self._ctx = multiprocessing.get_context('spawn')
+        self._processes = [None] * self.num_shards
+        self._control = [None] * self.num_shards
+        # (shared memory, attach message) each shard currently serves
+        self._blocks = [(None, None)] * self.num_shards
+        # Serializes reloads and restarts; searches never take it
+        self._load_lock = threading.Lock()
+        self._stop_event = threading.Event()
+
+    def _start_worker(self, index):
+        if self._control[index]:
+            self._control[index].close()
+            self._control[index] = None
+        process = self._ctx.Process(
+            target=_shard_process,
+            args=(_socket_path(self.socket_dir, index), self.authkey),
+            name=f"search-shard-{index}",
+            daemon=True
+        )
+        process.start()
+        self._processes[index] = process
+
+    def _send(self, index, message):
+        """Send a control message to a shard over the engine's own connection"""
+        if self._control[index] is None:
+            self._control[index] = _connect(_socket_path(self.socket_dir, index), self.authkey, self.timeout)
+        conn = self._control[index]
+        conn.send(message)
+        status, payload = conn.recv()
+        if status == 'error':
+            raise RuntimeError(f"search shard {index} failed: {payload}")
+        return payload
+
+    def start(self):
+        """Start the shard processes and a thread restarting any that die"""
+        os.makedirs(self.socket_dir, mode=0o700, exist_ok=True)
+        # Shards must share our resource tracker, or the first one to exit
+        # would unlink blocks the others still serve
+        resource_tracker.ensure_running()
+        for index in range(self.num_shards):
+            self._start_worker(index)
+
+        def monitor():
+            while not self._stop_event.wait(1):
+                for index, process in enumerate(self._processes):
+                    if process.is_alive():
+                        continue
+                    logger.info(f"Error: search shard {index} exited with {process.exitcode}, restarting")
+                    # Restart without the lock, since a reload may be waiting for this shard
+                    self._start_worker(index)
+                    with self._load_lock:
+                        try:
+                            message = self._blocks[index][1]
+                            if message:
+                                self._send(index, message)
+                        except Exception as e:
+                            logger.info(f"Error restarting search shard {index}: {e}")
+
+        threading.Thread(target=monitor, name="search-shard-monitor", daemon=True).start()
+        logger.info(f"started {self.num_shards} search shards")
+
+    def load(self):
+        """
+        (Re)load the active version's embeddings from the database and swap them in
+
+        Returns:
+            int: Number of chunks loaded
+        """
+        version = self.embedding_model.active_version()
+        parts = [([], [], []) for _ in range(self.num_shards)]
+        for chunk_ids, doc_ids, matrix in self.embedding_model.iter_embedding_blocks(version=version):
+            owners = np.array([shard_for(doc_id, self.num_shards) for doc_id in doc_ids])
+            for shard_no in np.unique(owners):
+                rows = np.flatnonzero(owners == shard_no)
+                shard_chunk_ids, shard_doc_ids, matrices = parts[shard_no]
+                shard_chunk_ids.extend(chunk_ids[row] for row in rows)
+                shard_doc_ids.extend(doc_ids[row] for row in rows)
+                matrices.append(matrix[rows])
+
+        blocks = []
+        for chunk_ids, doc_ids, matrices in parts:
+            if matrices:
+                matrix = np.concatenate(matrices)
+            else:
+                matrix = np.empty((0, version['dimension']), dtype=np.float32)
+            # Normalize once so a dot product is the cosine similarity
+            norms = np.linalg.norm(matrix, axis=1, keepdims=True)
+            matrix /= np.where(norms == 0, 1, norms)
+
+            shm = None
+            if len(matrix):
+                shm = SharedMemory(create=True, size=matrix.nbytes)
+                np.ndarray(matrix.shape, dtype=np.float32, buffer=shm.buf)[:] = matrix
+            message = ('attach', shm.name if shm else None, matrix.shape, chunk_ids, doc_ids, version['version'])
+            blocks.append((shm, message))
+
+        with self._load_lock:
+            attached = 0
+            try:
+                for index, block in enumerate(blocks):
+                    self._send(index, block[1])
+                    # The shard has mapped the new block; the old one is freed
+                    # once the shard's last search on it returns
+                    _unlink(self._blocks[index][0])
+                    self._blocks[index] = block
+                    attached += 1
+            finally:
+                for shm, _ in blocks[attached:]:
+                    _unlink(shm)
+            self.version = version
+
+        total = sum(len(message[3]) for _, message in blocks)
+        logger.info(f"loaded {total} chunk embeddings into {self.num_shards} shards")
+        return total
+
+    def start_refresh(self, interval):
+        """Reload embeddings every `interval` seconds in a daemon thread"""
+        def run():
+            while not self._stop_event.wait(interval):
+                try:
+                    self.load()
+                except Exception as e:
+                    logger.info(f"Error reloading search shards: {e}")
+
+        threading.Thread(target=run, name="search-shard-refresh", daemon=True).start()
+
+    def close(self):
+        """Stop the shard processes and free the shared memory"""
+        self._stop_event.set()
+        with self._load_lock:
+            for index, process in enumerate(self._processes):
+                if self._control[index]:
+                    self._control[index].close()
+                    self._control[index] = None
+                if process and process.is_alive():
+                    process.terminate()
+                    process.join(5)
+                _unlink(self._blocks[index][0])
+                self._blocks[index] = (None, None)
+
+
+def _unlink(shm):
+    if shm:
+        shm.close()
+        shm.unlink()
+
+
+class ShardSearchClient:
+    """
+    Query the shards of a ShardedSearchEngine from a web worker
+
+    A query is fanned out to every shard (or only the owning shard when
+    filtered by document), each shard computes its local top-k with numpy,
+    and the partial results are merged. Every concurrent query uses its own
+    pooled connections, so queries never wait on each other. Text and
+    titles are fetched from the database for the final hits only, which
+    also drops chunks of deleted documents.
+    """
+
+    def __init__(self, embedding_model, socket_dir, num_shards=None, authkey=None, timeout=5):
+        """
+        Initialize the client
+
+        Args:
+            embedding_model: Model for embedding operations, used to hydrate hits and as the fallback
+            socket_dir (str): Directory of the shards' Unix sockets
+            num_shards (int, optional): Number of shards of the engine, defaults to the CPU count
+            authkey (bytes): Shared secret of the engine, must not be empty
+            timeout (float): Seconds to wait for a shard before falling back to the database
+        """
+        if not authkey:
+            # An empty key makes the listener skip authentication while clients still wait for it
+            raise ValueError("authkey must be a non-empty shared secret")
+        self.embedding_model = embedding_model
+        self.socket_dir = socket_dir
+        self.num_shards = num_shards or multiprocessing.cpu_count()
+        self.authkey = authkey
+        self.timeout = timeout
+        self._reset()
+        atexit.register(self.close)
+
+    def _reset(self):
+        self._pid = os.getpid()
+        self._idle = [queue.LifoQueue() for _ in range(self.num_shards)]
+
+    def _checkout(self, index):
+        if self._pid != os.getpid():
+            # Forked: connections belong to the parent
+            self._reset()
+        try:
+            return self._idle[index].get_nowait()
+        except queue.Empty:
+            return _connect(_socket_path(self.socket_dir, index), self.authkey)
+
+    def close(self):
+        """Close idle connections"""
+        if self._pid != os.getpid():
+            return
+        for idle in self._idle:
+            while True:
+                try:
+                    idle.get_nowait().close()
+                except queue.Empty:
+                    break
+
+    def search_ids(self, embedding, top_k=5, doc_id=None):
+        """
+        Find the most similar chunks without touching the database
+
+        Args:
+            embedding (list): Query embedding vector
+            top_k (int): Number of results to return
+            doc_id (str, optional): Limit search to specific document
+
+        Returns:
+            tuple: (set of embedding versions the shards hold, list of (chunk_id, doc_id, similarity) best first)
+
+        Raises:
+            OSError, EOFError, TimeoutError, RuntimeError: If a shard cannot be reached or fails
+        """
+        query = np.asarray(embedding, dtype=np.float32)
+        query = query / (np.linalg.norm(query) or 1)
+        doc_id = str(doc_id) if doc_id else None
+        targets = [shard_for(doc_id, self.num_shards)] if doc_id else range(self.num_shards)
+
+        channels = []
+        versions, hits = set(), []
+        try:
+            # Fan out first so shards work in parallel, then gather
+            for index in targets:
+                conn = self._checkout(index)
+                channels.append((index, conn))
+                conn.send(('search', query, top_k, doc_id))
+            for index, conn in channels:
+                if not conn.poll(self.timeout):
+                    raise TimeoutError(f"search shard {index} timed out")
+                status, payload = conn.recv()
+                if status == 'error':
+                    raise RuntimeError(f"search shard {index} failed: {payload}")
+                version, shard_hits = payload
+                versions.add(version)
+                hits.extend(shard_hits)
+        except Exception:
+            # Replies may still be in flight; never reuse these connections
+            for _, conn in channels:
+                conn.close()
+            raise
+        for index, conn in channels:
+            self._idle[index].put(conn)
+
+        hits.sort(reverse=True)
+        return versions, [(chunk_id, hit_doc_id, score) for score, chunk_id, hit_doc_id in hits[:top_k]]
+
+    def search_similar(self, embedding, top_k=5, doc_id=None, version=None, filters=None):
+        """Search for chunks similar to the given embedding
+
+        Drop-in replacement for EmbeddingModel.search_similar. Filtered
+        queries go to the database, since the shards hold no document
+        metadata. So do queries while the shards are unreachable, not loaded
+        yet or hold another embedding version (e.g. right after a migration
+        is activated).
+
+        Args:
+            embedding (list): Query embedding vector
+            top_k (int): Number of results to return
+            doc_id (str, optional): Limit search to specific document
+            version (dict, optional): Embedding version the query was encoded with
+            filters (dict, optional): Document filter expression
+
+        Returns:
+            list: List of dictionaries with chunk text, document title, and similarity score
+        """
+        if not filters:
+            try:
+                # Over-fetch a little so hits from documents deleted since the last load can be dropped
+                versions, hits = self.search_ids(embedding, top_k * 2, doc_id)
+            except Exception as e:
+                logger.info(f"Error querying search shards, using the database: {e}")
+                versions, hits = set(), []
+            expected = {version['version']} if version else versions
+            if len(versions) == 1 and None not in versions and versions == expected:
+                results = self.embedding_model.hydrate([
+                    {'chunk_id': chunk_id, 'doc_id': hit_doc_id, 'similarity': similarity}
+                    for chunk_id, hit_doc_id, similarity in hits
+                ], check_live=True)
+                return results[:top_k]
+        return self.embedding_model.search_similar(embedding, top_k, doc_id, version=version, filters=filters)
+
+
+def create_engine(config):
+    """Build the ShardedSearchEngine described by a config object (e.g. config.Config)"""
+    from models.embedding import EmbeddingModel
+    return ShardedSearchEngine(
+        EmbeddingModel(),
+        num_shards=config.SEARCH_SHARDS,
+        socket_dir=config.SEARCH_SOCKET_DIR,
+        authkey=config.SEARCH_AUTHKEY.encode()
+    )
+
+
+def start_search_process():
+    """
+    Run the configured engine in its own `python -m services.shard_search` process
+
+    Started once per host, before web workers fork, so the corpus is held in
+    memory once rather than once per worker.
+
+    Returns:
+        subprocess.Popen: The engine supervisor; terminate it to stop the shards
+    """
+    root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+    return subprocess.Popen([sys.executable, '-m', 'services.shard_search'], cwd=root)
+
+
+if __name__ == "__main__":
+    from dotenv import load_dotenv
+
+    load_dotenv()
+    # Started with the app server, the secret generated for it is inherited; started
+    # on its own, a generated one would not be known to the web workers
+    if not os.environ.get('SEARCH_AUTHKEY'):
+        sys.exit("Set SEARCH_AUTHKEY to the secret the web workers use to reach the shards")
+    from config import Config
+
+    engine = create_engine(Config)
+    engine.start()
+    try:
+        engine.load()
+    except Exception as e:
+        # Web workers use the database until the next refresh succeeds
+        logger.info(f"Error loading search shards: {e}")
+    engine.start_refresh(Config.SEARCH_SHARD_REFRESH)
+    stopped = threading.Event()
+    signal.signal(signal.SIGTERM, lambda *_: stopped.set())
+    try:
+        stopped.wait()
+    except KeyboardInterrupt:
+        pass
+    engine.close()
@@ -0,0 +1,375 @@
+import argparse
+import io
+import json
+import mmap
+import struct
+import uuid
+import zlib
+from datetime import datetime, timezone
+import numpy as np
+from db.database import get_db_connection, initialize_database, create_vector_indexes, build_document_centroids
+from models.embedding import EmbeddingModel
+from config import Config
+from custom_logger import logger, log_stage
+
+MAGIC = b"QARAGSNP"
+FORMAT_VERSION = 1
+# Blocks start on 64-byte boundaries, so fixed-width columns map as aligned arrays
+ALIGNMENT = 64
+NULL_TIMESTAMP = np.iinfo(np.int64).min
+# PostgreSQL's binary timestamps count microseconds from 2000-01-01
+PG_EPOCH_OFFSET_US = 946684800 * 1000000
+COPY_HEADER = b"PGCOPY\n\xff\r\n\x00" + struct.pack(">ii", 0, 0)
+COPY_TRAILER = struct.pack(">h", -1)
+
+
+class SnapshotWriter:
+    """Writes a snapshot: row groups of column blocks followed by a JSON manifest
+
+    Layout: MAGIC, the column blocks, the manifest, its length as a
+    little-endian uint64, MAGIC. Fixed-width columns (ids, integers,
+    embeddings) are stored raw and little-endian so readers can memory-map
+    them. String columns are an offsets array plus a zlib-compressed UTF-8 blob.
+    """
+
+    def __init__(self, path, info):
+        """
+        Args:
+            path (str): Output file
+            info (dict): Snapshot-wide fields stored in the manifest
+        """
+        self.manifest = {'format': FORMAT_VERSION, **info, 'tables': {}}
+        self.file = open(path, 'wb')
+        self.file.write(MAGIC)
+
+    def _block(self, data, codec='raw'):
+        self.file.write(b"\0" * (-self.file.tell() % ALIGNMENT))
+        offset = self.file.tell()
+        if codec == 'zlib':
+            data = zlib.compress(data, 6)
+        self.file.write(data)
+        return {'offset': offset, 'length': len(data), 'codec': codec}
+
+    def write_group(self, table, columns):
+        """Append a row group of a table
+
+        Args:
+            table (str): Table name
+            columns (dict): Column name -> numpy array (fixed width) or list of str
+        """
+        group = {'rows': 0, 'columns': {}}
+        for name, values in columns.items():
+            if isinstance(values, np.ndarray):
+                values = np.ascontiguousarray(values, dtype=values.dtype.newbyteorder('<'))
+                block = self._block(values.tobytes())
+                block.update(dtype=values.dtype.str, shape=list(values.shape))
+            else:
+                encoded = [value.encode('utf-8') for value in values]
+                offsets = np.zeros(len(encoded) + 1, dtype='<i8')
+                offsets[1:] = np.cumsum([len(value) for value in encoded])
+                block = {
+                    'dtype': 'str',
+                    'offsets': self._block(offsets.tobytes()),
+                    'data': self._block(b"".join(encoded), 'zlib'),
+                }
+            group['rows'] = len(values)
+            group['columns'][name] = block
+        self.manifest['tables'].setdefault(table, []).append(group)
+
+    def close(self):
+        manifest = json.dumps(self.manifest).encode('utf-8')
+        self.file.write(manifest)
+        self.file.write(struct.pack('<Q', len(manifest)))
+        self.file.write(MAGIC)
+        self.file.close()
+
+
+class SnapshotReader:
+    """Memory-maps a snapshot; fixed-width columns are read-only views of the file"""
+
+    def __init__(self, path):
+        """
+        Args:
+            path (str): Snapshot file
+
+        Raises:
+            ValueError: If the file is not a snapshot of a supported format
+        """
+        self.file = open(path, 'rb')
+        self.map = mmap.mmap(self.file.fileno(), 0, access=mmap.ACCESS_READ)
+        if len(self.map) < 24 or self.map[:8] != MAGIC or self.map[-8:] != MAGIC:
+            self.close()
+            raise ValueError(f"{path} is not a snapshot file")
+        (length,) = struct.unpack('<Q', self.map[-16:-8])
+        self.manifest = json.loads(self.map[-16 - length:-16])
+        if self.manifest['format'] != FORMAT_VERSION:
+            self.close()
+            raise ValueError(f"unsupported snapshot format {self.manifest['format']}")
+
+    def rows(self, table):
+        return sum(group['rows'] for group in self.manifest['tables'].get(table, []))
+
+    def groups(self, table):
+        """Yield the row groups of a table as dictionaries of columns"""
+        for group in self.manifest['tables'].get(table, []):
+            yield {name: self._column(block) for name, block in group['columns'].items()}
+
+    def _column(self, block):
+        if block['dtype'] == 'str':
+            offsets = self._array(block['offsets'], '<i8')
+            data = self.map[block['data']['offset']:block['data']['offset'] + block['data']['length']]
+            data = zlib.decompress(data)
+            return [data[start:end].decode('utf-8') for start, end in zip(offsets[:-1], offsets[1:])]
+        return self._array(block, block['dtype']).reshape(block['shape'])
+
+    def _array(self, block, dtype):
+        dtype = np.dtype(dtype)
+        return np.frombuffer(self.map, dtype=dtype, count=block['length'] // dtype.itemsize, offset=block['offset'])
+
+    def close(self):
+        try:
+            self.map.close()
+        except BufferError:
+            # Arrays handed out still reference the mapping; it closes with them
+            pass
+        self.file.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+
+def _uuid_bytes(values):
+    return np.frombuffer(b"".join(uuid.UUID(str(value)).bytes for value in values), dtype=np.uint8).reshape(-1, 16)
+
+def _document_columns(rows):
+    date_added = [
+        NULL_TIMESTAMP if added is None
+        else int(added.replace(tzinfo=timezone.utc).timestamp() * 1000000)
+        for _, _, _, added, _ in rows
+    ]
+    return {
+        'doc_id': _uuid_bytes(row[0] for row in rows),
+        'title': [row[1] for row in rows],
+        'file_path': [row[2] or "" for row in rows],
+        'date_added': np.array(date_added, dtype='<i8'),
+        'metadata': [json.dumps(row[4] or {}) for row in rows],
+    }
+
+def _chunk_columns(chunk_ids, doc_ids, embeddings, rows):
+    """A chunk row group from a block of EmbeddingModel.iter_embedding_blocks and the same chunks' text rows"""
+    if [str(row[0]) for row in rows] != chunk_ids:
+        raise ValueError("chunk text and embeddings were read in different orders")
+    return {
+        'chunk_id': _uuid_bytes(chunk_ids),
+        'doc_id': _uuid_bytes(doc_ids),
+        'chunk_index': np.array([row[1] for row in rows], dtype='<i4'),
+        'text_content': [row[2] for row in rows],
+        'embedding': embeddings,
+    }
+
+def _field(data):
+    """One field of a binary COPY row; None is NULL"""
+    if data is None:
+        return struct.pack(">i", -1)
+    return struct.pack(">i", len(data)) + data
+
+def copy_documents_data(group):
+    """Encode a row group of documents in PostgreSQL's binary COPY format"""
+    out = [COPY_HEADER]
+    for doc_id, title, file_path, added, metadata in zip(
+            group['doc_id'], group['title'], group['file_path'], group['date_added'], group['metadata']):
+        out.append(struct.pack(">h", 5))
+        out.append(_field(doc_id.tobytes()))
+        out.append(_field(title.encode('utf-8')))
+        out.append(_field(file_path.encode('utf-8') if file_path else None))
+        out.append(_field(None if added == NULL_TIMESTAMP else struct.pack(">q", int(added) - PG_EPOCH_OFFSET_US)))
+        # jsonb's binary form is a version byte followed by the JSON text
+        out.append(_field(b"\x01" + metadata.encode('utf-8')))
+    out.append(COPY_TRAILER)
+    return b"".join(out)
+
+def copy_chunks_data(group):
+    """Encode a row group of chunks in PostgreSQL's binary COPY format"""
+    embeddings = group['embedding']
+    # pgvector's binary form: int16 dimension, int16 unused, big-endian float4s
+    vector_header = struct.pack(">hh", embeddings.shape[1], 0)
+    vectors = embeddings.astype('>f4')
+    out = [COPY_HEADER]
+    for i, text in enumerate(group['text_content']):
+        out.append(struct.pack(">h", 5))
+        out.append(_field(group['chunk_id'][i].tobytes()))
+        out.append(_field(group['doc_id'][i].tobytes()))
+        out.append(_field(struct.pack(">i", int(group['chunk_index'][i]))))
+        out.append(_field(text.encode('utf-8')))
+        out.append(_field(vector_header + vectors[i].tobytes()))
+    out.append(COPY_TRAILER)
+    return b"".join(out)
+
+
+def export_snapshot(path, row_group_size=None):
+    """Write live documents and their chunks, with active-version embeddings, to a snapshot file
+
+    Both tables are read in one repeatable-read transaction, so the snapshot
+    is consistent even while documents are being uploaded or deleted.
+
+    Args:
+        path (str): Output file
+        row_group_size (int, optional): Rows per group, defaults to Config.SNAPSHOT_ROW_GROUP
+
+    Returns:
+        dict: Number of documents and chunks written, None on error
+    """
+    row_group_size = row_group_size or Config.SNAPSHOT_ROW_GROUP
+    embedding_model = EmbeddingModel()
+    version = embedding_model.active_version()
+    column = version['column_name']
+    conn = None
+    try:
+        conn = get_db_connection()
+        conn.set_session(isolation_level='REPEATABLE READ', readonly=True)
+        writer = SnapshotWriter(path, {
+            'model_name': version['model_name'],
+            'dimension': version['dimension'],
+            'created_at': datetime.now(timezone.utc).isoformat(),
+        })
+
+        with log_stage("export_documents", logger), conn.cursor(name="snapshot_documents") as cur:
+            cur.itersize = row_group_size
+            cur.execute("""
+                SELECT doc_id, title, file_path, date_added, metadata
+                FROM documents WHERE deleted_at IS NULL
+                ORDER BY doc_id
+            """)
+            while rows := cur.fetchmany(row_group_size):
+                writer.write_group('documents', _document_columns(rows))
+
+        # Embeddings come from a binary COPY in the same transaction; the text is read
+        # alongside in the same order, one block at a time
+        with log_stage("export_chunks", logger), conn.cursor(name="snapshot_chunks") as cur:
+            cur.itersize = row_group_size
+            cur.execute(f"""
+                SELECT c.chunk_id, c.chunk_index, c.text_content
+                FROM chunks c
+                JOIN documents d ON c.doc_id = d.doc_id
+                WHERE d.deleted_at IS NULL AND c.{column} IS NOT NULL
+                ORDER BY c.doc_id, c.chunk_index
+            """)
+            for chunk_ids, doc_ids, embeddings in embedding_model.iter_embedding_blocks(row_group_size, version, conn):
+                rows = cur.fetchmany(len(chunk_ids))
+                writer.write_group('chunks', _chunk_columns(chunk_ids, doc_ids, embeddings, rows))
+                logger.info(f"exported {sum(g['rows'] for g in writer.manifest['tables']['chunks'])} chunks")
+
+        writer.close()
+        counts = {table: sum(group['rows'] for group in writer.manifest['tables'].get(table, []))
+                  for table in ('documents', 'chunks')}
+        logger.info(f"snapshot written to {path}: {counts['documents']} documents, {counts['chunks']} chunks")
+        return counts
+    except Exception as e:
+        logger.info(f"Error exporting snapshot: {e}")
+        return None
+    finally:
+        if conn:
+            conn.close()
+
+
+def import_snapshot(path):
+    """Restore a snapshot into an empty database without re-encoding anything
+
+    Rows are bulk-loaded with binary COPY. The vector indexes are dropped
+    for the load and built once at the end, over the full data. The whole
+    restore is one transaction.
+
+    Args:
+        path (str): Snapshot file
+
+    Returns:
+        dict: Number of documents and chunks restored, None on error
+    """
+    conn = None
+    try:
+        with SnapshotReader(path) as reader:
+            initialize_database()
+            version = EmbeddingModel().active_version()
+            column = version['column_name']
+            manifest = reader.manifest
+            if (manifest['model_name'], manifest['dimension']) != (version['model_name'], version['dimension']):
+                logger.info(f"Error: snapshot embeddings are from {manifest['model_name']} "
+                            f"(dim {manifest['dimension']}), the database expects {version['model_name']} "
+                            f"(dim {version['dimension']}); set EMBEDDING_MODEL and EMBEDDING_DIM to match")
+                return None
+
+            conn = get_db_connection()
+            with conn.cursor() as cur:
+                cur.execute("SELECT EXISTS (SELECT 1 FROM documents)")
+                if cur.fetchone()[0]:
+                    logger.info("Error: snapshots can only be imported into an empty database")
+                    return None
+
+                for index in (f"chunks_{column}_idx", f"chunks_{column}_half_idx",
+                              f"chunks_{column}_bin_idx", f"document_centroids_{column}_idx"):
+                    cur.execute(f"DROP INDEX IF EXISTS {index}")
+
+                with log_stage("copy_documents", logger):
+                    for group in reader.groups('documents'):
+                        cur.copy_expert(
+                            "COPY documents (doc_id, title, file_path, date_added, metadata) FROM STDIN WITH (FORMAT binary)",
+                            io.BytesIO(copy_documents_data(group))
+                        )
+                with log_stage("copy_chunks", logger):
+                    loaded = 0
+                    for group in reader.groups('chunks'):
+                        cur.copy_expert(
+                            f"COPY chunks (chunk_id, doc_id, chunk_index, text_content, {column}) FROM STDIN WITH (FORMAT binary)",
+                            io.BytesIO(copy_chunks_data(group))
+                        )
+                        loaded += len(group['text_content'])
+                        logger.info(f"loaded {loaded}/{reader.rows('chunks')} chunks")
+
+                with log_stage("build_centroids", logger):
+                    build_document_centroids(cur, column)
+                with log_stage("build_indexes", logger):
+                    cur.execute("SET LOCAL maintenance_work_mem = %s", (Config.SNAPSHOT_INDEX_MEMORY,))
+                    create_vector_indexes(cur, version['dimension'], column)
+                cur.execute("ANALYZE documents")
+                cur.execute("ANALYZE chunks")
+                cur.execute("ANALYZE document_centroids")
+            conn.commit()
+
+            counts = {'documents': reader.rows('documents'), 'chunks': reader.rows('chunks')}
+            logger.info(f"snapshot {path} restored: {counts['documents']} documents, {counts['chunks']} chunks")
+            return counts
+    except Exception as e:
+        if conn:
+            conn.rollback()
+        logger.info(f"Error importing snapshot: {e}")
+        return None
+    finally:
+        if conn:
+            conn.close()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Export or restore documents, chunks and embeddings")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+    export = subparsers.add_parser("export", help="write a snapshot of the live corpus")
+    export.add_argument("path")
+    export.add_argument("--row-group-size", type=int, default=Config.SNAPSHOT_ROW_GROUP)
+    restore = subparsers.add_parser("import", help="restore a snapshot into an empty database")
+    restore.add_argument("path")
+    info = subparsers.add_parser("info", help="show what a snapshot contains")
+    info.add_argument("path")
+    args = parser.parse_args()
+
+    if args.command == "export":
+        export_snapshot(args.path, args.row_group_size)
+    elif args.command == "import":
+        import_snapshot(args.path)
+    else:
+        with SnapshotReader(args.path) as reader:
+            print(f"{reader.manifest['model_name']} dim={reader.manifest['dimension']} "
+                  f"created {reader.manifest['created_at']}")
+            for table, groups in reader.manifest['tables'].items():
+                print(f"{table:<10} {reader.rows(table):>10} rows in {len(groups)} groups")
@@ -0,0 +1,264 @@
+import fcntl
+import glob
+import hashlib
+import json
+import os
+import time
+import uuid
+from werkzeug.exceptions import RequestEntityTooLarge
+from werkzeug.utils import secure_filename
+from custom_logger import logger
+
+class UploadService:
+    """Service for streaming uploads to disk without buffering whole files"""
+
+    def __init__(self, upload_folder, chunk_size=1024 * 1024, max_size=None):
+        """
+        Initialize the upload service
+
+        Args:
+            upload_folder (str): Directory where uploaded files are stored
+            chunk_size (int): Bytes read from the request stream at a time
+            max_size (int, optional): Largest resumable upload, for sessions without a total_size
+        """
+        self.upload_folder = upload_folder
+        self.session_folder = os.path.join(upload_folder, '.sessions')
+        self.chunk_size = chunk_size
+        self.max_size = max_size
+        os.makedirs(self.session_folder, exist_ok=True)
+
+    def _unique_path(self, filename):
+        """Build a collision-free destination path for an uploaded file"""
+        return os.path.join(self.upload_folder, f"{uuid.uuid4().hex}-{secure_filename(filename)}")
+
+    def _copy_stream(self, stream, out, hasher=None, limit=None):
+        """Copy a stream to an open file chunk by chunk, returning bytes written"""
+        written = 0
+        while True:
+            chunk = stream.read(self.chunk_size)
+            if not chunk:
+                break
+            if limit is not None and written + len(chunk) > limit:
+                raise RequestEntityTooLarge(f"Chunk exceeds the declared upload size by {written + len(chunk) - limit} bytes")
+            out.write(chunk)
+            if hasher:
+                hasher.update(chunk)
+            written += len(chunk)
+        return written
+
+    def save_stream(self, stream, filename):
+        """
+        Write a stream to a uniquely named file, hashing it on the fly
+
+        Args:
+            stream: File-like object to read from (e.g. request.stream)
+            filename (str): Original client filename
+
+        Returns:
+            tuple: (file_path, sha256 hex digest, size in bytes), None on error
+        """
+        file_path = self._unique_path(filename)
+        part_path = file_path + '.part'
+        hasher = hashlib.sha256()
+        try:
+            with open(part_path, 'wb') as out:
+                size = self._copy_stream(stream, out, hasher)
+            # Only expose the file under its final name once it is complete
+            os.replace(part_path, file_path)
+            return file_path, hasher.hexdigest(), size
+        except Exception as e:
+            if os.path.exists(part_path):
+                os.remove(part_path)
+            if isinstance(e, RequestEntityTooLarge):
+                # Let Flask answer 413 rather than report a failed save
+                raise
+            logger.info(f"Error saving upload: {e}")
+            return None
+
+    @staticmethod
+    def _lock(f):
+        """Take an exclusive, non-blocking lock on an open session file; False if another request holds it"""
+        try:
+            fcntl.flock(f, fcntl.LOCK_EX | fcntl.LOCK_NB)
+            return True
+        except BlockingIOError:
+            return False
+
+    def _session_paths(self, upload_id):
+        upload_id = secure_filename(upload_id)
+        base = os.path.join(self.session_folder, upload_id)
+        return base + '.json', base + '.part'
+
+    def create_session(self, filename, total_size=None):
+        """
+        Start a resumable chunked upload
+
+        Args:
+            filename (str): Original client filename
+            total_size (int, optional): Expected size of the complete file
+
+        Returns:
+            str: Upload ID
+        """
+        upload_id = uuid.uuid4().hex
+        meta_path, part_path = self._session_paths(upload_id)
+        with open(meta_path, 'w') as f:
+            json.dump({'filename': filename, 'total_size': total_size}, f)
+        open(part_path, 'wb').close()
+        return upload_id
+
+    def get_session(self, upload_id):
+        """
+        Get the state of a resumable upload
+
+        Args:
+            upload_id (str): Upload ID
+
+        Returns:
+            dict: filename, total_size and current offset, or None if unknown
+        """
+        meta_path, part_path = self._session_paths(upload_id)
+        try:
+            with open(meta_path) as f:
+                session = json.load(f)
+            session['offset'] = os.path.getsize(part_path)
+        except FileNotFoundError:
+            # Unknown, or completed/expired concurrently
+            return None
+        return session
+
+    def append_chunk(self, upload_id, offset, stream):
+        """
+        Append a chunk to a resumable upload
+
+        The offset must match the number of bytes already received, so a
+        client that lost a response can ask for the offset and resume from it.
+        The part file is locked while the chunk is written, so a concurrent
+        append or completion of the same upload is rejected instead of
+        interleaving bytes.
+
+        Args:
+            upload_id (str): Upload ID
+            offset (int): Byte offset the chunk starts at
+            stream: File-like object with the chunk body
+
+        Returns:
+            int: New offset, or None if the session is unknown, busy or the offset does not match
+
+        Raises:
+            RequestEntityTooLarge: If the chunk runs past the session's total_size,
+                or past max_size when it has none
+        """
+        session = self.get_session(upload_id)
+        if not session or session['offset'] != offset:
+            return None
+
+        _, part_path = self._session_paths(upload_id)
+        try:
+            out = open(part_path, 'ab')
+        except FileNotFoundError:
+            return None
+        with out:
+            if not self._lock(out):
+                return None
+            # Another request may have appended between the check above and the lock
+            if os.fstat(out.fileno()).st_size != offset:
+                return None
+            total_size = session['total_size'] if session['total_size'] is not None else self.max_size
+            limit = total_size - offset if total_size is not None else None
+            try:
+                written = self._copy_stream(stream, out, limit=limit)
+            except RequestEntityTooLarge:
+                # Drop the partial chunk so the client can resend it at the same offset
+                out.truncate(offset)
+                raise
+        return offset + written
+
+    def complete_session(self, upload_id, expected_sha256=None):
+        """
+        Finish a resumable upload and move it into the upload folder
+
+        Args:
+            upload_id (str): Upload ID
+            expected_sha256 (str, optional): Digest the client computed
+
+        Returns:
+            tuple: (file_path, sha256 hex digest, size in bytes), None on error
+        """
+        session = self.get_session(upload_id)
+        if not session:
+            return None
+        if session['total_size'] is not None and session['offset'] != session['total_size']:
+            logger.info(f"Error: upload {upload_id} incomplete ({session['offset']}/{session['total_size']} bytes)")
+            return None
+
+        meta_path, part_path = self._session_paths(upload_id)
+        hasher = hashlib.sha256()
+        with open(part_path, 'rb') as f:
+            if not self._lock(f):
+                logger.info(f"Error: upload {upload_id} is still receiving a chunk")
+                return None
+            size = 0
+            for chunk in iter(lambda: f.read(self.chunk_size), b''):
+                hasher.update(chunk)
+                size += len(chunk)
+            if session['total_size'] is not None and size != session['total_size']:
+                logger.info(f"Error: upload {upload_id} incomplete ({size}/{session['total_size']} bytes)")
+                return None
+            digest = hasher.hexdigest()
+            if expected_sha256 and expected_sha256.lower() != digest:
+                logger.info(f"Error: checksum mismatch for upload {upload_id}")
+                return None
+
+            file_path = self._unique_path(session['filename'])
+            os.replace(part_path, file_path)
+            os.remove(meta_path)
+        return file_path, digest, size
+
+    def abort_session(self, upload_id):
+        """
+        Discard a resumable upload
+
+        Args:
+            upload_id (str): Upload ID
+
+        Returns:
+            bool: True if the session existed, False otherwise
+        """
+        found = False
+        for path in self._session_paths(upload_id):
+            if os.path.exists(path):
+                os.remove(path)
+                found = True
+        return found
+
+    def expire_sessions(self, max_age):
+        """
+        Discard resumable uploads that have not received a chunk in max_age seconds
+
+        Args:
+            max_age (float): Seconds of inactivity after which a session is removed
+
+        Returns:
+            int: Number of sessions removed
+        """
+        cutoff = time.time() - max_age
+        expired = 0
+        for meta_path in glob.glob(os.path.join(self.session_folder, '*.json')):
+            part_path = meta_path[:-len('.json')] + '.part'
+            try:
+                with open(part_path, 'rb') as f:
+                    # Sessions with a chunk in flight are busy, not idle
+                    if os.fstat(f.fileno()).st_mtime >= cutoff or not self._lock(f):
+                        continue
+                    os.remove(part_path)
+                    os.remove(meta_path)
+            except FileNotFoundError:
+                continue
+            except Exception as e:
+                logger.info(f"Error expiring upload session {meta_path}: {e}")
+                continue
+            expired += 1
+        if expired:
+            logger.info(f"expired {expired} idle upload sessions")
+        return expired
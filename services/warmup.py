@@ -0,0 +1,141 @@
+import functools
+import threading
+import time
+from custom_logger import logger, log_stage
+
+WARMUP_QUESTION = "What is the main topic covered in this document?"
+WARMUP_PASSAGE = ("Warmup passage with ordinary sentences about documents, questions and answers. "
+                  "It is long enough to fill a chunk the way uploaded text does. ")
+
+class Warmup:
+    """Startup warmup of the models and search indexes, gating readiness
+
+    Until it succeeds the first real requests would pay for lazy model
+    initialization and cold index pages, so /readyz reports not ready.
+    """
+
+    def __init__(self, qa_service, embedding_model, batch_sizes=(1, 8, 32), top_k=5, prewarm=True,
+                 retry_interval=5):
+        """
+        Initialize the warmup
+
+        Args:
+            qa_service: QuestionAnsweringService whose models are warmed
+            embedding_model: Model for embedding operations, whose indexes are prewarmed
+            batch_sizes (list): Passages per encode pass, one pass per size
+            top_k (int): Chunks in the QA pass context, as answer_question uses
+            prewarm (bool): Load the vector index and tables into Postgres buffers
+            retry_interval (float): Seconds to wait before retrying a failed warmup
+        """
+        self.qa_service = qa_service
+        self.embedding_model = embedding_model
+        self.batch_sizes = list(batch_sizes)
+        self.top_k = top_k
+        self.prewarm = prewarm
+        self.retry_interval = retry_interval
+
+        self._state = 'pending'
+        self._steps = []
+        self._duration_ms = None
+        self._stop_event = threading.Event()
+        self._thread = None
+
+    @property
+    def ready(self):
+        return self._state == 'ready'
+
+    def status(self):
+        """Warmup progress for /readyz
+
+        Returns:
+            dict: state (pending, running, failed or ready), duration_ms and the
+                last run's steps with their timings
+        """
+        return {'state': self._state, 'duration_ms': self._duration_ms, 'steps': list(self._steps)}
+
+    def _passages(self, count):
+        chunk_size = self.qa_service.chunk_size
+        passage = (WARMUP_PASSAGE * (chunk_size // len(WARMUP_PASSAGE) + 1))[:chunk_size]
+        return [passage] * count
+
+    def _encode(self, batch_size):
+        version = self.embedding_model.active_version()
+        embeddings = self.qa_service._encoder_for(version).encode(self._passages(batch_size))
+        return {'batch_size': batch_size, 'dimension': int(embeddings.shape[-1])}
+
+    def _answer(self):
+        context = " ".join(self._passages(self.top_k))
+        self.qa_service.qa_pipeline(question=WARMUP_QUESTION, context=context)
+        return {'context_chars': len(context)}
+
+    def _search(self):
+        _, sources = self.qa_service.retrieve_context(WARMUP_QUESTION, top_k=self.top_k)
+        return {'sources': len(sources)}
+
+    def _prewarm(self):
+        result = self.embedding_model.prewarm()
+        if result is None:
+            raise RuntimeError("prewarming the search indexes failed")
+        return result
+
+    def _step(self, name, func, required):
+        """Run one warmup step, recording its timing and outcome"""
+        start_time = time.perf_counter()
+        step = {'name': name, 'required': required}
+        try:
+            with log_stage(f"warmup_{name}", logger):
+                step['detail'] = func()
+            step['ok'] = True
+        except Exception as e:
+            logger.info(f"Error in warmup step {name}: {e}")
+            step['ok'] = False
+            step['error'] = str(e)
+        step['duration_ms'] = round((time.perf_counter() - start_time) * 1000, 1)
+        return step
+
+    def run(self):
+        """
+        Run every warmup step once: encode passes at each batch size, a QA pass,
+        a search and the index prewarm. Search and prewarm are best effort.
+
+        Returns:
+            bool: True if every required step succeeded
+        """
+        self._state = 'running'
+        start_time = time.perf_counter()
+        plan = [(f"encode_batch_{n}", functools.partial(self._encode, n), True) for n in self.batch_sizes]
+        plan.append(("qa", self._answer, True))
+        plan.append(("search", self._search, False))
+        if self.prewarm:
+            plan.append(("prewarm", self._prewarm, False))
+
+        steps = []
+        for name, func, required in plan:
+            steps.append(self._step(name, func, required))
+            self._steps = list(steps)
+
+        self._duration_ms = round((time.perf_counter() - start_time) * 1000, 1)
+        ok = all(step['ok'] for step in steps if step['required'])
+        self._state = 'ready' if ok else 'failed'
+        logger.info(f"warmup {'completed' if ok else 'failed'} in {self._duration_ms:.1f}ms")
+        return ok
+
+    def _run(self):
+        # Models served by the inference pool may still be loading; keep trying
+        while not self.run():
+            if self._stop_event.wait(self.retry_interval):
+                break
+
+    def start(self):
+        """Run the warmup in a daemon thread, so liveness checks are served meanwhile"""
+        if self._thread and self._thread.is_alive():
+            return
+        self._stop_event.clear()
+        self._thread = threading.Thread(target=self._run, name="warmup", daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        """Stop retrying a failed warmup"""
+        self._stop_event.set()
+        if self._thread:
+            self._thread.join()
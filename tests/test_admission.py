@@ -0,0 +1,91 @@
+import unittest
+import os
+import shutil
+import tempfile
+from unittest.mock import patch
+from flask import Flask, jsonify, request
+from config import Config
+from services.admission import AdmissionController, question_cost, search_cost
+
+
+class TestAdmissionController(unittest.TestCase):
+
+    def setUp(self):
+        self.tmp_dir = tempfile.mkdtemp()
+        self.policies = {'question': {'rate': 1.0, 'burst': 5.0, 'concurrency': 2}}
+        self.admission = AdmissionController(os.path.join(self.tmp_dir, 'admission.sqlite3'), self.policies)
+
+    def tearDown(self):
+        shutil.rmtree(self.tmp_dir)
+
+    @patch('services.admission.time.time', return_value=1000.0)
+    def test_token_bucket(self, mock_time):
+        """Test costly requests drain the bucket and get a Retry-After"""
+        slot_id, status, _ = self.admission.try_acquire('question', 4)
+        self.assertIsNotNone(slot_id)
+        self.admission.release(slot_id)
+
+        slot_id, status, retry_after = self.admission.try_acquire('question', 3)
+        self.assertIsNone(slot_id)
+        self.assertEqual(status, 429)
+        self.assertEqual(retry_after, 2)
+
+        # Tokens refill with time
+        mock_time.return_value = 1002.0
+        slot_id, status, _ = self.admission.try_acquire('question', 3)
+        self.assertIsNotNone(slot_id)
+
+    def test_concurrency_cap(self):
+        """Test requests beyond the concurrency cap are shed with 503"""
+        first, _, _ = self.admission.try_acquire('question', 1)
+        second, _, _ = self.admission.try_acquire('question', 1)
+        slot_id, status, retry_after = self.admission.try_acquire('question', 1)
+
+        self.assertIsNone(slot_id)
+        self.assertEqual(status, 503)
+        self.assertEqual(retry_after, 1)
+
+        self.admission.release(first)
+        slot_id, _, _ = self.admission.try_acquire('question', 1)
+        self.assertIsNotNone(slot_id)
+
+    def test_shared_between_instances(self):
+        """Test controllers on the same file (e.g. other workers) share state"""
+        other = AdmissionController(self.admission.db_path, self.policies)
+        self.admission.try_acquire('question', 1)
+        other.try_acquire('question', 1)
+
+        slot_id, status, _ = self.admission.try_acquire('question', 1)
+        self.assertEqual(status, 503)
+
+    def test_admit_decorator(self):
+        """Test the decorator rejects with Retry-After and releases on close"""
+        app = Flask(__name__)
+
+        @app.route('/q')
+        @self.admission.admit('question', lambda req: 4)
+        def view():
+            return jsonify({'ok': True}), 200
+
+        client = app.test_client()
+        self.assertEqual(client.get('/q').status_code, 200)
+        response = client.get('/q')
+        self.assertEqual(response.status_code, 429)
+        self.assertIn('Retry-After', response.headers)
+
+    def test_costs_clamped_to_valid_requests(self):
+        """Test out-of-range top_k and window cost no more than the largest request the views accept"""
+        app = Flask(__name__)
+        largest = {'query': 'q', 'top_k': Config.SEARCH_MAX_TOP_K, 'window': Config.SEARCH_MAX_WINDOW}
+        with app.test_request_context(json=largest):
+            expected_search = search_cost(request)
+            expected_question = question_cost(request)
+        with app.test_request_context(json={'query': 'q', 'top_k': 100000, 'window': 100}):
+            self.assertEqual(search_cost(request), expected_search)
+            self.assertEqual(question_cost(request), expected_question)
+        with app.test_request_context(json={'query': 'q', 'top_k': -5, 'window': -1}):
+            self.assertGreater(search_cost(request), 0)
+
+
+if __name__ == '__main__':
+    unittest.main()
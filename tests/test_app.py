@@ -1,7 +1,13 @@
 import unittest
+import gzip
 import json
+import os
+import shutil
+import socket
+import tempfile
 from unittest.mock import patch, MagicMock
-from app import app
+from app import app, admission, _client_disconnected
+from services.admission import AdmissionController
 from services.qa_service import QuestionAnsweringService
 from models.document import DocumentModel
 from flask import Flask
@@ -13,6 +19,15 @@ class FlaskAppTestCase(unittest.TestCase):
         self.app = app.test_client()
         self.app.testing = True
 
+        # Fresh admission state per test: the test client never closes responses, so
+        # their slots would stay taken in a shared file for the lease timeout
+        self.tmp_dir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.tmp_dir)
+        state = AdmissionController(os.path.join(self.tmp_dir, 'admission.sqlite3'), admission.policies)
+        patcher = patch.object(admission, 'db_path', state.db_path)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
         # Mocking the database and services to avoid hitting real DBs or external services
         self.mock_document_model = MagicMock(spec=DocumentModel)
         self.mock_embedding_model = MagicMock()
@@ -71,6 +86,27 @@ class FlaskAppTestCase(unittest.TestCase):
         self.assertIn('answer', response.json)
         self.assertEqual(response.json['answer'], 'Test answer')
 
+    @patch('services.qa_service.QuestionAnsweringService.answer_question', return_value={'answer': 'Test answer'})
+    def test_answer_question_fields(self, mock_answer_question):
+        """Test field selection and offsets are passed on, and unknown fields rejected"""
+        response = self.app.post('/api/question?fields=answer,sources', json={'question': 'What is Quality?', 'offsets': True})
+        self.assertEqual(response.status_code, 200)
+        mock_answer_question.assert_called_once_with('What is Quality?', None, 5, None, offsets=True, fields=['answer', 'sources'])
+
+        response = self.app.post('/api/question', json={'question': 'What is Quality?', 'fields': 'answer,score'})
+        self.assertEqual(response.status_code, 400)
+        self.assertIn('Invalid fields', response.json['error'])
+
+    @patch('services.qa_service.QuestionAnsweringService.answer_question',
+           return_value={'answer': 'Test answer', 'context': 'quality ' * 500})
+    def test_answer_question_gzip(self, mock_answer_question):
+        """Test large answers are compressed for clients accepting gzip"""
+        response = self.app.post('/api/question', json={'question': 'What is Quality?'},
+                                 headers={'Accept-Encoding': 'gzip'})
+        self.assertEqual(response.headers['Content-Encoding'], 'gzip')
+        self.assertIn('Accept-Encoding', response.headers['Vary'])
+        self.assertEqual(json.loads(gzip.decompress(response.data))['answer'], 'Test answer')
+
     @patch('services.qa_service.QuestionAnsweringService.answer_question', return_value={'answer': 'Test answer'})
     def test_answer_question_missing_field(self, mock_answer_question):
         """Test error when question is missing"""
@@ -79,6 +115,104 @@ class FlaskAppTestCase(unittest.TestCase):
         self.assertEqual(response.status_code, 400)
         self.assertIn('Question is required', response.json['error'])
 
+    @patch('services.qa_service.QuestionAnsweringService.answer_question_stream',
+           return_value=(event for event in [('sources', {'sources': []}), ('answer', {'answer': 'Test answer'})]))
+    def test_answer_question_stream(self, mock_answer_question_stream):
+        """Test streaming an answer as server-sent events"""
+        response = self.app.post('/api/question/stream', json={'question': 'What is Quality?'})
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.mimetype, 'text/event-stream')
+        body = response.get_data(as_text=True)
+        self.assertLess(body.index('event: sources'), body.index('event: answer'))
+
+    def test_client_disconnected(self):
+        """Test a hung-up client is detected from the server's socket, and unknown servers never cancel"""
+        server, client = socket.socketpair()
+        self.addCleanup(server.close)
+        environ = {'werkzeug.socket': server}
+
+        self.assertFalse(_client_disconnected(environ))
+        client.close()
+        self.assertTrue(_client_disconnected(environ))
+        self.assertFalse(_client_disconnected({}))
+
+    @patch('services.qa_service.QuestionAnsweringService.search', return_value=[[{'chunk_id': '1', 'similarity': 0.9}], []])
+    def test_search(self, mock_search):
+        """Test batched retrieval without the QA model"""
+        data = {'queries': ['What is Quality?', 'What is testing?'], 'top_k': 3, 'window': 1,
+                'filter': {'category': 'manual'}}
+        response = self.app.post('/api/search', json=data)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(len(response.json['results']), 2)
+        mock_search.assert_called_once_with(
+            data['queries'], top_k=3, doc_id=None, metadata=None, min_similarity=None, window=1,
+            filters={'category': 'manual'}
+        )
+
+    def test_search_invalid_filter(self):
+        """Test malformed filter expressions are rejected before searching"""
+        data = {'query': 'What is Quality?', 'filter': {'year': {'between': [2020, 2024]}}}
+        response = self.app.post('/api/search', json=data)
+        self.assertEqual(response.status_code, 400)
+        self.assertIn('Invalid filter', response.json['error'])
+
+    def test_search_out_of_range(self):
+        """Test top_k outside 1..SEARCH_MAX_TOP_K and negative windows are rejected"""
+        for data in ({'query': 'What is Quality?', 'top_k': 0},
+                     {'query': 'What is Quality?', 'top_k': 100000},
+                     {'query': 'What is Quality?', 'window': -1}):
+            response = self.app.post('/api/search', json=data)
+            self.assertEqual(response.status_code, 400)
+
+    def test_search_out_of_range_does_not_drain_budget(self):
+        """Test malformed searches are charged as the largest valid one, not the whole bucket"""
+        data = {'query': 'What is Quality?', 'top_k': 100000, 'window': 100}
+        for _ in range(5):
+            self.assertEqual(self.app.post('/api/search', json=data).status_code, 400)
+
+    def test_create_upload_requires_size(self):
+        """Test resumable uploads must declare their size, which bounds what can be appended"""
+        for data in ({'filename': 'manual-testing.pdf'},
+                     {'filename': 'manual-testing.pdf', 'size': -1}):
+            response = self.app.post('/api/uploads', json=data)
+            self.assertEqual(response.status_code, 400)
+
+        response = self.app.post('/api/uploads', json={'filename': 'manual-testing.pdf',
+                                                       'size': app.config['STREAM_MAX_CONTENT_LENGTH'] + 1})
+        self.assertEqual(response.status_code, 413)
+
+    def test_search_missing_query(self):
+        """Test error when no query is given"""
+        response = self.app.post('/api/search', json={})
+        self.assertEqual(response.status_code, 400)
+        self.assertIn('Query is required', response.json['error'])
+
+    def test_admin_profiles_require_token(self):
+        """Test admin endpoints are hidden from callers without the admin token"""
+        response = self.app.get('/api/admin/profiles', headers={'X-Admin-Token': 'guess'})
+        self.assertEqual(response.status_code, 404)
+
+    def test_healthz(self):
+        """Test the liveness check answers regardless of warmup"""
+        response = self.app.get('/healthz')
+        self.assertEqual(response.status_code, 200)
+
+    @patch.dict(app.config, {'WARMUP_ENABLED': True})
+    def test_readyz_gated_on_warmup(self):
+        """Test readiness is reported only once the warmup has completed"""
+        with patch('app.warmup') as mock_warmup:
+            mock_warmup.ready = False
+            mock_warmup.status.return_value = {'state': 'running', 'duration_ms': None, 'steps': []}
+            response = self.app.get('/readyz')
+            self.assertEqual(response.status_code, 503)
+            self.assertFalse(response.json['ready'])
+
+            mock_warmup.ready = True
+            mock_warmup.status.return_value = {'state': 'ready', 'duration_ms': 812.5, 'steps': [{'name': 'qa', 'ok': True}]}
+            response = self.app.get('/readyz')
+            self.assertEqual(response.status_code, 200)
+            self.assertEqual(response.json['steps'][0]['name'], 'qa')
+
 
 if __name__ == '__main__':
     unittest.main()
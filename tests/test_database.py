@@ -0,0 +1,72 @@
+import unittest
+import threading
+from unittest.mock import patch
+from psycopg2.pool import PoolError
+from config import Config
+import db.database as database
+
+
+class TestPooledConnection(unittest.TestCase):
+
+    def setUp(self):
+        self.max_patcher = patch.object(Config, 'DB_POOL_MAX', 1)
+        self.max_patcher.start()
+        self.addCleanup(self.max_patcher.stop)
+        self.pool_patcher = patch('db.database.ThreadedConnectionPool')
+        self.mock_pool_class = self.pool_patcher.start()
+        self.addCleanup(self.pool_patcher.stop)
+        self.mock_pool_class.return_value.getconn.return_value.closed = 0
+        database._pool = None
+        self.addCleanup(setattr, database, '_pool', None)
+
+    def test_waits_for_a_free_connection(self):
+        """Test a borrower waits for a returned connection instead of failing at DB_POOL_MAX"""
+        borrowed = threading.Event()
+        release = threading.Event()
+
+        def hold():
+            with database.pooled_connection():
+                borrowed.set()
+                release.wait()
+
+        holder = threading.Thread(target=hold)
+        holder.start()
+        borrowed.wait()
+        threading.Timer(0.05, release.set).start()
+
+        with database.pooled_connection(timeout=5) as conn:
+            self.assertIs(conn, self.mock_pool_class.return_value.getconn.return_value)
+        holder.join()
+        self.assertEqual(self.mock_pool_class.return_value.putconn.call_count, 2)
+
+    def test_times_out_when_exhausted(self):
+        """Test PoolError is raised once the wait for a connection times out"""
+        with database.pooled_connection():
+            with self.assertRaises(PoolError):
+                with database.pooled_connection(timeout=0.01):
+                    pass
+        # The slot is free again afterwards
+        with database.pooled_connection(timeout=0.01):
+            pass
+
+
+class TestInitializeDatabase(unittest.TestCase):
+
+    @patch('db.database.create_vector_indexes')
+    @patch('db.database.build_document_centroids')
+    @patch('db.database.get_db_connection')
+    def test_centroids_built_only_with_new_table(self, mock_get_connection, mock_build, mock_indexes):
+        """Test existing documents' centroids are computed when the table is created, not on every start"""
+        mock_cursor = mock_get_connection.return_value.cursor.return_value.__enter__.return_value
+
+        mock_cursor.fetchone.return_value = (False,)
+        database.initialize_database()
+        mock_build.assert_not_called()
+
+        mock_cursor.fetchone.return_value = (True,)
+        database.initialize_database()
+        mock_build.assert_called_once_with(mock_cursor)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -63,7 +63,7 @@ class TestDocumentModel(unittest.TestCase):
         # Verify the result and the mock interactions
         self.assertEqual(document['doc_id'], self.test_doc_id)
         mock_cursor.execute.assert_called_once_with(
-            "SELECT doc_id, title, file_path, date_added, metadata FROM documents WHERE doc_id = %s",
+            "SELECT doc_id, title, file_path, date_added, metadata FROM documents WHERE doc_id = %s AND deleted_at IS NULL",
             (self.test_doc_id,)
         )
         
@@ -90,7 +90,7 @@ class TestDocumentModel(unittest.TestCase):
         self.assertEqual(len(documents), 1)
         self.assertEqual(documents[0]['doc_id'], self.test_doc_id)
         mock_cursor.execute.assert_called_once_with(
-            "SELECT doc_id, title, file_path, date_added FROM documents ORDER BY date_added DESC"
+            "SELECT doc_id, title, file_path, date_added FROM documents WHERE deleted_at IS NULL ORDER BY date_added DESC"
         )
         
     @patch('models.document.get_db_connection')
@@ -111,7 +111,8 @@ class TestDocumentModel(unittest.TestCase):
         # Verify the result and the mock interactions
         self.assertTrue(result)
         mock_cursor.execute.assert_called_once_with(
-            "DELETE FROM documents WHERE doc_id = %s", (self.test_doc_id,)
+            "UPDATE documents SET deleted_at = %s WHERE doc_id = %s AND deleted_at IS NULL",
+            (ANY, self.test_doc_id)
         )
         mock_conn.commit.assert_called_once()
 
@@ -132,7 +133,26 @@ class TestDocumentModel(unittest.TestCase):
         # Verify the result and the mock interactions
         self.assertFalse(result)
         mock_cursor.execute.assert_called_once_with(
-            "DELETE FROM documents WHERE doc_id = %s", (self.test_doc_id,)
+            "UPDATE documents SET deleted_at = %s WHERE doc_id = %s AND deleted_at IS NULL",
+            (ANY, self.test_doc_id)
+        )
+        mock_conn.commit.assert_called_once()
+
+    @patch('models.document.get_db_connection')
+    def test_purge(self, mock_get_db_connection):
+        """Test purge only removes tombstoned documents"""
+        mock_conn = MagicMock()
+        mock_cursor = MagicMock()
+        mock_get_db_connection.return_value = mock_conn
+        mock_conn.cursor.return_value.__enter__.return_value = mock_cursor
+        mock_cursor.rowcount = 1
+
+        result = self.document_model.purge(self.test_doc_id)
+
+        self.assertTrue(result)
+        mock_cursor.execute.assert_called_once_with(
+            "DELETE FROM documents WHERE doc_id = %s AND deleted_at IS NOT NULL",
+            (self.test_doc_id,)
         )
         mock_conn.commit.assert_called_once()
 
@@ -0,0 +1,338 @@
+import unittest
+import struct
+import uuid
+from unittest.mock import patch, MagicMock
+import numpy as np
+from db.database import HNSW_MAX_EF_SEARCH
+from models.embedding import EmbeddingModel
+
+
+class TestEmbeddingModel(unittest.TestCase):
+
+    def setUp(self):
+        self.query = np.ones(4, dtype=np.float32)
+        self.version = {'version': 1, 'model_name': 'test-model', 'dimension': 4, 'column_name': 'embedding'}
+        self.active_version_patcher = patch.object(EmbeddingModel, 'active_version', return_value=self.version)
+        self.mock_active_version = self.active_version_patcher.start()
+        self.addCleanup(self.active_version_patcher.stop)
+
+    def _mock_connection(self, mock_get_db_connection):
+        mock_conn = MagicMock()
+        mock_cursor = MagicMock()
+        mock_get_db_connection.return_value = mock_conn
+        mock_conn.cursor.return_value.__enter__.return_value = mock_cursor
+        mock_cursor.fetchall.return_value = [{'chunk_id': '1', 'text_content': 'Test chunk', 'doc_id': '12345', 'title': 'Test Doc', 'similarity': 0.9}]
+        return mock_cursor
+
+    @patch('models.embedding.pooled_connection')
+    def test_search_similar_full_precision(self, mock_pooled_connection):
+        """Test full precision search prepares the statement once per connection"""
+        mock_cursor = self._mock_connection(mock_pooled_connection.return_value.__enter__)
+        mock_cursor.connection.prepared = set()
+        hit = {'chunk_id': '1', 'doc_id': '12345', 'similarity': 0.9}
+        mock_cursor.fetchall.side_effect = [[hit], [('12345', 'Test Doc', '1', 'Test chunk')], [hit]]
+        embedding_model = EmbeddingModel(precision='full', dimension=4)
+
+        results = embedding_model.search_similar(self.query, top_k=5)
+        embedding_model.search_similar(self.query, top_k=5)
+
+        self.assertEqual(results[0]['text_content'], 'Test chunk')
+        self.assertEqual(results[0]['title'], 'Test Doc')
+        statements = [call[0][0] for call in mock_cursor.execute.call_args_list]
+        self.assertEqual(sum(sql.startswith("PREPARE search_similar ") for sql in statements), 1)
+        self.assertEqual(statements.count("EXECUTE search_similar (%s, %s)"), 2)
+        # The ANN query returns ids and scores only; the second search is hydrated from cache
+        self.assertNotIn("text_content", statements[0])
+        self.assertEqual(statements.count("EXECUTE hydrate_chunks (%s, %s)"), 1)
+        # The query vector is sent once per execution
+        self.assertEqual(mock_cursor.execute.call_args[0][1], (self.query, 5))
+
+    @patch('models.embedding.pooled_connection')
+    def test_create_chunks_single_statement(self, mock_pooled_connection):
+        """Test chunks are inserted as column arrays in one prepared statement, with the document centroid"""
+        mock_cursor = self._mock_connection(mock_pooled_connection.return_value.__enter__)
+        mock_cursor.connection.prepared = {'insert_chunks', 'upsert_centroid'}
+        embedding_model = EmbeddingModel(dimension=4)
+        embeddings = np.array([[1, 0, 0, 1], [0, 1, 0, 1]], dtype=np.float32)
+
+        result = embedding_model.create_chunks('12345', ['a', 'b'], embeddings)
+
+        self.assertTrue(result)
+        (insert_sql, insert_params), (centroid_sql, centroid_params) = [
+            call[0] for call in mock_cursor.execute.call_args_list if call[0][0].startswith("EXECUTE")]
+        self.assertEqual(insert_sql, "EXECUTE insert_chunks (%s, %s, %s, %s, %s)")
+        self.assertEqual(insert_params[1:4], ('12345', [0, 1], ['a', 'b']))
+        self.assertEqual(insert_params[4], ['[1,0,0,1]', '[0,1,0,1]'])
+        self.assertEqual(centroid_sql, "EXECUTE upsert_centroid (%s, %s, %s)")
+        self.assertEqual(centroid_params, ('12345', 2, '[0.5,0.5,0,1]'))
+
+    @patch.object(EmbeddingModel, 'hydrate', side_effect=lambda hits, check_live=False: hits)
+    @patch('models.embedding.pooled_connection')
+    def test_search_similar_coarse(self, mock_pooled_connection, mock_hydrate):
+        """Test the coarse strategy ranks only the chunks of the closest documents"""
+        mock_cursor = self._mock_connection(mock_pooled_connection.return_value.__enter__)
+        mock_cursor.connection.prepared = set()
+        embedding_model = EmbeddingModel(dimension=4, strategy='coarse', coarse_documents=3)
+
+        embedding_model.search_similar(self.query, top_k=5)
+
+        statements = [call[0][0] for call in mock_cursor.execute.call_args_list]
+        self.assertTrue(statements[1].startswith("PREPARE search_coarse "))
+        self.assertIn("ORDER BY dc.embedding <=> $1", statements[1])
+        self.assertEqual(mock_cursor.execute.call_args[0], ("EXECUTE search_coarse (%s, %s, %s)", (self.query, 3, 5)))
+
+        # A single-document search is already narrow and stays flat
+        embedding_model.search_similar(self.query, top_k=5, doc_id='12345')
+        self.assertEqual(mock_cursor.execute.call_args[0][0], "EXECUTE search_similar_doc (%s, %s, %s)")
+
+    def test_coarse_documents_capped_at_ef_search_limit(self):
+        """Test the coarse strategy never asks the centroid index for more rows than one scan returns"""
+        embedding_model = EmbeddingModel(dimension=4, strategy='coarse', coarse_documents=HNSW_MAX_EF_SEARCH * 2)
+
+        self.assertEqual(embedding_model.coarse_documents, HNSW_MAX_EF_SEARCH)
+
+    @patch('models.embedding.pooled_connection')
+    def test_create_chunks_refuses_retired_version(self, mock_pooled_connection):
+        """Test chunks for a version retired by a cutover are rolled back, not stored"""
+        mock_cursor = self._mock_connection(mock_pooled_connection.return_value.__enter__)
+        mock_cursor.connection.prepared = {'insert_chunks', 'upsert_centroid'}
+        mock_cursor.fetchone.return_value = ('retired',)
+        mock_conn = mock_pooled_connection.return_value.__enter__.return_value
+        embedding_model = EmbeddingModel(dimension=4)
+
+        result = embedding_model.create_chunks('12345', ['a'], np.ones((1, 4), dtype=np.float32), version=self.version)
+
+        self.assertFalse(result)
+        mock_conn.rollback.assert_called_once()
+        mock_conn.commit.assert_not_called()
+
+    @patch.object(EmbeddingModel, 'hydrate', side_effect=lambda hits, check_live=False: hits)
+    @patch('models.embedding.pooled_connection')
+    def test_search_similar_halfvec_rescored(self, mock_pooled_connection, mock_hydrate):
+        """Test halfvec search oversamples candidates and rescores them"""
+        mock_cursor = self._mock_connection(mock_pooled_connection.return_value.__enter__)
+        embedding_model = EmbeddingModel(precision='halfvec', rescore_factor=4, dimension=4)
+
+        embedding_model.search_similar(self.query, top_k=5, doc_id='12345')
+
+        sql, params = mock_cursor.execute.call_args[0]
+        self.assertIn("c.embedding::halfvec(4) <=> %s::vector::halfvec(4)", sql)
+        self.assertIn("ORDER BY cand.embedding <=> %s::vector", sql)
+        self.assertEqual(params[1:3], ['12345', 20])
+        self.assertEqual(params[-1], 5)
+
+    @patch.object(EmbeddingModel, 'hydrate', side_effect=lambda hits, check_live=False: hits)
+    @patch('models.embedding.pooled_connection')
+    def test_search_similar_rescored_caps_ef_search(self, mock_pooled_connection, mock_hydrate):
+        """Test large top_k never sets hnsw.ef_search past pgvector's limit"""
+        mock_cursor = self._mock_connection(mock_pooled_connection.return_value.__enter__)
+        embedding_model = EmbeddingModel(precision='halfvec', rescore_factor=4, dimension=4)
+
+        embedding_model.search_similar(self.query, top_k=500)
+
+        mock_cursor.execute.assert_any_call("SET LOCAL hnsw.ef_search = %s", (1000,))
+        sql, params = mock_cursor.execute.call_args[0]
+        self.assertEqual(params[1], 1000)
+
+    @patch.object(EmbeddingModel, 'hydrate', side_effect=lambda hits, check_live=False: hits)
+    @patch('models.embedding.pooled_connection')
+    def test_search_similar_rescored_accepts_lists(self, mock_pooled_connection, mock_hydrate):
+        """Test a query embedding given as a plain list is searched, not rejected"""
+        mock_cursor = self._mock_connection(mock_pooled_connection.return_value.__enter__)
+        embedding_model = EmbeddingModel(precision='halfvec', dimension=4)
+
+        hits = embedding_model.search_similar([0.5, 0.5, 0.0, 1.0], top_k=5)
+
+        self.assertEqual(len(hits), 1)
+        self.assertEqual(mock_cursor.execute.call_args[0][1][0], [0.5, 0.5, 0.0, 1.0])
+
+    @patch('models.embedding.pooled_connection')
+    def test_delete_by_document_batched(self, mock_pooled_connection):
+        """Test a batched delete removes at most batch_size chunks and commits"""
+        mock_cursor = self._mock_connection(mock_pooled_connection.return_value.__enter__)
+        mock_cursor.rowcount = 3
+        mock_conn = mock_pooled_connection.return_value.__enter__.return_value
+
+        self.assertEqual(EmbeddingModel(dimension=4).delete_by_document('12345', batch_size=3), 3)
+        self.assertEqual(mock_cursor.execute.call_args[0][1], ('12345', 3))
+        mock_conn.commit.assert_called_once()
+
+    @patch.object(EmbeddingModel, 'hydrate', side_effect=lambda hits, check_live=False: hits)
+    @patch('models.embedding.pooled_connection')
+    def test_search_similar_binary_rescored(self, mock_pooled_connection, mock_hydrate):
+        """Test binary search ranks candidates by Hamming distance"""
+        mock_cursor = self._mock_connection(mock_pooled_connection.return_value.__enter__)
+        embedding_model = EmbeddingModel(precision='binary', dimension=4)
+
+        embedding_model.search_similar(self.query, top_k=5)
+
+        sql = mock_cursor.execute.call_args[0][0]
+        self.assertIn("binary_quantize(c.embedding)::bit(4) <~> binary_quantize(%s::vector)", sql)
+
+    @patch.object(EmbeddingModel, 'hydrate', side_effect=lambda hits, check_live=False: hits)
+    @patch('models.embedding.pooled_connection')
+    def test_search_batch_groups_by_query(self, mock_pooled_connection, mock_hydrate):
+        """Test batched search returns one result list per query in order"""
+        mock_cursor = self._mock_connection(mock_pooled_connection.return_value.__enter__)
+        mock_cursor.fetchall.return_value = [
+            {'ord': 1, 'chunk_id': '1', 'similarity': 0.9},
+            {'ord': 3, 'chunk_id': '2', 'similarity': 0.8},
+        ]
+        embedding_model = EmbeddingModel(dimension=4)
+
+        results = embedding_model.search_batch(
+            np.ones((3, 4), dtype=np.float32), top_k=2, metadata={'author': 'me'}, window=1
+        )
+
+        self.assertEqual([len(r) for r in results], [1, 0, 1])
+        self.assertEqual(results[2][0]['chunk_id'], '2')
+        sql, params = mock_cursor.execute.call_args[0]
+        self.assertIn("d.metadata @> %s::jsonb", sql)
+        self.assertEqual(params[1:], [1, 1, '{"author": "me"}', 2, None, None])
+        # Every query's hits are hydrated together
+        mock_hydrate.assert_called_once()
+
+    @patch('models.embedding.pooled_connection')
+    def test_plan_filter_by_selectivity(self, mock_pooled_connection):
+        """Test selective filters are searched exactly and match counts are cached"""
+        mock_cursor = self._mock_connection(mock_pooled_connection.return_value.__enter__)
+        mock_cursor.fetchone.side_effect = [(500, 100000), (60000, 100000)]
+        embedding_model = EmbeddingModel(dimension=4)
+
+        plan = embedding_model.plan_filter({'category': 'manual'})
+        self.assertEqual((plan['strategy'], plan['selectivity']), ('exact', 0.005))
+        self.assertIn("d.metadata @> %s::jsonb", mock_cursor.execute.call_args[0][0])
+
+        self.assertEqual(embedding_model.plan_filter({'category': 'manual'})['matching_chunks'], 500)
+        self.assertEqual(mock_cursor.execute.call_count, 1)
+        self.assertEqual(embedding_model.plan_filter({'year': {'gte': 2000}})['strategy'], 'ann')
+
+    @patch.object(EmbeddingModel, 'hydrate', side_effect=lambda hits, check_live=False: hits)
+    @patch('models.embedding.pooled_connection')
+    def test_search_similar_filtered_exact(self, mock_pooled_connection, mock_hydrate):
+        """Test a selective filter ranks every chunk of the matching documents"""
+        mock_cursor = self._mock_connection(mock_pooled_connection.return_value.__enter__)
+        embedding_model = EmbeddingModel(dimension=4)
+        plan = {'predicate': "d.metadata @> %s::jsonb", 'params': ['{"category": "manual"}'],
+                'matching_chunks': 50, 'total_chunks': 10000, 'selectivity': 0.005, 'strategy': 'exact'}
+
+        with patch.object(EmbeddingModel, 'plan_filter', return_value=plan):
+            embedding_model.search_similar(self.query, top_k=5, filters={'category': 'manual'})
+
+        sql, params = mock_cursor.execute.call_args[0]
+        self.assertIn("candidate_chunks AS MATERIALIZED", sql)
+        self.assertEqual(params, ['[1,1,1,1]', '{"category": "manual"}', 5])
+
+    @patch.object(EmbeddingModel, 'hydrate', side_effect=lambda hits, check_live=False: hits)
+    @patch('models.embedding.pooled_connection')
+    def test_search_similar_filtered_ann_raises_probes(self, mock_pooled_connection, mock_hydrate):
+        """Test an unselective filter rescans with more probes until top_k chunks match"""
+        mock_cursor = self._mock_connection(mock_pooled_connection.return_value.__enter__)
+        hit = {'chunk_id': '1', 'doc_id': '12345', 'similarity': 0.9}
+        mock_cursor.fetchall.side_effect = [[hit], [hit] * 5]
+        embedding_model = EmbeddingModel(dimension=4)
+        embedding_model._pgvector_version = (0, 6)
+        plan = {'predicate': "d.metadata @> %s::jsonb", 'params': ['{"category": "manual"}'],
+                'matching_chunks': 2000, 'total_chunks': 10000, 'selectivity': 0.2, 'strategy': 'ann'}
+
+        with patch.object(EmbeddingModel, 'plan_filter', return_value=plan):
+            results = embedding_model.search_similar(self.query, top_k=5, filters={'category': 'manual'})
+
+        self.assertEqual(len(results), 5)
+        probes = [call[0][1] for call in mock_cursor.execute.call_args_list
+                  if call[0][0] == "SET LOCAL ivfflat.probes = %s"]
+        self.assertEqual(probes, [(1,), (4,)])
+
+    @patch('models.embedding.pooled_connection')
+    def test_hydrate_drops_deleted_documents(self, mock_pooled_connection):
+        """Test live checks bypass the title cache and drop hits of deleted documents"""
+        mock_cursor = self._mock_connection(mock_pooled_connection.return_value.__enter__)
+        mock_cursor.connection.prepared = {'hydrate_chunks'}
+        mock_cursor.fetchall.return_value = [('live', 'Live Doc', '1', 'Test chunk')]
+        embedding_model = EmbeddingModel(dimension=4)
+        embedding_model.title_cache.set_many({'deleted': 'Deleted Doc'})
+        embedding_model.chunk_cache.set_many({'2': 'Cached chunk'})
+
+        results = embedding_model.hydrate([
+            {'chunk_id': '2', 'doc_id': 'deleted', 'similarity': 0.9},
+            {'chunk_id': '1', 'doc_id': 'live', 'similarity': 0.8},
+        ], check_live=True)
+
+        self.assertEqual([r['chunk_id'] for r in results], ['1'])
+        _, params = mock_cursor.execute.call_args[0]
+        self.assertEqual(sorted(params[0]), ['deleted', 'live'])
+        self.assertEqual(params[1], ['1'])
+
+    @patch('models.embedding.pooled_connection')
+    def test_search_similar_versioned_column(self, mock_pooled_connection):
+        """Test a migrated version is searched through its own column and prepared statement"""
+        mock_cursor = self._mock_connection(mock_pooled_connection.return_value.__enter__)
+        mock_cursor.connection.prepared = set()
+        embedding_model = EmbeddingModel(dimension=4)
+        version = {'version': 2, 'model_name': 'new-model', 'dimension': 8, 'column_name': 'embedding_v2'}
+
+        embedding_model.search_similar(np.ones(8, dtype=np.float32), top_k=5, version=version)
+
+        statements = [call[0][0] for call in mock_cursor.execute.call_args_list]
+        self.assertTrue(statements[0].startswith("PREPARE search_similar_embedding_v2 "))
+        self.assertIn("ORDER BY c.embedding_v2 <=> $1", statements[0])
+        self.assertEqual(statements[1], "EXECUTE search_similar_embedding_v2 (%s, %s)")
+        self.mock_active_version.assert_not_called()
+
+    @patch('models.embedding.pooled_connection')
+    def test_active_version_cached_with_fallback(self, mock_pooled_connection):
+        """Test the active version is cached and defaults to the original column"""
+        self.active_version_patcher.stop()
+        mock_cursor = self._mock_connection(mock_pooled_connection.return_value.__enter__)
+        mock_cursor.fetchone.return_value = None
+        embedding_model = EmbeddingModel(dimension=4)
+
+        version = embedding_model.active_version()
+        embedding_model.active_version()
+
+        self.assertEqual(version['column_name'], 'embedding')
+        self.assertEqual(version['dimension'], 4)
+        self.assertEqual(mock_cursor.execute.call_count, 1)
+
+    @patch('models.embedding.pooled_connection')
+    def test_prewarm_with_pg_prewarm(self, mock_pooled_connection):
+        """Test prewarm loads the active column's relations with pg_prewarm when installed"""
+        mock_cursor = self._mock_connection(mock_pooled_connection.return_value.__enter__)
+        mock_cursor.fetchone.return_value = (1,)
+        mock_cursor.fetchall.return_value = [('chunks', 120), ('chunks_embedding_idx', 40)]
+        embedding_model = EmbeddingModel(dimension=4, precision='full')
+
+        result = embedding_model.prewarm()
+
+        self.assertEqual(result, {'method': 'pg_prewarm', 'relations': {'chunks': 120, 'chunks_embedding_idx': 40}})
+        relations = mock_cursor.execute.call_args_list[1][0][1][0]
+        self.assertIn('chunks_embedding_idx', relations)
+        self.assertIn('document_centroids_embedding_idx', relations)
+
+
+    @patch('models.embedding.pooled_connection')
+    def test_iter_embedding_blocks_parses_binary_copy(self, mock_pooled_connection):
+        """Test embeddings are decoded from a binary COPY without text parsing"""
+        mock_cursor = self._mock_connection(mock_pooled_connection.return_value.__enter__)
+        ids = [uuid.uuid4() for _ in range(6)]
+        vectors = np.arange(12, dtype=np.float32).reshape(3, 4)
+
+        def copy_expert(sql, spool):
+            spool.write(b"PGCOPY\n\xff\r\n\x00" + struct.pack(">ii", 0, 0))
+            for i, vector in enumerate(vectors):
+                spool.write(struct.pack(">hi", 3, 16) + ids[2 * i].bytes + struct.pack(">i", 16) + ids[2 * i + 1].bytes)
+                spool.write(struct.pack(">ihh", 4 + 4 * 4, 4, 0) + vector.astype('>f4').tobytes())
+            spool.write(struct.pack(">h", -1))
+        mock_cursor.copy_expert.side_effect = copy_expert
+
+        blocks = list(EmbeddingModel().iter_embedding_blocks(batch_size=2))
+
+        self.assertEqual([len(chunk_ids) for chunk_ids, _, _ in blocks], [2, 1])
+        self.assertEqual(blocks[0][0], [str(ids[0]), str(ids[2])])
+        self.assertEqual(blocks[1][1], [str(ids[5])])
+        np.testing.assert_array_equal(np.concatenate([matrix for _, _, matrix in blocks]), vectors)
+        self.assertEqual(blocks[0][2].dtype, np.float32)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,62 @@
+import unittest
+from unittest.mock import patch, MagicMock
+import numpy as np
+from services.embedding_migration import EmbeddingMigration
+
+
+class TestEmbeddingMigration(unittest.TestCase):
+
+    def setUp(self):
+        self.version = {'version': 2, 'model_name': 'new-model', 'dimension': 8,
+                        'column_name': 'embedding_v2', 'total_chunks': 3}
+        self.mock_version_model = MagicMock()
+        self.mock_version_model.next_batch.side_effect = [
+            [('1', 'a'), ('2', 'b')],
+            [('3', 'c')],
+            [],
+        ]
+        self.mock_version_model.store_batch.return_value = True
+        self.mock_encoder = MagicMock()
+        self.mock_encoder.encode.side_effect = lambda texts: np.ones((len(texts), 8), dtype=np.float32)
+
+        self.migration = EmbeddingMigration(self.mock_version_model, self.mock_encoder, batch_size=2)
+
+    def test_backfill_until_no_chunks_remain(self):
+        """Test every missing chunk is re-encoded and stored batch by batch"""
+        done = self.migration.backfill(self.version)
+
+        self.assertEqual(done, 3)
+        stored = [call[0][1] for call in self.mock_version_model.store_batch.call_args_list]
+        self.assertEqual(stored, [['1', '2'], ['3']])
+        self.mock_encoder.encode.assert_any_call(['a', 'b'])
+        self.mock_version_model.build_centroids.assert_called_once_with(self.version)
+
+    def test_backfill_stops_on_store_failure(self):
+        """Test a failed write ends the pass instead of re-encoding the same batch forever"""
+        self.mock_version_model.store_batch.return_value = False
+
+        self.assertEqual(self.migration.backfill(self.version), 2)
+        self.assertEqual(self.mock_version_model.next_batch.call_count, 1)
+
+    @patch('services.embedding_migration.time.sleep')
+    def test_run_retries_activation_after_late_chunks(self, mock_sleep):
+        """Test chunks ingested before the cutover are backfilled and activation retried"""
+        self.mock_version_model.next_batch.side_effect = [[('1', 'a')], [], [('4', 'd')], [], [('5', 'e')], []]
+        self.mock_version_model.build_indexes.return_value = True
+        self.mock_version_model.activate.side_effect = [False, True]
+
+        self.assertTrue(self.migration.run(self.version))
+        self.assertEqual(self.mock_version_model.activate.call_count, 2)
+        # The final pass catches chunks stored by workers still on the previous version
+        self.assertEqual(self.mock_version_model.store_batch.call_count, 3)
+
+    def test_run_does_not_activate_without_indexes(self):
+        """Test a version is never activated when its indexes failed to build"""
+        self.mock_version_model.build_indexes.return_value = False
+
+        self.assertFalse(self.migration.run(self.version))
+        self.mock_version_model.activate.assert_not_called()
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,73 @@
+import unittest
+import os
+import tempfile
+import shutil
+from unittest.mock import MagicMock, patch
+from services import extraction
+from services.extraction import DocumentExtractor
+
+
+def _backend(name, pages=None, error=None):
+    backend = MagicMock(extensions=('.pdf',))
+    backend.name = name
+    backend.available.return_value = True
+    if error:
+        backend.extract.side_effect = error
+    else:
+        backend.extract.return_value = pages
+    return backend
+
+
+class TestDocumentExtractor(unittest.TestCase):
+
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.extractor = DocumentExtractor(pdf_backends=['fast', 'slow'])
+
+    def tearDown(self):
+        shutil.rmtree(self.directory)
+
+    def _write(self, name, content):
+        path = os.path.join(self.directory, name)
+        with open(path, 'w') as f:
+            f.write(content)
+        return path
+
+    def test_supports(self):
+        """Test supported extensions are accepted regardless of case"""
+        self.assertTrue(self.extractor.supports('report.PDF'))
+        self.assertTrue(self.extractor.supports('notes.md'))
+        self.assertTrue(self.extractor.supports('page.html'))
+        self.assertFalse(self.extractor.supports('sheet.xlsx'))
+
+    def test_extract_markdown(self):
+        """Test text files are read as one page with whitespace collapsed"""
+        path = self._write('notes.md', "# Title\n\nSome   text\n")
+
+        self.assertEqual(self.extractor.extract(path), ("# Title Some text", 1, 'text'))
+
+    def test_extract_html_skips_scripts(self):
+        """Test only the visible text of HTML is kept"""
+        path = self._write('page.html', "<html><head><title>T</title><script>var x;</script></head>"
+                                        "<body><p>First</p><p>Second</p><style>p{}</style></body></html>")
+
+        self.assertEqual(self.extractor.extract(path), ("First Second", 1, 'html'))
+
+    def test_fallback_on_error_or_empty_text(self):
+        """Test the next PDF backend is tried when one fails or finds no text"""
+        path = self._write('doc.pdf', "")
+        backends = {'fast': _backend('fast', error=RuntimeError("broken")),
+                    'slow': _backend('slow', pages=["page one", "page two"])}
+
+        with patch.dict(extraction.EXTRACTORS, backends):
+            self.assertEqual(self.extractor.extract(path), ("page one page two", 2, 'slow'))
+            backends['slow'].extract.return_value = [" ", ""]
+            self.assertEqual(self.extractor.extract(path), (None, 0, None))
+
+    def test_unavailable_backend_skipped(self):
+        """Test backends whose library is missing are not tried"""
+        backends = {'fast': _backend('fast'), 'slow': _backend('slow', pages=["text"])}
+        backends['fast'].available.return_value = False
+
+        with patch.dict(extraction.EXTRACTORS, backends):
+            self.assertEqual([b.name for b in self.extractor.backends_for('doc.pdf')], ['slow'])
@@ -0,0 +1,41 @@
+import unittest
+import json
+from datetime import datetime
+from db.filters import compile_filter
+
+
+class TestCompileFilter(unittest.TestCase):
+
+    def test_metadata_equality_uses_containment(self):
+        """Test equality and any-of conditions compile to GIN-indexable containment"""
+        sql, params = compile_filter({'category': 'manual', 'lang': ['en', 'de']})
+
+        self.assertEqual(sql, "d.metadata @> %s::jsonb AND (d.metadata @> %s::jsonb OR d.metadata @> %s::jsonb)")
+        self.assertEqual([json.loads(p) for p in params],
+                         [{'category': 'manual'}, {'lang': 'en'}, {'lang': 'de'}])
+
+    def test_metadata_range_passes_bounds_as_variables(self):
+        """Test range bounds are jsonpath variables, never spliced into the path"""
+        sql, params = compile_filter({'year': {'gte': 2020, 'lt': 2024}})
+
+        self.assertEqual(sql, "jsonb_path_exists(d.metadata, %s::jsonpath, %s::jsonb)")
+        self.assertEqual(params[0], '$."year" ? (@ >= $gte && @ < $lt)')
+        self.assertEqual(json.loads(params[1]), {'gte': 2020, 'lt': 2024})
+
+    def test_date_added_window(self):
+        """Test date_added conditions compare the indexed column with parsed timestamps"""
+        sql, params = compile_filter({'date_added': {'gte': '2024-01-01', 'lt': '2024-02-01T12:00:00'}})
+
+        self.assertEqual(sql, "(d.date_added >= %s AND d.date_added < %s)")
+        self.assertEqual(params, [datetime(2024, 1, 1), datetime(2024, 2, 1, 12)])
+
+    def test_malformed_expressions(self):
+        """Test malformed expressions raise ValueError"""
+        for expression in [{}, [], {'year': {'between': 1}}, {'year': {'gt': [1]}},
+                           {'tags': []}, {'date_added': {'gte': 'yesterday'}}]:
+            with self.assertRaises(ValueError):
+                compile_filter(expression)
+
+
+if __name__ == '__main__':
+    unittest.main()
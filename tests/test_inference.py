@@ -0,0 +1,110 @@
+import os
+import shutil
+import tempfile
+import threading
+import unittest
+from multiprocessing.connection import Listener
+from multiprocessing.shared_memory import SharedMemory
+from unittest.mock import patch, MagicMock
+import numpy as np
+from services.inference import InferenceClient, InferencePool, _InferenceWorker
+
+
+class TestInference(unittest.TestCase):
+
+    def setUp(self):
+        # One in-process worker with fake models behind a real socket
+        self.socket_dir = tempfile.mkdtemp()
+        # Worker and client share this process's resource tracker here, so the
+        # worker must not unregister the client's blocks
+        patcher = patch('services.inference._attach', lambda name: SharedMemory(name=name))
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        self.worker = _InferenceWorker('qa-model', 'embed-model')
+        encoder = MagicMock()
+        encoder.encode.side_effect = lambda texts, **options: np.array([[len(t)] * 512 for t in texts], dtype=np.float32)
+        self.worker._encoders['embed-model'] = encoder
+        self.worker._qa_pipelines['qa-model'] = MagicMock(return_value={'answer': 'yes', 'score': 0.5, 'start': 9, 'end': 12})
+
+        self.listener = Listener(os.path.join(self.socket_dir, 'worker-0.sock'), family='AF_UNIX', authkey=b'key')
+        threading.Thread(target=self._accept, daemon=True).start()
+        self.client = InferenceClient(self.socket_dir, num_workers=1, authkey=b'key', timeout=5)
+
+    def _accept(self):
+        while True:
+            try:
+                conn = self.listener.accept()
+            except OSError:
+                return
+            threading.Thread(target=self.worker.serve, args=(conn,), daemon=True).start()
+
+    def tearDown(self):
+        self.client.close()
+        self.listener.close()
+        shutil.rmtree(self.socket_dir)
+
+    def test_encode_through_shared_memory(self):
+        """Test embeddings come back intact, growing the buffer for large batches"""
+        texts = ['a' * (i % 7) for i in range(1000)]  # 2 MB of float32, more than the initial buffer
+
+        embeddings = self.client.encode('embed-model', texts)
+        again = self.client.encode('embed-model', texts[:3])
+
+        self.assertEqual(embeddings.shape, (1000, 512))
+        self.assertTrue(np.array_equal(embeddings[:, 0], [len(t) for t in texts]))
+        self.assertEqual(again.shape, (3, 512))
+        # Both jobs reused the one connection
+        self.assertEqual(self.client._idle.qsize(), 1)
+
+    def test_remote_encoder_single_sentence(self):
+        """Test a single string encodes to a vector, like SentenceTransformer.encode"""
+        embedding = self.client.encoder('embed-model').encode('abc')
+
+        self.assertEqual(embedding.shape, (512,))
+        self.assertEqual(embedding[0], 3)
+
+    def test_remote_encoder_forwards_options(self):
+        """Test SentenceTransformer.encode keyword arguments reach the worker's model"""
+        self.client.encoder('embed-model').encode(['abc'], batch_size=8, normalize_embeddings=True)
+
+        self.worker._encoders['embed-model'].encode.assert_called_once_with(
+            ['abc'], batch_size=8, normalize_embeddings=True)
+
+    def test_empty_authkey_rejected(self):
+        """Test the pool and its clients refuse to run without a shared secret"""
+        with self.assertRaises(ValueError):
+            InferenceClient(self.socket_dir, num_workers=1, authkey=b'')
+        with self.assertRaises(ValueError):
+            InferencePool(self.socket_dir, 1, 'qa-model', 'embed-model')
+
+    def test_remote_qa_pipeline(self):
+        """Test QA jobs return the pipeline's answer, score and offsets"""
+        result = self.client.qa_pipeline('qa-model')(question='Q?', context='C')
+
+        self.assertEqual(result, {'answer': 'yes', 'score': 0.5, 'start': 9, 'end': 12})
+        self.worker._qa_pipelines['qa-model'].assert_called_once_with(question='Q?', context='C')
+
+    def test_answer_span_in_pool_mode(self):
+        """Test answers from the pool are located in their chunk, like local ones"""
+        from services.qa_service import QuestionAnsweringService
+        chunks = [{'chunk_id': 'c1', 'doc_id': 'd1', 'text_content': 'first'},
+                  {'chunk_id': 'c2', 'doc_id': 'd1', 'text_content': 'is yes'}]
+        service = QuestionAnsweringService.__new__(QuestionAnsweringService)
+        service.qa_pipeline = self.client.qa_pipeline('qa-model')
+
+        result = service.generate_answer_pipeline('Q?', 'first is yes', [], chunks=chunks)
+
+        self.assertEqual(result['answer_span'], {'chunk_id': 'c2', 'doc_id': 'd1', 'start': 3, 'end': 6})
+
+    def test_job_error_raised_to_caller(self):
+        """Test a failing job raises in the client and keeps the connection usable"""
+        self.worker._qa_pipelines['qa-model'].side_effect = ValueError("bad context")
+
+        with self.assertRaises(RuntimeError):
+            self.client.answer('qa-model', 'Q?', '')
+        self.worker._qa_pipelines['qa-model'].side_effect = None
+        self.assertEqual(self.client.answer('qa-model', 'Q?', 'C')['answer'], 'yes')
+
+
+if __name__ == '__main__':
+    unittest.main()
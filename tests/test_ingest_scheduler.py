@@ -0,0 +1,131 @@
+import os
+import tempfile
+import tracemalloc
+import unittest
+from unittest.mock import patch
+from services.ingest_scheduler import IngestionScheduler, IngestionJob, DEFAULT_COEFFICIENTS, TRACED_STAGES
+from services.profiler import start_tracing, stop_tracing
+
+
+class TestIngestionScheduler(unittest.TestCase):
+
+    def setUp(self):
+        self.tmp_dir = tempfile.TemporaryDirectory()
+        self.addCleanup(self.tmp_dir.cleanup)
+        self.scheduler = IngestionScheduler(
+            db_path=os.path.join(self.tmp_dir.name, 'ingest.sqlite3'),
+            budget=64 * 1024 * 1024,
+            chunk_stride=200,
+            overhead=1024 * 1024,
+            queue_timeout=0.3,
+            calibration_rate=0,
+            poll_interval=0.05
+        )
+
+    def _upload(self, size):
+        path = os.path.join(self.tmp_dir.name, f'{size}.txt')
+        with open(path, 'w') as f:
+            f.write('x' * size)
+        return path
+
+    def test_estimate_scales_with_pages(self):
+        """Test the estimate grows with the page count and the lease is capped by the budget"""
+        small = self.scheduler.estimate(size=500_000, pages=10)
+        large = self.scheduler.estimate(size=500_000, pages=5000)
+
+        self.assertEqual(small['chunks'], 10 * DEFAULT_COEFFICIENTS['chars_per_page'] / 200)
+        self.assertLess(small['peak'], large['peak'])
+        self.assertEqual(small['reserve'], small['peak'])
+        self.assertGreater(large['peak'], self.scheduler.budget)
+        self.assertEqual(large['reserve'], self.scheduler.budget)
+
+    def test_jobs_queue_until_budget_frees(self):
+        """Test a job waits while the budget is leased and is admitted once it is released"""
+        first = self.scheduler.admit(self._upload(3_000_000))
+        self.assertIsNotNone(first)
+
+        self.assertIsNone(self.scheduler.admit(self._upload(2_500_000)))
+
+        first.release()
+        second = self.scheduler.admit(self._upload(2_500_000))
+        self.assertIsNotNone(second)
+        second.release()
+
+    def test_measurements_recalibrate_estimates(self):
+        """Test recorded stage measurements replace the default coefficients"""
+        before = self.scheduler.estimate(size=100_000)
+        self.scheduler.record('store', 64 * 1024)
+        self.scheduler.record('store', 64 * 1024)
+
+        value, samples = self.scheduler.coefficients()['store']
+        self.assertEqual((value, samples), (64 * 1024, 2))
+        self.assertGreater(self.scheduler.estimate(size=100_000)['peak'], before['peak'])
+
+    @patch('services.ingest_scheduler.random.random', return_value=0.5)
+    def test_calibrated_ignores_coefficients_the_format_cannot_measure(self, mock_random):
+        """Test text documents stop being traced once their own stages are calibrated"""
+        self.scheduler.calibration_rate = 0.1
+        for name in TRACED_STAGES + ('text', 'chunk'):
+            for _ in range(3):
+                self.scheduler.record(name, DEFAULT_COEFFICIENTS[name])
+
+        job = self.scheduler.admit(self._upload(1000))
+        self.assertFalse(job.trace)
+        job.release()
+
+        # chars_per_page is only measured from PDFs, so they are still traced
+        job = self.scheduler.admit(self._upload(1000), pages=1)
+        self.assertTrue(job.trace)
+        job.release()
+
+    def test_calibration_opt_in(self):
+        """Test no job is traced with a zero calibration rate, even before any measurement"""
+        job = self.scheduler.admit(self._upload(1000))
+        self.assertFalse(job.trace)
+        job.release()
+
+    def test_no_tracing_while_profiling(self):
+        """Test a job is not traced while a profiled request owns tracemalloc"""
+        self.scheduler.calibration_rate = 1
+        self.assertTrue(start_tracing())
+        try:
+            job = self.scheduler.admit(self._upload(1000))
+            self.assertFalse(job.trace)
+            job.release()
+            self.assertTrue(tracemalloc.is_tracing())
+        finally:
+            stop_tracing()
+
+    def test_encode_stage_not_traced(self):
+        """Test encoding, whose memory is mostly outside the Python allocator, is not recorded"""
+        self.scheduler.calibration_rate = 1
+        job = self.scheduler.admit(self._upload(1000))
+        with job.stage('encode', 10):
+            buffer = bytearray(1024 * 1024)
+        with job.stage('store', 10):
+            buffer = bytearray(1024 * 1024)
+        del buffer
+        job.release()
+
+        coefficients = self.scheduler.coefficients()
+        self.assertEqual(coefficients['encode'], (DEFAULT_COEFFICIENTS['encode'], 0))
+        self.assertEqual(coefficients['store'][1], 1)
+
+    def test_oversized_document_split_into_parts(self):
+        """Test chunks are split into parts that fit the job's lease"""
+        coefficients = {name: (value, 0) for name, value in DEFAULT_COEFFICIENTS.items()}
+        plan = {'reserve': 4 * 1024 * 1024, 'pages': None}
+        job = IngestionJob(self.scheduler, "lease", plan, coefficients)
+        chunks = ['chunk text'] * 1000
+
+        parts = job.parts(' '.join(chunks), chunks)
+
+        self.assertGreater(len(parts), 1)
+        self.assertEqual(parts[0][0], 0)
+        self.assertEqual(parts[-1][1], 1000)
+        self.assertTrue(all(end - start >= self.scheduler.min_part for start, end in parts[:-1]))
+        self.assertEqual(IngestionJob().parts('text', chunks), [(0, 1000)])
+
+
+if __name__ == '__main__':
+    unittest.main()
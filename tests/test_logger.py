@@ -0,0 +1,41 @@
+import unittest
+import json
+import logging
+from unittest.mock import patch
+from custom_logger import JsonFormatter, SamplingFilter, RequestContextFilter, set_request_id, request_id_var
+
+
+class TestCustomLogger(unittest.TestCase):
+
+    def _record(self, level=logging.INFO, **extra):
+        record = logging.LogRecord('app', level, __file__, 1, "hello %s", ("world",), None)
+        for key, value in extra.items():
+            setattr(record, key, value)
+        return record
+
+    def test_json_formatter_includes_extra_fields(self):
+        """Test structured records carry the message, request id and stage timings"""
+        token = set_request_id("req-1")
+        try:
+            record = self._record(stage="qa_model", duration_ms=12.5)
+            RequestContextFilter().filter(record)
+        finally:
+            request_id_var.reset(token)
+
+        entry = json.loads(JsonFormatter().format(record))
+
+        self.assertEqual(entry['message'], "hello world")
+        self.assertEqual(entry['request_id'], "req-1")
+        self.assertEqual(entry['stage'], "qa_model")
+        self.assertEqual(entry['duration_ms'], 12.5)
+
+    @patch('custom_logger.random.random', return_value=0.5)
+    def test_sampling_filter(self, mock_random):
+        """Test low-level records are sampled while warnings always pass"""
+        self.assertFalse(SamplingFilter(rate=0.1).filter(self._record()))
+        self.assertTrue(SamplingFilter(rate=0.9).filter(self._record()))
+        self.assertTrue(SamplingFilter(rate=0.1).filter(self._record(level=logging.WARNING)))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,82 @@
+import unittest
+import tempfile
+import shutil
+import tracemalloc
+from unittest.mock import MagicMock
+from services.profiler import RequestProfiler, start_tracing, stop_tracing
+
+
+def _request(headers=None, args=None):
+    return MagicMock(headers=headers or {}, args=args or {})
+
+
+class TestRequestProfiler(unittest.TestCase):
+
+    def setUp(self):
+        self.profile_dir = tempfile.mkdtemp()
+        self.profiler = RequestProfiler(self.profile_dir, token='secret', max_profiles=2)
+
+    def tearDown(self):
+        shutil.rmtree(self.profile_dir)
+
+    def test_disabled_without_token_or_sampling(self):
+        """Test nothing is profiled when neither a token nor a sampling rate is configured"""
+        profiler = RequestProfiler(self.profile_dir)
+
+        self.assertFalse(profiler.should_profile(_request({'X-Profile': ''})))
+        self.assertFalse(profiler.is_authorized(''))
+
+    def test_profile_requested_with_token(self):
+        """Test only callers presenting the admin token can ask for a profile"""
+        self.assertTrue(self.profiler.should_profile(_request({'X-Profile': 'secret'})))
+        self.assertTrue(self.profiler.should_profile(_request(args={'profile': 'secret'})))
+        self.assertFalse(self.profiler.should_profile(_request({'X-Profile': 'guess'})))
+
+    def test_finish_stores_profile_and_peak_memory(self):
+        """Test a finished profile is retrievable with its stats and peak memory"""
+        session = self.profiler.start()
+        data = [bytearray(1024) for _ in range(100)]
+        profile_id = self.profiler.finish(session, {'path': '/api/question'})
+
+        profile = self.profiler.get(profile_id)
+        self.assertEqual(profile['path'], '/api/question')
+        self.assertGreater(profile['peak_memory_bytes'], 100 * 1024)
+        self.assertIn('cumulative', profile['stats'])
+        self.assertIsNotNone(self.profiler.stats_path(profile_id))
+        self.assertFalse(tracemalloc.is_tracing())
+        del data
+
+    def test_no_memory_while_ingestion_traces(self):
+        """Test a profile leaves tracemalloc alone while an ingestion job owns it"""
+        self.assertTrue(start_tracing())
+        try:
+            session = self.profiler.start()
+            profile_id = self.profiler.finish(session)
+            self.assertIsNone(self.profiler.get(profile_id)['peak_memory_bytes'])
+            self.assertTrue(tracemalloc.is_tracing())
+        finally:
+            stop_tracing()
+
+    def test_one_profile_at_a_time(self):
+        """Test a concurrent request is not profiled while another one is"""
+        session = self.profiler.start()
+
+        self.assertIsNone(self.profiler.start())
+        self.profiler.finish(session)
+        self.assertIsNotNone(self.profiler.start())
+
+    def test_old_profiles_pruned(self):
+        """Test only the newest max_profiles profiles are kept"""
+        for _ in range(3):
+            self.profiler.finish(self.profiler.start())
+
+        self.assertEqual(len(self.profiler.list_all()), 2)
+
+    def test_get_rejects_invalid_id(self):
+        """Test profile IDs cannot be used to read other files"""
+        self.assertIsNone(self.profiler.get('../../etc/passwd'))
+        self.assertIsNone(self.profiler.stats_path('../config'))
+
+
+if __name__ == '__main__':
+    unittest.main()
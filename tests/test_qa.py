@@ -1,3 +1,4 @@
+import os
 import unittest
 from unittest.mock import patch, MagicMock
 from io import BytesIO
@@ -11,6 +12,9 @@ class TestQuestionAnsweringService(unittest.TestCase):
         # Mocking the document model, embedding model, and QA pipeline
         self.mock_document_model = MagicMock()
         self.mock_embedding_model = MagicMock()
+        self.version = {'version': 1, 'model_name': 'sentence-transformers/all-MiniLM-L6-v2',
+                        'dimension': 384, 'column_name': 'embedding'}
+        self.mock_embedding_model.active_version.return_value = self.version
         self.mock_qa_pipeline = MagicMock()
         
         self.qa_service = QuestionAnsweringService(
@@ -48,6 +52,58 @@ class TestQuestionAnsweringService(unittest.TestCase):
         )
         self.mock_embedding_model.create_chunks.assert_called_once()
     
+    def test_process_document_in_parts(self):
+        """Test a document larger than its memory lease is encoded and stored in parts"""
+        import numpy as np
+        import tempfile
+        with tempfile.NamedTemporaryFile('w', suffix='.txt', delete=False) as f:
+            f.write(" ".join(f"word{i}" for i in range(1500)))
+        self.addCleanup(os.remove, f.name)
+        self.mock_document_model.create.return_value = "12345"
+        self.mock_embedding_model.create_chunks.return_value = True
+        self.qa_service.sentence_transformer = MagicMock()
+        self.qa_service.sentence_transformer.encode.side_effect = lambda texts: np.ones((len(texts), 4))
+        self.qa_service._encoders = {self.qa_service.embedding_model_name: self.qa_service.sentence_transformer}
+        job = MagicMock()
+        job.parts.side_effect = lambda text, chunks: [(0, 20), (20, len(chunks))]
+
+        result = self.qa_service.process_document(f.name, job=job)
+
+        self.assertEqual(result, "12345")
+        calls = self.mock_embedding_model.create_chunks.call_args_list
+        self.assertEqual(len(calls), 2)
+        self.assertEqual(calls[1][1]['start_index'], 20)
+        self.assertFalse(calls[1][1]['centroid'])
+        centroid_call = self.mock_embedding_model.upsert_centroid.call_args
+        self.assertTrue(np.allclose(centroid_call[0][1], np.ones(4)))
+        self.assertEqual(centroid_call[0][2], 20 + len(calls[1][0][1]))
+
+    def test_process_document_reencodes_after_cutover(self):
+        """Test a document whose version was retired mid-ingestion is stored again for the new version"""
+        import numpy as np
+        import tempfile
+        with tempfile.NamedTemporaryFile('w', suffix='.txt', delete=False) as f:
+            f.write("This is a test document.")
+        self.addCleanup(os.remove, f.name)
+        new_version = {'version': 2, 'model_name': 'sentence-transformers/all-mpnet-base-v2',
+                       'dimension': 768, 'column_name': 'embedding_v2'}
+        self.mock_embedding_model.active_version.side_effect = [self.version, new_version, new_version]
+        self.mock_document_model.create.return_value = "12345"
+        # The first insert finds its column retired
+        self.mock_embedding_model.create_chunks.side_effect = [False, True]
+        old_encoder, new_encoder = MagicMock(), MagicMock()
+        old_encoder.encode.side_effect = lambda texts: np.ones((len(texts), 384))
+        new_encoder.encode.side_effect = lambda texts: np.ones((len(texts), 768))
+        self.qa_service._encoders = {self.version['model_name']: old_encoder, new_version['model_name']: new_encoder}
+
+        result = self.qa_service.process_document(f.name)
+
+        self.assertEqual(result, "12345")
+        self.mock_embedding_model.delete_by_document.assert_called_once_with("12345")
+        self.assertEqual(self.mock_embedding_model.create_chunks.call_args[1]['version'], new_version)
+        new_encoder.encode.assert_called_once()
+        self.mock_document_model.delete.assert_not_called()
+
     @patch("PyPDF2.PdfReader")
     def test_process_pdf_file_not_found(self, MockPdfReader):
         """Test PDF processing when the file is not found"""
@@ -81,6 +137,32 @@ class TestQuestionAnsweringService(unittest.TestCase):
         # Assertions
         self.assertIn(result["answer"], "identify the defects and provide quality product to end user")
     
+    def test_answer_question_offsets(self):
+        """Test offsets replace the context with chunk ids and the answer's position in its chunk"""
+        self.qa_service.qa_pipeline = MagicMock(return_value={"answer": "quality", "score": 0.8, "start": 20, "end": 27})
+        self.mock_embedding_model.search_similar.return_value = [
+            {"chunk_id": "c1", "text_content": "testing finds bugs", "doc_id": "d1", "title": "a", "similarity": 0.5},
+            {"chunk_id": "c2", "text_content": "quality matters", "doc_id": "d1", "title": "a", "similarity": 0.4},
+        ]
+
+        result = self.qa_service.answer_question(self.test_question, offsets=True)
+
+        self.assertNotIn("context", result)
+        self.assertEqual(result["answer_span"], {"chunk_id": "c2", "doc_id": "d1", "start": 1, "end": 8})
+        self.assertEqual([chunk["chunk_id"] for chunk in result["sources"][0]["chunks"]], ["c1", "c2"])
+
+    def test_answer_question_fields_skip_model(self):
+        """Test selecting only sources returns them without running the QA model"""
+        self.qa_service.qa_pipeline = MagicMock()
+        self.mock_embedding_model.search_similar.return_value = [
+            {"chunk_id": "c1", "text_content": "testing finds bugs", "doc_id": "d1", "title": "a", "similarity": 0.5},
+        ]
+
+        result = self.qa_service.answer_question(self.test_question, fields=["sources"])
+
+        self.assertEqual(list(result), ["sources"])
+        self.qa_service.qa_pipeline.assert_not_called()
+
     @patch("transformers.pipeline")
     def test_answer_question_no_relevant_chunks(self, mock_qa_pipeline):
         """Test answering a question when no relevant chunks are found"""
@@ -95,5 +177,74 @@ class TestQuestionAnsweringService(unittest.TestCase):
         self.assertEqual(result["context"], "")
         self.assertEqual(result["sources"], [])
 
+    def test_answer_question_stream(self):
+        """Test sources are emitted before the QA model runs"""
+        self.mock_embedding_model.search_similar.return_value = [{"text_content": "identify the defects", "doc_id": "12345", "title": "manual-testing", "similarity": 0.36}]
+        self.qa_service.qa_pipeline = MagicMock(return_value={"answer": "identify the defects", "score": 0.9})
+        
+        events = self.qa_service.answer_question_stream(self.test_question, doc_id="12345", top_k=1)
+        event, payload = next(events)
+        
+        self.assertEqual(event, "sources")
+        self.assertEqual(payload["sources"][0]["id"], "12345")
+        self.qa_service.qa_pipeline.assert_not_called()
+        
+        event, payload = next(events)
+        self.assertEqual(event, "answer")
+        self.assertEqual(payload["answer"], "identify the defects")
+
+    def test_answer_question_stream_cancelled(self):
+        """Test closing the generator after the sources does not run the QA model"""
+        self.mock_embedding_model.search_similar.return_value = [{"text_content": "identify the defects", "doc_id": "12345", "title": "manual-testing", "similarity": 0.36}]
+        self.qa_service.qa_pipeline = MagicMock()
+        
+        events = self.qa_service.answer_question_stream(self.test_question)
+        next(events)
+        events.close()
+        
+        self.qa_service.qa_pipeline.assert_not_called()
+
+    def test_answer_question_stream_client_gone(self):
+        """Test a cancelled stream skips the stages that have not started yet"""
+        self.mock_embedding_model.search_similar.return_value = [{"text_content": "identify the defects", "doc_id": "12345", "title": "manual-testing", "similarity": 0.36}]
+        self.qa_service.qa_pipeline = MagicMock()
+        disconnected = MagicMock(return_value=False)
+
+        events = self.qa_service.answer_question_stream(self.test_question, cancelled=disconnected)
+        self.assertEqual(next(events)[0], "sources")
+        disconnected.return_value = True
+
+        self.assertEqual(list(events), [])
+        self.qa_service.qa_pipeline.assert_not_called()
+
+        # Cancelled before the search, nothing is searched or sent
+        self.mock_embedding_model.search_similar.reset_mock()
+        events = self.qa_service.answer_question_stream(self.test_question, cancelled=lambda: True)
+        self.assertEqual(list(events), [])
+        self.mock_embedding_model.search_similar.assert_not_called()
+
+    @patch("services.qa_service.SentenceTransformer")
+    @patch("services.qa_service.pipeline")
+    def test_inference_pool_mode(self, mock_pipeline, mock_sentence_transformer):
+        """Test models are not loaded locally when an inference client is given"""
+        mock_client = MagicMock()
+        mock_client.encoder.return_value.encode.return_value = [0.1, 0.2]
+        mock_client.qa_pipeline.return_value.return_value = {"answer": "identify the defects", "score": 0.9}
+        self.mock_embedding_model.search_similar.return_value = [{"text_content": "identify the defects", "doc_id": "12345", "title": "manual-testing", "similarity": 0.36}]
+        
+        qa_service = QuestionAnsweringService(
+            document_model=self.mock_document_model,
+            embedding_model=self.mock_embedding_model,
+            qa_model_name="deepset/roberta-base-squad2",
+            embedding_model_name="sentence-transformers/all-MiniLM-L6-v2",
+            inference_client=mock_client
+        )
+        result = qa_service.answer_question(self.test_question)
+        
+        mock_pipeline.assert_not_called()
+        mock_sentence_transformer.assert_not_called()
+        mock_client.encoder.assert_called_once_with("sentence-transformers/all-MiniLM-L6-v2")
+        self.assertEqual(result["answer"], "identify the defects")
+
 if __name__ == "__main__":
     unittest.main()
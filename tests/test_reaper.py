@@ -0,0 +1,58 @@
+import unittest
+from unittest.mock import patch, MagicMock
+from services.reaper import ChunkReaper
+
+
+class TestChunkReaper(unittest.TestCase):
+
+    def setUp(self):
+        self.mock_document_model = MagicMock()
+        self.mock_embedding_model = MagicMock()
+        self.reaper = ChunkReaper(
+            document_model=self.mock_document_model,
+            embedding_model=self.mock_embedding_model,
+            batch_size=2,
+            vacuum_threshold=3
+        )
+
+    @patch('services.reaper.vacuum_table', return_value=True)
+    def test_run_once_deletes_in_batches(self, mock_vacuum):
+        """Test chunks are removed batch by batch before the document is purged"""
+        self.mock_document_model.list_deleted.return_value = ["12345"]
+        self.mock_embedding_model.delete_by_document.side_effect = [2, 1, 0]
+
+        removed = self.reaper.run_once()
+
+        self.assertEqual(removed, 3)
+        self.assertEqual(self.mock_embedding_model.delete_by_document.call_count, 3)
+        self.mock_embedding_model.delete_by_document.assert_called_with("12345", batch_size=2)
+        self.mock_document_model.purge.assert_called_once_with("12345")
+        mock_vacuum.assert_called_once_with("chunks")
+
+    @patch('services.reaper.vacuum_table', return_value=True)
+    def test_run_once_keeps_tombstone_on_error(self, mock_vacuum):
+        """Test the document row is kept when chunk deletion fails"""
+        self.mock_document_model.list_deleted.return_value = ["12345"]
+        self.mock_embedding_model.delete_by_document.return_value = None
+
+        removed = self.reaper.run_once()
+
+        self.assertEqual(removed, 0)
+        self.mock_document_model.purge.assert_not_called()
+        mock_vacuum.assert_not_called()
+
+    @patch('services.reaper.vacuum_table', return_value=True)
+    def test_run_once_expires_upload_sessions(self, mock_vacuum):
+        """Test idle resumable uploads are expired on every pass"""
+        mock_upload_service = MagicMock()
+        self.reaper.upload_service = mock_upload_service
+        self.reaper.upload_session_ttl = 60
+        self.mock_document_model.list_deleted.return_value = []
+
+        self.reaper.run_once()
+
+        mock_upload_service.expire_sessions.assert_called_once_with(60)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,63 @@
+import gzip
+import json
+import unittest
+import uuid
+from datetime import datetime
+from decimal import Decimal
+import numpy as np
+from flask import Flask, jsonify, request
+from services.responses import FastJSONProvider, QUESTION_FIELDS, compress_response, parse_fields
+
+
+class TestResponses(unittest.TestCase):
+
+    def setUp(self):
+        self.app = Flask(__name__)
+        self.app.json = FastJSONProvider(self.app)
+
+        @self.app.route('/payload')
+        def payload():
+            return jsonify({'text': 'x' * int(request.args.get('size', 10))})
+
+        @self.app.after_request
+        def compress(response):
+            return compress_response(response, request.accept_encodings, min_size=100)
+
+        self.client = self.app.test_client()
+
+    def test_serializes_numpy_datetimes_and_uuids(self):
+        """Test types the default encoder rejects or renders as HTTP dates are serialized natively"""
+        doc_id = uuid.uuid4()
+        body = self.app.json.dumps({
+            'similarity': np.float32(0.5), 'count': np.int64(3), 'vector': np.arange(2, dtype=np.float32),
+            'date_added': datetime(2024, 5, 1, 12, 30), 'doc_id': doc_id, 'size': Decimal('1.5')
+        })
+        self.assertEqual(json.loads(body), {
+            'similarity': 0.5, 'count': 3, 'vector': [0.0, 1.0], 'date_added': '2024-05-01T12:30:00',
+            'doc_id': str(doc_id), 'size': 1.5
+        })
+
+    def test_parse_fields(self):
+        """Test field selections are parsed from strings or lists and validated"""
+        self.assertEqual(parse_fields('answer, sources', QUESTION_FIELDS), ['answer', 'sources'])
+        self.assertEqual(parse_fields(['answer'], QUESTION_FIELDS), ['answer'])
+        self.assertIsNone(parse_fields(None, QUESTION_FIELDS))
+        with self.assertRaises(ValueError):
+            parse_fields('answer,score', QUESTION_FIELDS)
+
+    def test_compression_negotiated(self):
+        """Test large bodies are compressed when accepted, small ones and refusals are not"""
+        response = self.client.get('/payload?size=5000', headers={'Accept-Encoding': 'gzip, deflate'})
+        self.assertEqual(response.headers['Content-Encoding'], 'gzip')
+        self.assertEqual(len(json.loads(gzip.decompress(response.data))['text']), 5000)
+
+        response = self.client.get('/payload?size=10', headers={'Accept-Encoding': 'gzip'})
+        self.assertNotIn('Content-Encoding', response.headers)
+
+        response = self.client.get('/payload?size=5000', headers={'Accept-Encoding': 'gzip;q=0'})
+        self.assertNotIn('Content-Encoding', response.headers)
+        self.assertIn('Accept-Encoding', response.headers['Vary'])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,110 @@
+import unittest
+import shutil
+import tempfile
+from unittest.mock import MagicMock
+import numpy as np
+from services.shard_search import ShardedSearchEngine, ShardSearchClient
+
+
+class TestShardedSearchEngine(unittest.TestCase):
+
+    @classmethod
+    def setUpClass(cls):
+        rng = np.random.default_rng(0)
+        cls.vectors = rng.normal(size=(20, 4)).astype(np.float32)
+        cls.version = {'version': 1, 'dimension': 4, 'column_name': 'embedding'}
+        cls.mock_embedding_model = MagicMock()
+        cls.mock_embedding_model.active_version.return_value = cls.version
+        # Four documents with five chunks each, grouped by document like iter_embedding_blocks
+        cls.mock_embedding_model.iter_embedding_blocks.side_effect = lambda version=None: iter([
+            ([f"chunk-{i}" for i in range(12)], [f"doc-{i // 5}" for i in range(12)], cls.vectors[:12]),
+            ([f"chunk-{i}" for i in range(12, 20)], [f"doc-{i // 5}" for i in range(12, 20)], cls.vectors[12:]),
+        ])
+
+        cls.socket_dir = tempfile.mkdtemp()
+        cls.engine = ShardedSearchEngine(cls.mock_embedding_model, num_shards=3, socket_dir=cls.socket_dir,
+                                         authkey=b'test')
+        cls.engine.start()
+        cls.engine.load()
+
+    @classmethod
+    def tearDownClass(cls):
+        cls.engine.close()
+        shutil.rmtree(cls.socket_dir)
+
+    def setUp(self):
+        self.mock_embedding_model.reset_mock()
+        self.mock_embedding_model.hydrate.side_effect = lambda hits, check_live=False: [
+            {**hit, 'text_content': 'Test chunk', 'title': 'Test Doc'} for hit in hits
+        ]
+        self.client = ShardSearchClient(self.mock_embedding_model, self.socket_dir, num_shards=3, authkey=b'test')
+
+    def tearDown(self):
+        self.client.close()
+
+    def _exact(self, query, top_k, rows=None):
+        normalized = self.vectors / np.linalg.norm(self.vectors, axis=1, keepdims=True)
+        scores = normalized @ (query / np.linalg.norm(query))
+        order = [i for i in np.argsort(-scores) if rows is None or i in rows]
+        return [f"chunk-{i}" for i in order[:top_k]]
+
+    def test_search_matches_exact_scan(self):
+        """Test merged per-shard top-k equals a brute-force scan"""
+        query = self.vectors[3] + 0.1
+        versions, hits = self.client.search_ids(query, top_k=5)
+
+        self.assertEqual(versions, {1})
+        self.assertEqual([chunk_id for chunk_id, _, _ in hits], self._exact(query, 5))
+
+    def test_search_filtered_by_document(self):
+        """Test a document filter only returns that document's chunks, even across load blocks"""
+        query = self.vectors[0]
+        _, hits = self.client.search_ids(query, top_k=3, doc_id="doc-2")
+
+        self.assertEqual([chunk_id for chunk_id, _, _ in hits], self._exact(query, 3, rows=range(10, 15)))
+        self.assertTrue(all(doc_id == "doc-2" for _, doc_id, _ in hits))
+
+    def test_concurrent_queries_use_own_connections(self):
+        """Test queries in flight at the same time never share a shard connection"""
+        first = self.client._checkout(0)
+        second = self.client._checkout(0)
+        self.assertIsNot(first, second)
+        first.close()
+        second.close()
+
+    def test_search_similar_drops_deleted(self):
+        """Test hits whose chunks no longer hydrate (deleted documents) are skipped"""
+        self.mock_embedding_model.hydrate.side_effect = lambda hits, check_live=False: []
+
+        self.assertEqual(self.client.search_similar(self.vectors[0], top_k=3), [])
+        # Shards may be stale, so documents must be checked to still be live
+        self.assertTrue(self.mock_embedding_model.hydrate.call_args[1]['check_live'])
+
+    def test_search_similar_other_version_uses_database(self):
+        """Test queries for a version other than the loaded one fall back to the database"""
+        new_version = {'version': 2, 'dimension': 8, 'column_name': 'embedding_v2'}
+        query = np.ones(4, dtype=np.float32)
+        self.client.search_similar(query, top_k=3, version=new_version)
+
+        self.mock_embedding_model.search_similar.assert_called_once_with(query, 3, None, version=new_version, filters=None)
+        self.mock_embedding_model.hydrate.assert_not_called()
+
+    def test_search_similar_unreachable_uses_database(self):
+        """Test queries fall back to the database when no shards are running"""
+        client = ShardSearchClient(self.mock_embedding_model, tempfile.mkdtemp(), num_shards=3, authkey=b'test')
+        query = np.ones(4, dtype=np.float32)
+        client.search_similar(query, top_k=3, version=self.version)
+
+        self.mock_embedding_model.search_similar.assert_called_once_with(query, 3, None, version=self.version, filters=None)
+
+    def test_empty_authkey_rejected(self):
+        """Test the engine and its clients refuse to run without a shared secret"""
+        with self.assertRaises(ValueError):
+            ShardSearchClient(self.mock_embedding_model, self.socket_dir, num_shards=3, authkey=b'')
+        with self.assertRaises(ValueError):
+            ShardedSearchEngine(self.mock_embedding_model, num_shards=3, socket_dir=self.socket_dir)
+
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,102 @@
+import unittest
+import os
+import struct
+import tempfile
+import shutil
+import uuid
+from datetime import datetime
+import numpy as np
+from services.snapshot import (SnapshotWriter, SnapshotReader, copy_chunks_data, copy_documents_data,
+                               _chunk_columns, _document_columns, COPY_HEADER, ALIGNMENT)
+
+
+class TestSnapshotFormat(unittest.TestCase):
+
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.path = os.path.join(self.directory, 'corpus.snap')
+        self.embeddings = np.arange(12, dtype=np.float32).reshape(3, 4)
+        self.chunks = {
+            'chunk_id': np.frombuffer(b"".join(uuid.uuid4().bytes for _ in range(3)), dtype=np.uint8).reshape(3, 16),
+            'doc_id': np.zeros((3, 16), dtype=np.uint8),
+            'chunk_index': np.array([0, 1, 2], dtype='<i4'),
+            'text_content': ["première", "", "tab\tand\nnewline"],
+            'embedding': self.embeddings,
+        }
+
+    def tearDown(self):
+        shutil.rmtree(self.directory)
+
+    def test_round_trip_maps_embeddings(self):
+        """Test columns round-trip and embeddings are aligned, read-only views of the file"""
+        writer = SnapshotWriter(self.path, {'model_name': 'test-model', 'dimension': 4})
+        writer.write_group('chunks', self.chunks)
+        writer.write_group('chunks', {name: values[:1] for name, values in self.chunks.items()})
+        writer.close()
+
+        with SnapshotReader(self.path) as reader:
+            self.assertEqual(reader.manifest['model_name'], 'test-model')
+            self.assertEqual(reader.rows('chunks'), 4)
+            first, second = list(reader.groups('chunks'))
+            self.assertEqual(first['text_content'], self.chunks['text_content'])
+            np.testing.assert_array_equal(first['embedding'], self.embeddings)
+            np.testing.assert_array_equal(first['chunk_id'], self.chunks['chunk_id'])
+            self.assertFalse(first['embedding'].flags.writeable)
+            self.assertEqual(reader.manifest['tables']['chunks'][0]['columns']['embedding']['offset'] % ALIGNMENT, 0)
+            self.assertEqual(second['text_content'], ["première"])
+            del first, second
+
+    def test_rejects_other_files(self):
+        """Test files without the snapshot markers are refused"""
+        with open(self.path, 'wb') as f:
+            f.write(b"%PDF-1.4" + b"\0" * 32)
+
+        with self.assertRaises(ValueError):
+            SnapshotReader(self.path)
+
+    def test_chunk_columns_from_embedding_blocks(self):
+        """Test chunk groups pair embedding blocks with text rows read in the same order"""
+        chunk_ids = [str(uuid.uuid4()) for _ in range(3)]
+        doc_ids = [str(uuid.uuid4())] * 3
+        rows = [(uuid.UUID(chunk_id), i, f"text {i}") for i, chunk_id in enumerate(chunk_ids)]
+
+        columns = _chunk_columns(chunk_ids, doc_ids, self.embeddings, rows)
+
+        self.assertEqual(uuid.UUID(bytes=columns['chunk_id'][2].tobytes()), uuid.UUID(chunk_ids[2]))
+        self.assertEqual(columns['text_content'], ["text 0", "text 1", "text 2"])
+        np.testing.assert_array_equal(columns['embedding'], self.embeddings)
+        with self.assertRaises(ValueError):
+            _chunk_columns(chunk_ids, doc_ids, self.embeddings, rows[::-1])
+
+    def test_copy_chunks_binary_rows(self):
+        """Test chunks are encoded as binary COPY rows with pgvector's binary vector format"""
+        data = copy_chunks_data(self.chunks)
+
+        self.assertTrue(data.startswith(COPY_HEADER))
+        self.assertTrue(data.endswith(struct.pack(">h", -1)))
+        position = len(COPY_HEADER)
+        fields = []
+        (count,) = struct.unpack_from(">h", data, position)
+        position += 2
+        for _ in range(count):
+            (length,) = struct.unpack_from(">i", data, position)
+            fields.append(data[position + 4:position + 4 + length])
+            position += 4 + length
+        self.assertEqual(fields[0], self.chunks['chunk_id'][0].tobytes())
+        self.assertEqual(struct.unpack(">i", fields[2]), (0,))
+        self.assertEqual(fields[3].decode('utf-8'), "première")
+        self.assertEqual(struct.unpack(">hh4f", fields[4]), (4, 0, 0.0, 1.0, 2.0, 3.0))
+
+    def test_copy_documents_nulls(self):
+        """Test missing file paths and dates are sent as NULL and metadata as jsonb"""
+        doc_id = uuid.uuid4()
+        rows = [(str(doc_id), 'Doc', None, None, {'a': 1}), (str(doc_id), 'Dated', '/x.pdf', datetime(2000, 1, 1, 0, 0, 1), None)]
+
+        data = copy_documents_data(_document_columns(rows))
+
+        self.assertIn(struct.pack(">i", -1) * 2 + struct.pack(">i", 9) + b'\x01{"a": 1}', data)
+        self.assertIn(struct.pack(">i", 8) + struct.pack(">q", 1000000), data)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,116 @@
+import unittest
+import hashlib
+import os
+import shutil
+import tempfile
+from unittest.mock import MagicMock
+from io import BytesIO
+from werkzeug.exceptions import RequestEntityTooLarge
+from services.upload_service import UploadService
+
+
+class TestUploadService(unittest.TestCase):
+
+    def setUp(self):
+        self.upload_folder = tempfile.mkdtemp()
+        self.upload_service = UploadService(self.upload_folder, chunk_size=4)
+        self.content = b"%PDF-1.4 test content"
+
+    def tearDown(self):
+        shutil.rmtree(self.upload_folder)
+
+    def test_save_stream_unique_paths(self):
+        """Test same-named uploads are stored side by side and hashed"""
+        first = self.upload_service.save_stream(BytesIO(self.content), "manual-testing.pdf")
+        second = self.upload_service.save_stream(BytesIO(self.content), "manual-testing.pdf")
+
+        self.assertNotEqual(first[0], second[0])
+        self.assertTrue(first[0].endswith("manual-testing.pdf"))
+        self.assertEqual(first[1], hashlib.sha256(self.content).hexdigest())
+        self.assertEqual(first[2], len(self.content))
+        with open(first[0], 'rb') as f:
+            self.assertEqual(f.read(), self.content)
+
+    def test_resumable_upload(self):
+        """Test chunks are appended at the expected offset and checksum verified"""
+        upload_id = self.upload_service.create_session("manual-testing.pdf", len(self.content))
+
+        offset = self.upload_service.append_chunk(upload_id, 0, BytesIO(self.content[:10]))
+        self.assertEqual(offset, 10)
+
+        # Replaying a chunk at a stale offset is rejected
+        self.assertIsNone(self.upload_service.append_chunk(upload_id, 0, BytesIO(self.content[:10])))
+        self.assertEqual(self.upload_service.get_session(upload_id)['offset'], 10)
+
+        # Completing before all bytes arrived fails
+        self.assertIsNone(self.upload_service.complete_session(upload_id))
+
+        self.upload_service.append_chunk(upload_id, 10, BytesIO(self.content[10:]))
+        saved = self.upload_service.complete_session(
+            upload_id, hashlib.sha256(self.content).hexdigest()
+        )
+
+        self.assertIsNotNone(saved)
+        self.assertEqual(saved[2], len(self.content))
+        self.assertIsNone(self.upload_service.get_session(upload_id))
+
+    def test_complete_checksum_mismatch(self):
+        """Test a checksum mismatch keeps the session for a retry"""
+        upload_id = self.upload_service.create_session("manual-testing.pdf")
+        self.upload_service.append_chunk(upload_id, 0, BytesIO(self.content))
+
+        self.assertIsNone(self.upload_service.complete_session(upload_id, "0" * 64))
+        self.assertIsNotNone(self.upload_service.get_session(upload_id))
+
+    def test_append_rejects_bytes_past_total_size(self):
+        """Test a chunk running past the declared size is refused and not kept"""
+        upload_id = self.upload_service.create_session("manual-testing.pdf", 10)
+
+        with self.assertRaises(RequestEntityTooLarge):
+            self.upload_service.append_chunk(upload_id, 0, BytesIO(self.content))
+        self.assertEqual(self.upload_service.get_session(upload_id)['offset'], 0)
+        self.assertEqual(self.upload_service.append_chunk(upload_id, 0, BytesIO(self.content[:10])), 10)
+
+    def test_append_without_total_size_capped_at_max_size(self):
+        """Test sessions without a declared size cannot grow past max_size"""
+        upload_service = UploadService(self.upload_folder, chunk_size=4, max_size=12)
+        upload_id = upload_service.create_session("manual-testing.pdf")
+
+        self.assertEqual(upload_service.append_chunk(upload_id, 0, BytesIO(self.content[:10])), 10)
+        with self.assertRaises(RequestEntityTooLarge):
+            upload_service.append_chunk(upload_id, 10, BytesIO(self.content[10:20]))
+        self.assertEqual(upload_service.get_session(upload_id)['offset'], 10)
+
+    def test_append_rejected_while_session_locked(self):
+        """Test a concurrent append to the same session is rejected"""
+        upload_id = self.upload_service.create_session("manual-testing.pdf")
+        _, part_path = self.upload_service._session_paths(upload_id)
+
+        with open(part_path, 'ab') as f:
+            self.assertTrue(UploadService._lock(f))
+            self.assertIsNone(self.upload_service.append_chunk(upload_id, 0, BytesIO(self.content)))
+        self.assertEqual(self.upload_service.append_chunk(upload_id, 0, BytesIO(self.content)), len(self.content))
+
+    def test_save_stream_reraises_too_large(self):
+        """Test an oversized body surfaces as 413 and leaves no partial file"""
+        stream = MagicMock()
+        stream.read.side_effect = RequestEntityTooLarge()
+
+        with self.assertRaises(RequestEntityTooLarge):
+            self.upload_service.save_stream(stream, "manual-testing.pdf")
+        self.assertEqual([name for name in os.listdir(self.upload_folder) if name != '.sessions'], [])
+
+    def test_expire_sessions(self):
+        """Test only sessions idle longer than the TTL are removed"""
+        stale = self.upload_service.create_session("stale.pdf")
+        fresh = self.upload_service.create_session("fresh.pdf")
+        _, stale_part = self.upload_service._session_paths(stale)
+        os.utime(stale_part, (0, 0))
+
+        self.assertEqual(self.upload_service.expire_sessions(3600), 1)
+        self.assertIsNone(self.upload_service.get_session(stale))
+        self.assertIsNotNone(self.upload_service.get_session(fresh))
+
+
+if __name__ == '__main__':
+    unittest.main()
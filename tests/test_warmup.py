@@ -0,0 +1,53 @@
+import unittest
+from unittest.mock import MagicMock
+import numpy as np
+from services.warmup import Warmup
+
+
+class TestWarmup(unittest.TestCase):
+
+    def setUp(self):
+        self.qa_service = MagicMock()
+        self.qa_service.chunk_size = 250
+        self.encoder = self.qa_service._encoder_for.return_value
+        self.encoder.encode.side_effect = lambda texts: np.zeros((len(texts), 4), dtype=np.float32)
+        self.qa_service.retrieve_context.return_value = ("context", [{'id': '1'}])
+        self.embedding_model = MagicMock()
+        self.embedding_model.prewarm.return_value = {'method': 'pg_prewarm', 'relations': {'chunks': 10}}
+
+    def test_run_times_every_step(self):
+        """Test a successful warmup encodes each batch size, answers, searches and prewarms"""
+        warmup = Warmup(self.qa_service, self.embedding_model, batch_sizes=[1, 8])
+
+        self.assertTrue(warmup.run())
+
+        self.assertTrue(warmup.ready)
+        steps = warmup.status()['steps']
+        self.assertEqual([step['name'] for step in steps], ['encode_batch_1', 'encode_batch_8', 'qa', 'search', 'prewarm'])
+        self.assertTrue(all(step['ok'] and step['duration_ms'] >= 0 for step in steps))
+        batches = [len(call[0][0]) for call in self.encoder.encode.call_args_list]
+        self.assertEqual(batches, [1, 8])
+        self.assertEqual(len(self.encoder.encode.call_args_list[0][0][0][0]), 250)
+
+    def test_failed_prewarm_does_not_block_readiness(self):
+        """Test prewarm is best effort"""
+        self.embedding_model.prewarm.return_value = None
+        warmup = Warmup(self.qa_service, self.embedding_model, batch_sizes=[1])
+
+        self.assertTrue(warmup.run())
+        self.assertFalse(warmup.status()['steps'][-1]['ok'])
+
+    def test_failed_model_pass_keeps_not_ready(self):
+        """Test the app stays unready while the models cannot be run"""
+        self.qa_service.qa_pipeline.side_effect = ConnectionRefusedError("inference pool not up")
+        warmup = Warmup(self.qa_service, self.embedding_model, batch_sizes=[1], prewarm=False)
+
+        self.assertFalse(warmup.run())
+
+        status = warmup.status()
+        self.assertEqual(status['state'], 'failed')
+        self.assertIn('inference pool not up', status['steps'][1]['error'])
+
+
+if __name__ == '__main__':
+    unittest.main()